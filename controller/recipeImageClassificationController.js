@@ -3,16 +3,14 @@
 // IT IS CALLED BEST_MODEL_CLASS.HDF5
 
 const { spawn } = require("child_process");
+const crypto = require("crypto");
 const fs = require("fs");
 const path = require("path");
 const { promisify } = require("util");
 
 // Convert fs callbacks to promises
 const readFileAsync = promisify(fs.readFile);
-const writeFileAsync = promisify(fs.writeFile);
 const unlinkAsync = promisify(fs.unlink);
-const mkdirAsync = promisify(fs.mkdir);
-const existsAsync = promisify(fs.exists);
 
 const predictRecipeImage = async (req, res) => {
     try {
@@ -36,27 +34,6 @@ const predictRecipeImage = async (req, res) => {
         }
         
         const originalFilename = originalName.toLowerCase();
-        
-        try {
-            if (!await existsAsync('uploads')) {
-                await mkdirAsync('uploads', { recursive: true });
-                console.log("Created uploads directory");
-            }
-        } catch (err) {
-            console.error("Error creating uploads directory:", err);
-        }
-
-        const namedImagePath = `uploads/${originalFilename}`;
-        
-        try {
-            await fs.promises.copyFile(imagePath, namedImagePath);
-            console.log(`Copied temporary file to ${namedImagePath}`);
-            
-            await writeFileAsync('uploads/original_filename.txt', originalFilename);
-        } catch (err) {
-            console.error("Error preparing image file:", err);
-            // Continue anyway
-        }
 
         return new Promise((resolve, reject) => {
             const scriptPath = './model/recipeImageClassification.py';
@@ -68,8 +45,16 @@ const predictRecipeImage = async (req, res) => {
                 return resolve();
             }
             
-            console.log(`Running Python script: ${scriptPath}`);
-            const pythonProcess = spawn('python', [scriptPath], { encoding: 'utf-8' });
+            // Tags every line this run writes to python_debug.log
+            const requestId = crypto.randomUUID();
+            console.log(`Running Python script: ${scriptPath} (request ${requestId})`);
+            // Each run gets its own upload path and original name, so concurrent requests never share files
+            // Joined with '=' so a name starting with '-' is not read as an option
+            const args = [scriptPath, imagePath, `--original-filename=${originalFilename}`];
+            const pythonProcess = spawn('python', args, {
+                encoding: 'utf-8',
+                env: { ...process.env, NUTRIHELP_REQUEST_ID: requestId }
+            });
 
             let output = '';
             let errorOutput = '';
@@ -118,7 +103,7 @@ const predictRecipeImage = async (req, res) => {
                     } else if (errorOutput.includes("No file uploaded") || errorOutput.includes("Cannot open image file")) {
                         res.status(400).json({ error: "Unable to process the uploaded image" });
                     } else {
-                        console.error("Python script exited with error code:", code);
+                        console.error(`Python script exited with error code ${code} (request ${requestId})`);
                         console.error("Error output:", errorOutput);
                         res.status(500).json({ error: "Internal server error during image classification" });
                     }
@@ -0,0 +1,255 @@
+"""
+Nearest-neighbour index of labelled image embeddings.
+
+The recipe cascade model's penultimate layer maps an image to an embedding; a
+handful of embedded example photos of a dish is enough for a k-nearest-
+neighbour vote to recognise it, so a new dish is an append to this index
+rather than a retraining job. Embeddings are L2-normalized and compared by
+cosine similarity.
+
+Two search modes:
+  flat    brute force, one float32 matrix multiply against every example
+  ivfpq   inverted file with product quantization for large galleries: the
+          examples are clustered into lists, a query only visits the lists
+          whose centroids are closest, and each example's residual from its
+          list centroid is approximated by one byte per subvector, so a
+          candidate is scored from a small lookup table instead of its vector
+
+The raw vectors are kept in both modes so the quantizer can be retrained as
+the gallery grows. The index is saved as one .npz, along with a digest of the
+model file the embeddings came from so embeddings of a different model are
+never mixed in.
+
+Usage: python model/embeddingIndex.py info <index.npz>
+"""
+
+import os
+import sys
+import hashlib
+
+import numpy as np
+
+MODES = ('flat', 'ivfpq')
+PQ_CENTROIDS = 256
+# The quantizer is trained on at most this many examples; the rest are only encoded
+TRAINING_SAMPLE = 64 * PQ_CENTROIDS
+
+
+def model_digest(path):
+    """SHA-256 hex digest of a model file, identifying the embedding space."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def kmeans(vectors, k, iterations=20, seed=0):
+    """(centroids, assignments) of Lloyd's k-means; empty clusters keep their previous centroid."""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = nearest(vectors, centroids)
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.stack([np.bincount(assignments, weights=column, minlength=k) for column in vectors.T], axis=1)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids, nearest(vectors, centroids)
+
+
+def nearest(vectors, centroids):
+    """Index of the Euclidean-nearest centroid for each vector."""
+    # |v - c|^2 = |v|^2 - 2 v.c + |c|^2, and |v|^2 is the same for every centroid
+    return np.argmin((centroids ** 2).sum(axis=1) - 2.0 * vectors @ centroids.T, axis=1)
+
+
+class EmbeddingIndex:
+    """Labelled unit vectors searched by cosine similarity."""
+
+    def __init__(self, dimension, model=''):
+        self.dimension = dimension
+        self.model = model
+        self.vectors = np.zeros((0, dimension), dtype=np.float32)
+        self.labels = np.zeros(0, dtype=str)
+        self.mode = 'flat'
+        # IVF-PQ state, set by train_ivfpq()
+        self.list_centroids = None
+        self.codebooks = None
+        self.assignments = None
+        self.codes = None
+        self._list_rows = None
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @property
+    def classes(self):
+        return sorted(set(self.labels.tolist()))
+
+    def add(self, vectors, labels):
+        """Append embeddings with their labels; in ivfpq mode they are encoded with the trained quantizer."""
+        vectors = normalize(vectors)
+        if vectors.shape[1] != self.dimension:
+            raise ValueError(f"Embeddings have {vectors.shape[1]} dimensions, the index {self.dimension}")
+        if len(labels) != len(vectors):
+            raise ValueError("Need one label per embedding")
+        self.vectors = np.concatenate([self.vectors, vectors])
+        self.labels = np.concatenate([self.labels, np.asarray(labels, dtype=str)])
+        if self.mode == 'ivfpq':
+            assignments, codes = self._encode(vectors)
+            self.assignments = np.concatenate([self.assignments, assignments])
+            self.codes = np.concatenate([self.codes, codes])
+            self._list_rows = None
+
+    def train_ivfpq(self, lists, subvectors, iterations=20, seed=0):
+        """Switch to ivfpq mode, clustering the current vectors into lists and training the quantizer."""
+        if self.dimension % subvectors:
+            raise ValueError(f"{subvectors} subvectors do not divide {self.dimension} dimensions")
+        if not len(self.vectors):
+            raise ValueError("Cannot train the quantizer of an empty index")
+        sample = self.vectors
+        if len(sample) > TRAINING_SAMPLE:
+            sample = sample[np.random.default_rng(seed).choice(len(sample), TRAINING_SAMPLE, replace=False)]
+        self.list_centroids, assignments = kmeans(sample, lists, iterations, seed)
+        residuals = (sample - self.list_centroids[assignments]).reshape(len(sample), subvectors, -1)
+        codebooks = []
+        for m in range(subvectors):
+            centroids = kmeans(residuals[:, m], PQ_CENTROIDS, iterations, seed + m)[0]
+            # With fewer examples than codes, pad with copies so every subspace has PQ_CENTROIDS rows
+            padding = np.repeat(centroids[:1], PQ_CENTROIDS - len(centroids), axis=0)
+            codebooks.append(np.concatenate([centroids, padding]))
+        self.codebooks = np.stack(codebooks)
+        self.mode = 'ivfpq'
+        self.assignments, self.codes = self._encode(self.vectors)
+        self._list_rows = None
+
+    def _encode(self, vectors):
+        assignments = nearest(vectors, self.list_centroids)
+        residuals = (vectors - self.list_centroids[assignments]).reshape(len(vectors), len(self.codebooks), -1)
+        codes = np.stack([nearest(residuals[:, m], self.codebooks[m]) for m in range(len(self.codebooks))], axis=1)
+        return assignments.astype(np.int32), codes.astype(np.uint8)
+
+    def _rows_in(self, lists):
+        # Inverted file: rows sorted by list, with each list's bounds, built on first search
+        if self._list_rows is None:
+            order = np.argsort(self.assignments, kind='stable')
+            bounds = np.searchsorted(self.assignments[order], np.arange(len(self.list_centroids) + 1))
+            self._list_rows = (order, bounds)
+        order, bounds = self._list_rows
+        return np.concatenate([order[bounds[l]:bounds[l + 1]] for l in lists])
+
+    def search(self, queries, k=5, probes=4):
+        """(similarities, labels), both (N, k) best first, for N query embeddings.
+
+        Rows with fewer than k examples in reach are padded with similarity -inf
+        and an empty label. probes is the number of lists visited in ivfpq mode.
+        """
+        queries = normalize(queries)
+        similarities = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        labels = np.full((len(queries), k), '', dtype=self.labels.dtype if len(self.labels) else 'U1')
+        if not len(self.vectors):
+            return similarities, labels
+
+        if self.mode == 'flat':
+            scores = queries @ self.vectors.T
+            count = min(k, len(self.vectors))
+            best = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+            best = np.take_along_axis(best, np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1), axis=1)
+            similarities[:, :count] = np.take_along_axis(scores, best, axis=1)
+            labels[:, :count] = self.labels[best]
+            return similarities, labels
+
+        list_scores = queries @ self.list_centroids.T
+        subqueries = queries.reshape(len(queries), len(self.codebooks), -1)
+        for row, query in enumerate(subqueries):
+            visited = np.argsort(-list_scores[row])[:probes]
+            candidates = self._rows_in(visited)
+            # Inner product with centroid + residual: q.c from the list score, q.r from the lookup table
+            table = np.einsum('md,mkd->mk', query, self.codebooks)
+            score = (list_scores[row, self.assignments[candidates]]
+                     + table[np.arange(len(self.codebooks)), self.codes[candidates]].sum(axis=1))
+            self._top_k(score, candidates, k, similarities[row], labels[row])
+        return similarities, labels
+
+    def _top_k(self, scores, rows, k, similarities_out, labels_out):
+        count = min(k, len(scores))
+        if not count:
+            return
+        best = np.argpartition(-scores, count - 1)[:count]
+        best = best[np.argsort(-scores[best])]
+        similarities_out[:count] = scores[best]
+        labels_out[:count] = self.labels[rows[best]]
+
+    def vote(self, queries, k=5, probes=4, temperature=0.07):
+        """Per-query {label: share} of a k-NN vote; empty when no neighbour has positive similarity.
+
+        Each neighbour counts exp(similarity / temperature), so the closest
+        examples dominate even when every similarity is high.
+        """
+        similarities, labels = self.search(queries, k, probes)
+        votes = []
+        for similarity_row, label_row in zip(similarities, labels):
+            reachable = (similarity_row > 0) & (label_row != '')
+            if not reachable.any():
+                votes.append({})
+                continue
+            # Relative to the best similarity, so the exponent never overflows
+            similarity = similarity_row[reachable].astype(np.float64)
+            weights = np.exp((similarity - similarity.max()) / temperature)
+            shares = {}
+            for label, weight in zip(label_row[reachable], weights / weights.sum()):
+                shares[str(label)] = shares.get(str(label), 0.0) + float(weight)
+            votes.append(shares)
+        return votes
+
+    def save(self, path):
+        arrays = {'vectors': self.vectors, 'labels': self.labels, 'model': self.model, 'mode': self.mode}
+        if self.mode == 'ivfpq':
+            arrays.update(list_centroids=self.list_centroids, codebooks=self.codebooks,
+                          assignments=self.assignments, codes=self.codes)
+        # Written beside the target and renamed, so a classifier never loads half an index
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(data['vectors'].shape[1], str(data['model']))
+            index.vectors = data['vectors'].astype(np.float32)
+            index.labels = data['labels']
+            index.mode = str(data['mode'])
+            if index.mode == 'ivfpq':
+                index.list_centroids = data['list_centroids']
+                index.codebooks = data['codebooks']
+                index.assignments = data['assignments']
+                index.codes = data['codes']
+        if index.mode not in MODES:
+            raise ValueError(f"Unknown index mode {index.mode!r}")
+        return index
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2 or argv[0] != 'info':
+        print("Usage: python model/embeddingIndex.py info <index.npz>")
+        sys.exit(1)
+
+    index = EmbeddingIndex.load(argv[1])
+    print(f"{argv[1]}: {len(index)} {index.dimension}-d embeddings, {index.mode} search, model {index.model[:12]}")
+    if index.mode == 'ivfpq':
+        print(f"  {len(index.list_centroids)} lists, {len(index.codebooks)} subvectors of one byte each")
+    for label in index.classes:
+        print(f"  {label:<26}{int((index.labels == label).sum()):>6} examples")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,54 @@
 #!/usr/bin/env python3.10
 
+"""
+Fruit and vegetable classifier.
+
+One-shot mode (default) reads a single image from stdin and prints
+"<class index> <calorie line>". With --serve the model is loaded once and
+requests are read from stdin using the framing in inferenceProtocol.py;
+concurrent requests are grouped into batches by inferenceBatcher.MicroBatcher.
+With --batch a whole directory or manifest is classified through a tf.data
+pipeline and results are streamed as JSON Lines.
+
+With --metrics (or NUTRIHELP_METRICS=1) per-stage timings are printed as a
+JSON trailer on stderr; --serve also answers a "metrics" op with Prometheus
+text. See inferenceMetrics.py.
+
+Under --serve the model file is watched and a replaced file is loaded, warmed
+up and swapped in without a restart; with --shadow-fraction it is first run
+as a candidate on a sample of traffic. The "models", "reload", "promote" and
+"reject" ops manage it. See modelRegistry.py.
+"""
+
 import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 
 import sys
-import matplotlib.pyplot as plt
-import pandas as pd
-import seaborn as sn
+import glob
+import json
+import time
+import sqlite3
+import argparse
+import threading
+import traceback
 import numpy as np
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
-from tensorflow.keras.applications import VGG19, VGG16
-from tensorflow.keras.layers import AveragePooling2D, Conv2D, MaxPooling2D, Dropout, Dense, Input, Flatten
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.utils import load_img, img_to_array
-from sklearn.metrics import confusion_matrix
-from sklearn.model_selection import train_test_split
-
-from tensorflow.keras.models import load_model
-from PIL import Image
-import io
+
+import imagePreprocessing
+import inferenceProtocol
+import threadingProfile
+from inferenceBatcher import MicroBatcher
+from inferenceMetrics import NULL_TIMER, MetricsRegistry, StageTimer, metrics_enabled_from_env
+from modelRegistry import ModelRegistry
+from modelRuntime import RUNTIMES, VARIANTS, load_runtime, resolve_model_path
+from predictionCache import PredictionCache, content_key
+from workerPool import POOL_RUNTIMES, WorkerPool
 
 # Get the relative path to the model file
 model_path = os.path.join('model', 'modeltt.h5')
 
-try:
-    # Load the pre-trained model
-    model = load_model(model_path)
-except Exception as e:
-    print("Error loading model:", e)
-    sys.exit(1)
+INPUT_SHAPE = (224, 224, 3)
 
-from tensorflow.keras.preprocessing.image import load_img, img_to_array
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
 
 cal_values = """Apple Braeburn:~52 calories per 100 grams
 Apple Crimson Snow:~52 calories per 100 grams
@@ -166,23 +184,365 @@ Watermelon:~30 calories per 100 grams"""
 
 calories = cal_values.splitlines()
 
-# Read image data from stdin
-image_data = sys.stdin.buffer.read()
 
-# Load image using PIL
-image = Image.open(io.BytesIO(image_data))
+def prepare_image(image_data, out=None, timer=NULL_TIMER):
+    """Decode raw image bytes into a normalised (224, 224, 3) float32 array."""
+    with timer.stage('decode'):
+        image = imagePreprocessing.open_image(image_data)
+        image.load()
+    with timer.stage('resize'):
+        return imagePreprocessing.to_input_array(image, out=out)
+
+
+def classify(runtime, image_data, input_buffer=None, timer=NULL_TIMER):
+    """Return (class index, calorie line, probabilities) for one image."""
+    if input_buffer is None:
+        input_buffer = np.empty((1,) + INPUT_SHAPE, dtype=np.float32)
+    prepare_image(image_data, out=input_buffer[0], timer=timer)
+
+    with timer.stage('predict'):
+        probabilities = runtime.predict(input_buffer)[0]
+    with timer.stage('postprocess'):
+        prediction_result = int(probabilities.argmax())
+        calorie_line = calories[prediction_result]
+    return prediction_result, calorie_line, probabilities
+
+
+def _prediction_callback(respond, request_id, cache=None, cache_key=None, registry=None, models=None):
+    def callback(probabilities, error):
+        if error is not None:
+            if registry is not None:
+                registry.inc('requests', status='error')
+            respond({'id': request_id, 'error': str(error)})
+            return
+        index = int(probabilities.argmax())
+        if cache is not None:
+            # Callbacks run on the thread that ran the batch, so this is the version that answered;
+            # a batch that straddled a swap is not cached under the new model
+            model = models.last_model() if models is not None else None
+            cache.put(cache_key, index, calories[index], probabilities,
+                      fingerprint=model.fingerprint if model is not None else None)
+        if registry is not None:
+            registry.inc('requests', status='ok')
+        respond({'id': request_id, 'index': index, 'prediction': calories[index]})
+    return callback
+
+
+def _batch_observer(registry):
+    def observe(batch_size, queue_wait, predict_seconds):
+        registry.observe_batch(batch_size)
+        registry.observe('queue_wait', queue_wait)
+        registry.observe('predict', predict_seconds)
+    return observe
+
+
+def serve(runtime, requests_in, responses_out, max_batch_size=8, max_wait_ms=5.0, flush_threads=1,
+          cache=None, registry=None, timer=NULL_TIMER):
+    """Answer framed requests until stdin is closed, batching concurrent predictions.
+
+    runtime may be a ModelRegistry, which adds the model management ops.
+    Request counters always go to registry; stage histograms only when timer is enabled.
+    """
+    models = runtime if isinstance(runtime, ModelRegistry) else None
+    write_lock = threading.Lock()
+    if registry is None:
+        registry = MetricsRegistry('fruit')
+
+    def respond(payload):
+        with write_lock:
+            inferenceProtocol.write_response(responses_out, payload)
+
+    observer = _batch_observer(registry) if timer.enabled else None
+    batcher = MicroBatcher(runtime.predict, max_batch_size, max_wait_ms, flush_threads, observer)
+    batcher.start()
+    try:
+        while True:
+            request = inferenceProtocol.read_request(requests_in)
+            if request is None:
+                return
+            header, body = request
+            request_id = header.get('id')
+            op = header.get('op', 'predict')
+
+            try:
+                if op == 'predict':
+                    cache_key = content_key(body) if cache is not None else None
+                    cached = cache.get(cache_key) if cache is not None else None
+                    if cached is not None:
+                        registry.inc('requests', status='cached')
+                        respond({'id': request_id, 'index': cached.index, 'prediction': cached.label})
+                        continue
+                    batcher.submit(prepare_image(body, timer=timer),
+                                   _prediction_callback(respond, request_id, cache, cache_key, registry, models))
+                elif op == 'stats':
+                    respond({'id': request_id, 'batcher': batcher.stats(),
+                             'cache': cache.stats() if cache is not None else None,
+                             'models': models.status() if models is not None else None})
+                elif op in ('models', 'reload', 'promote', 'reject'):
+                    if models is None:
+                        raise ValueError(f"Op {op} needs the model registry")
+                    if op == 'reload':
+                        if not models.reload():
+                            raise ValueError("Reload already in progress")
+                        registry.inc('model_reloads')
+                    elif op == 'promote':
+                        models.promote()
+                    elif op == 'reject':
+                        models.reject()
+                    respond({'id': request_id, 'models': models.status()})
+                elif op == 'metrics':
+                    registry.set_gauge('queue_depth', batcher.stats()['queue_depth'])
+                    if cache is not None:
+                        registry.set_gauge('cache_entries', cache.stats()['entries'])
+                    respond({'id': request_id, 'prometheus': registry.render()})
+                else:
+                    raise ValueError(f"Unknown op: {op}")
+            except Exception as e:
+                traceback.print_exc()
+                registry.inc('requests', status='error')
+                respond({'id': request_id, 'error': str(e)})
+    finally:
+        batcher.stop()
+
+
+def list_batch_inputs(source):
+    """Image paths from a directory (recursive), a glob pattern or a manifest with one path per line."""
+    if not os.path.exists(source):
+        if not glob.has_magic(source):
+            raise FileNotFoundError(f"No such directory or manifest: {source}")
+        paths = sorted(path for path in glob.glob(source, recursive=True) if os.path.isfile(path))
+        if not paths:
+            raise FileNotFoundError(f"No files match {source}")
+        return paths
+
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(os.path.join(root, name) for name in files
+                         if name.lower().endswith(IMAGE_EXTENSIONS))
+        return sorted(paths)
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    paths = []
+    with open(source, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                paths.append(line if os.path.isabs(line) else os.path.join(base_dir, line))
+    return paths
+
+
+def _load_batch_item(path):
+    try:
+        return prepare_image(path.decode('utf-8')), b''
+    except Exception as e:
+        return np.zeros(INPUT_SHAPE, dtype=np.float32), str(e).encode('utf-8')
+
+
+def classify_batch(runtime, paths, output, batch_size=32, timer=NULL_TIMER):
+    """Classify every image path, writing one JSON line per image as batches finish."""
+    import tensorflow as tf
+
+    def load(path):
+        image, error = tf.numpy_function(_load_batch_item, [path], [tf.float32, tf.string])
+        image.set_shape(INPUT_SHAPE)
+        error.set_shape(())
+        return path, image, error
+
+    # Decoding goes through the same PIL path as online requests; PIL releases
+    # the GIL while decoding, so the parallel map still spreads across cores.
+    dataset = (tf.data.Dataset.from_tensor_slices(tf.constant(paths, dtype=tf.string))
+               .map(load, num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+               .batch(batch_size)
+               .prefetch(tf.data.AUTOTUNE))
+
+    start = time.perf_counter()
+    classified = failed = 0
+    for path_batch, images, errors in dataset.as_numpy_iterator():
+        with timer.stage('predict'):
+            probabilities = runtime.predict(images)
+        for path, row, error in zip(path_batch, probabilities, errors):
+            record = {'path': path.decode('utf-8')}
+            if error:
+                record['error'] = error.decode('utf-8')
+                failed += 1
+            else:
+                index = int(row.argmax())
+                record['index'] = index
+                record['prediction'] = calories[index]
+                classified += 1
+            output.write(json.dumps(record) + '\n')
+        output.flush()
+
+    elapsed = time.perf_counter() - start
+    rate = (classified + failed) / elapsed if elapsed else 0.0
+    sys.stderr.write(f"Classified {classified} images ({failed} failed) in {elapsed:.1f}s, {rate:.1f} images/s\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fruit and vegetable image classifier")
+    parser.add_argument('--model', default=model_path, help="Path to the Keras model file")
+    parser.add_argument('--runtime', choices=RUNTIMES, default='keras',
+                        help="Run the Keras model or its .tflite export (see tools/image_classification/export_tflite.py)")
+    parser.add_argument('--variant', choices=VARIANTS, default='fp32',
+                        help="Quantized TFLite variant to load (see tools/image_classification/quantize_model.py)")
+    parser.add_argument('--serve', action='store_true',
+                        help="Keep the model loaded and answer framed requests on stdin/stdout")
+    parser.add_argument('--max-batch-size', type=int, default=8,
+                        help="Largest batch the --serve scheduler will build")
+    parser.add_argument('--max-wait-ms', type=float, default=5.0,
+                        help="How long the oldest queued request may wait for a batch to fill")
+    parser.add_argument('--batch', metavar='DIR_OR_MANIFEST',
+                        help="Classify a directory, a quoted glob or a manifest of image paths and print JSON Lines")
+    parser.add_argument('--batch-size', type=int, default=32, help="Images per --batch prediction")
+    parser.add_argument('--output', help="Write --batch results to this file instead of stdout")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Serve from this many model processes sharing one memory-mapped model")
+    parser.add_argument('--pool-runtime', choices=POOL_RUNTIMES, default='tflite',
+                        help="What --workers processes run; only tflite workers share the weights (see workerPool.py)")
+    parser.add_argument('--cache-entries', type=int, default=1024,
+                        help="In-memory result cache size for --serve (0 disables it)")
+    parser.add_argument('--cache-mb', type=float, default=64, help="In-memory result cache limit in MB")
+    parser.add_argument('--cache-db', help="SQLite file for a persistent result cache shared between processes")
+    parser.add_argument('--watch-interval', type=float, default=2.0,
+                        help="Seconds between checks of the model file under --serve (0 reloads only on the reload op)")
+    parser.add_argument('--shadow-fraction', type=float, default=0.0,
+                        help="Run this share of batches on a replaced model before it takes over (0 swaps at once)")
+    parser.add_argument('--shadow-promote-after', type=int, default=0,
+                        help="Promote a shadowed model after this many images agree often enough (0: promote op only)")
+    parser.add_argument('--shadow-min-agreement', type=float, default=0.99,
+                        help="Top-1 agreement with the current model needed for automatic promotion")
+    parser.add_argument('--keep-versions', type=int, default=3,
+                        help="Model versions kept in the versions/ directory next to the model file")
+    parser.add_argument('--xla', action='store_true',
+                        help="Compile the Keras predict function with XLA (jit_compile=True)")
+    parser.add_argument('--threading-profile',
+                        default=os.environ.get('NUTRIHELP_THREADING_PROFILE', threadingProfile.DEFAULT_PROFILE_PATH),
+                        help="Thread pool profile written by tools/image_classification/tune_threading.py ('' to ignore)")
+    parser.add_argument('--metrics', action='store_true', default=metrics_enabled_from_env(),
+                        help="Time each stage and print a JSON trailer on stderr (also NUTRIHELP_METRICS=1)")
+    parser.add_argument('--metrics-file', default=os.environ.get('NUTRIHELP_METRICS_FILE'),
+                        help="Append the JSON trailer to this file instead of stderr")
+    args = parser.parse_args(argv)
+
+    registry = MetricsRegistry('fruit') if args.serve else None
+    timer = StageTimer(args.metrics, registry)
+
+    if args.serve:
+        # Reserve the real stdout for framed responses; stray prints go to stderr
+        responses_out = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+        sys.stdout = sys.stderr
+
+    try:
+        # Also writes a missing fp32 .tflite export
+        model_file = resolve_model_path(args.model, args.runtime, args.variant)
+    except Exception as e:
+        print("Error loading model:", e)
+        sys.exit(1)
+
+    cache = None
+    if (args.serve and args.cache_entries > 0) or args.cache_db:
+        try:
+            cache = PredictionCache(model_file, max_entries=args.cache_entries,
+                                    max_bytes=int(args.cache_mb * 1024 * 1024), db_path=args.cache_db)
+        except (OSError, sqlite3.Error) as e:
+            sys.stderr.write(f"Prediction cache disabled: {e}\n")
+
+    # Checked before the model loads, so a mistyped path fails fast
+    batch_paths = None
+    if args.batch:
+        try:
+            batch_paths = list_batch_inputs(args.batch)
+        except (OSError, UnicodeDecodeError) as e:
+            print("Error reading batch input:", e)
+            sys.exit(1)
+
+    image_data = None
+    if not args.serve and not args.batch:
+        # Read image data from stdin
+        image_data = sys.stdin.buffer.read()
+
+        # A persistent cache hit answers without importing TensorFlow at all
+        with timer.stage('cache_lookup'):
+            cached = cache.get(content_key(image_data)) if cache is not None else None
+        if cached is not None:
+            print(cached.index, cached.label)
+            timer.emit(args.metrics_file, classifier='fruit', mode='one-shot', cached=True)
+            return
+
+    # Pick the tuned thread pools for the load this process expects; oneDNN must be set before TF loads
+    if args.serve:
+        expected_batch = args.max_batch_size
+    else:
+        expected_batch = args.batch_size if args.batch else 1
+    try:
+        threading_config = threadingProfile.select_config(threadingProfile.load_profile(args.threading_profile),
+                                                          max(1, args.workers), expected_batch)
+    except (OSError, ValueError, KeyError) as e:
+        sys.stderr.write(f"Ignoring threading profile: {e}\n")
+        threading_config = None
+    threadingProfile.apply_env(threading_config)
+
+    try:
+        if timer.enabled and not (args.serve and args.workers > 0):
+            # Imported up front only so that import and model load are timed separately
+            with timer.stage('tf_import'):
+                import tensorflow  # noqa: F401
+
+        # Load the pre-trained model
+        if args.serve:
+            def loader(path):
+                if args.workers > 0:
+                    return WorkerPool(path, args.workers, threading_config, jit_compile=args.xla,
+                                      runtime=args.pool_runtime)
+                return load_runtime(path, threading_config=threading_config, jit_compile=args.xla)
+
+            # Loads and warms up (tracing the predict function) before the first request
+            with timer.stage('model_load'):
+                runtime = ModelRegistry(model_file, loader, sorted({1, args.max_batch_size}),
+                                        poll_interval=args.watch_interval, shadow_fraction=args.shadow_fraction,
+                                        promote_after=args.shadow_promote_after,
+                                        min_agreement=args.shadow_min_agreement, keep_versions=args.keep_versions,
+                                        on_swap=(lambda model: cache.set_model(model.path)) if cache else None)
+                runtime.start()
+        else:
+            with timer.stage('model_load'):
+                runtime = load_runtime(model_file, threading_config=threading_config, jit_compile=args.xla)
+
+        # Trace the predict function before the first batch; a one-shot run would only pay twice
+        if args.batch:
+            with timer.stage('warmup'):
+                runtime.warmup((args.batch_size,))
+    except Exception as e:
+        print("Error loading model:", e)
+        sys.exit(1)
+
+    if args.serve:
+        try:
+            serve(runtime, sys.stdin.buffer, responses_out, args.max_batch_size, args.max_wait_ms,
+                  flush_threads=max(1, args.workers), cache=cache, registry=registry, timer=timer)
+        finally:
+            runtime.stop()
+        return
 
-# Resize image to (224, 224)
-image = image.resize((224, 224))
+    if args.batch:
+        output = open(args.output, 'w') if args.output else sys.stdout
+        try:
+            classify_batch(runtime, batch_paths, output, args.batch_size, timer)
+        finally:
+            if args.output:
+                output.close()
+        timer.emit(args.metrics_file, classifier='fruit', mode='batch')
+        return
 
-# Convert image to numpy array
-image_array = np.array(image) / 255.0  # Normalize image data
+    prediction_result, calorie_line, probabilities = classify(runtime, image_data, timer=timer)
+    if cache is not None:
+        cache.put(content_key(image_data), prediction_result, calorie_line, probabilities)
 
-# Add batch dimension
-image_array = np.expand_dims(image_array, axis=0)
+    # Output prediction result
+    print(prediction_result, calorie_line)
+    timer.emit(args.metrics_file, classifier='fruit', mode='one-shot')
 
-# Perform prediction
-prediction_result = model.predict(image_array).argmax()
 
-# Output prediction result
-print(prediction_result, calories[prediction_result])
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Image decoding for the classifier inputs.
+
+Uploads are phone photos of 12 MP and more, while the models only need
+224x224. JPEGs are decoded at the smallest DCT scale that still covers the
+target size (``Image.draft``), other formats are box-reduced by an integer
+factor before the final resize, and pixels are written as float32 straight
+into a caller-supplied buffer instead of going through a float64 copy.
+
+ImageContext holds one upload for the recipe classifier's analyzers: the file
+is read and decoded once, and the thumbnails and model input are derived from
+that single decode.
+"""
+
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+INPUT_SIZE = (224, 224)
+
+# Checked against the header before any pixel data is allocated
+MAX_IMAGE_PIXELS = 40_000_000
+
+# Thumbnail size used by the recipe colour and texture analysis
+THUMBNAIL_SIZE = (100, 100)
+
+try:
+    BICUBIC = Image.Resampling.BICUBIC
+    LANCZOS = Image.Resampling.LANCZOS
+except AttributeError:
+    BICUBIC = Image.BICUBIC
+    LANCZOS = Image.LANCZOS
+
+_SIGNATURES = (b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n')
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an upload declares more pixels than MAX_IMAGE_PIXELS."""
+
+
+def open_image(source, target_size=INPUT_SIZE, max_pixels=MAX_IMAGE_PIXELS):
+    """Open bytes, a path or a file object as an RGB image no smaller than target_size.
+
+    Only the header is read before the pixel-count check; the decode itself
+    happens at a reduced scale when the format allows it.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    image = Image.open(source)
+
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageTooLargeError(f"Image is {width}x{height}, limit is {max_pixels} pixels")
+
+    if image.format == 'JPEG':
+        image.draft('RGB', target_size)
+
+    image = normalize_mode(image)
+
+    factor = min(image.width // target_size[0], image.height // target_size[1])
+    if factor >= 2:
+        image = image.reduce(factor)
+    return image
+
+
+def normalize_mode(image):
+    """Convert any PIL mode to RGB, flattening transparency onto white."""
+    if image.mode == 'RGB':
+        return image
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        rgba = image.convert('RGBA')
+        background = Image.new('RGBA', rgba.size, (255, 255, 255, 255))
+        return Image.alpha_composite(background, rgba).convert('RGB')
+    return image.convert('RGB')
+
+
+def to_input_array(image, out=None, target_size=INPUT_SIZE):
+    """Resize an RGB image and write its pixels, scaled to [0, 1], into a float32 buffer."""
+    if image.size != target_size:
+        image = image.resize(target_size, BICUBIC)
+    if out is None:
+        out = np.empty((target_size[1], target_size[0], 3), dtype=np.float32)
+    np.divide(np.asarray(image), np.float32(255.0), out=out, dtype=np.float32)
+    return out
+
+
+def decode_to_array(source, out=None, target_size=INPUT_SIZE, max_pixels=MAX_IMAGE_PIXELS):
+    """Decode an image straight into a (H, W, 3) float32 model input."""
+    return to_input_array(open_image(source, target_size, max_pixels), out, target_size)
+
+
+def has_image_signature(header):
+    """True for the JPEG and PNG magic bytes the upload routes accept."""
+    return bytes(header[:8]).startswith(_SIGNATURES)
+
+
+class ImageContext:
+    """One upload read and decoded once, with cached views derived from that decode.
+
+    The file is read eagerly but decoded on first use, so callers that can
+    answer from the file name never pay for a decode. JPEGs are decoded at the
+    smallest draft scale that still covers decode_size.
+    """
+
+    def __init__(self, source, decode_size=INPUT_SIZE, max_pixels=MAX_IMAGE_PIXELS):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self.path = None
+            self.data = bytes(source)
+        else:
+            self.path = os.fspath(source)
+            with open(self.path, 'rb') as f:
+                self.data = f.read()
+        self.decode_size = decode_size
+        self.max_pixels = max_pixels
+        self._image = None
+        self._views = {}
+
+    @classmethod
+    def of(cls, image):
+        """Return image if it is already a context, otherwise open it as one."""
+        return image if isinstance(image, cls) else cls(image)
+
+    @property
+    def has_image_signature(self):
+        return has_image_signature(self.data)
+
+    @property
+    def image(self):
+        """The decoded RGB image, at least decode_size."""
+        if self._image is None:
+            image = open_image(self.data, self.decode_size, self.max_pixels)
+            image.load()
+            self._image = image
+        return self._image
+
+    def _view(self, key, build):
+        view = self._views.get(key)
+        if view is None:
+            view = self._views[key] = build()
+        return view
+
+    def thumbnail_image(self, size=THUMBNAIL_SIZE, resample=LANCZOS):
+        return self._view(('thumbnail', size, resample), lambda: self.image.resize(size, resample))
+
+    def thumbnail(self, size=THUMBNAIL_SIZE, resample=LANCZOS):
+        """(H, W, 3) uint8 RGB thumbnail."""
+        return self._view(('rgb', size, resample),
+                          lambda: np.asarray(self.thumbnail_image(size, resample)))
+
+    def grayscale(self, size=THUMBNAIL_SIZE, resample=LANCZOS):
+        """(H, W) uint8 luminance plane, derived from the RGB thumbnail."""
+        return self._view(('gray', size, resample),
+                          lambda: np.asarray(self.thumbnail_image(size, resample).convert('L')))
+
+    def model_input(self, size=INPUT_SIZE, resample=BICUBIC):
+        """(H, W, 3) uint8 RGB array at the model input size."""
+        return self._view(('input', size, resample),
+                          lambda: np.asarray(self.image.resize(size, resample) if self.image.size != size
+                                             else self.image))
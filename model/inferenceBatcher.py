@@ -0,0 +1,140 @@
+"""
+Dynamic micro-batching for the long-running classifier workers.
+
+Requests are queued as individual (224, 224, 3) arrays and a flush thread
+stacks them into one (N, 224, 224, 3) batch when either the batch is full or
+the oldest queued request has waited ``max_wait_ms``. Several flush threads
+can be used when the predict function fans out to a worker pool.
+
+An optional ``observer(batch_size, queue_wait_seconds, predict_seconds)`` is
+called after every model call; the queue wait is that of the oldest request.
+"""
+
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+import numpy as np
+
+
+class MicroBatcher:
+    """Collect concurrent predictions into batches for one predict function."""
+
+    def __init__(self, predict_fn, max_batch_size=8, max_wait_ms=5.0, flush_threads=1, observer=None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.flush_threads = max(1, flush_threads)
+        self.observer = observer
+
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._running = False
+        self._threads = []
+
+        self._batches = 0
+        self._requests = 0
+        self._last_batch_size = 0
+        self._largest_batch_size = 0
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._threads = [
+            threading.Thread(target=self._run, name=f"micro-batcher-{i}", daemon=True)
+            for i in range(self.flush_threads)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Flush whatever is queued and stop the flush threads."""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, image_array, callback):
+        """Queue one image; ``callback(probabilities, error)`` runs on the flush thread."""
+        with self._condition:
+            if not self._running:
+                raise RuntimeError("Batcher is not running")
+            self._queue.append((time.monotonic(), image_array, callback))
+            self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'queue_depth': len(self._queue),
+                'batches': self._batches,
+                'requests': self._requests,
+                'mean_batch_size': self._requests / self._batches if self._batches else 0.0,
+                'last_batch_size': self._last_batch_size,
+                'largest_batch_size': self._largest_batch_size,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+            }
+
+    def _next_batch(self):
+        with self._condition:
+            while True:
+                while not self._queue:
+                    if not self._running:
+                        return None
+                    self._condition.wait()
+
+                # The deadline is set by the oldest request, not by when we woke up
+                deadline = self._queue[0][0] + self.max_wait
+                while self._running and self._queue and len(self._queue) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                # Another flush thread may have taken everything while we waited
+                if self._queue:
+                    break
+
+            size = min(len(self._queue), self.max_batch_size)
+            batch = [self._queue.popleft() for _ in range(size)]
+
+            self._batches += 1
+            self._requests += size
+            self._last_batch_size = size
+            self._largest_batch_size = max(self._largest_batch_size, size)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            callbacks = [callback for _, _, callback in batch]
+            started = time.monotonic()
+            try:
+                probabilities = self.predict_fn(np.stack([image for _, image, _ in batch]))
+                results = [(row, None) for row in probabilities]
+            except Exception as e:
+                results = [(None, e)] * len(callbacks)
+
+            if self.observer is not None and batch:
+                try:
+                    self.observer(len(batch), started - batch[0][0], time.monotonic() - started)
+                except Exception:
+                    traceback.print_exc(file=sys.stderr)
+
+            for callback, (row, error) in zip(callbacks, results):
+                try:
+                    callback(row, error)
+                except Exception:
+                    # A failing caller must not take the flush thread down with it
+                    traceback.print_exc(file=sys.stderr)
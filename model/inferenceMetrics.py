@@ -0,0 +1,184 @@
+"""
+Optional per-stage timing for the classifier scripts.
+
+One-shot runs collect a StageTimer per process and print it as a single
+``METRICS {...}`` JSON line on stderr (or append it to a side file). The
+long-running --serve mode feeds the same stage timings into a MetricsRegistry
+that renders Prometheus text-format counters and histograms.
+
+Timing is off unless --metrics or NUTRIHELP_METRICS=1 is given. A disabled
+timer hands out one shared no-op context manager, so instrumented code pays
+a method call per stage and never reads the clock.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+
+# Seconds; covers decode of a thumbnail up to a cold model load
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def metrics_enabled_from_env():
+    return os.environ.get('NUTRIHELP_METRICS', '').lower() in ('1', 'true', 'yes')
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class StageTimer:
+    """Monotonic per-stage timings for one process or one request."""
+
+    def __init__(self, enabled=False, registry=None):
+        self.enabled = enabled
+        self.registry = registry
+        self.timings = {}
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def record(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+        if self.registry is not None:
+            self.registry.observe(name, seconds)
+
+    def trailer(self):
+        stages = {name: round(seconds * 1000.0, 3) for name, seconds in self.timings.items()}
+        return {'stages_ms': stages, 'total_ms': round(sum(stages.values()), 3)}
+
+    def emit(self, path=None, **extra):
+        """Write the trailer as one JSON line to stderr, or append it to path."""
+        if not self.enabled:
+            return
+        payload = dict(self.trailer(), **extra)
+        if path:
+            with open(path, 'a') as f:
+                f.write(json.dumps(payload) + '\n')
+        else:
+            sys.stderr.write(f"METRICS {json.dumps(payload)}\n")
+
+
+# Shared disabled timer for callers that do not pass one
+NULL_TIMER = StageTimer(False)
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Counters and histograms rendered in the Prometheus text format."""
+
+    def __init__(self, classifier, prefix='nutrihelp_classifier'):
+        self.classifier = classifier
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._batch_sizes = _Histogram((1, 2, 4, 8, 16, 32, 64))
+        self._counters = {}
+        self._gauges = {}
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = _Histogram(DEFAULT_BUCKETS)
+            histogram.observe(seconds)
+
+    def observe_batch(self, size):
+        with self._lock:
+            self._batch_sizes.observe(size)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def _labels(self, **extra):
+        labels = dict({'classifier': self.classifier}, **extra)
+        return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+    def _render_histogram(self, lines, name, histogram, **labels):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{self._labels(**labels, le=bound)} {cumulative}")
+        lines.append(f"{name}_bucket{self._labels(**labels, le='+Inf')} {histogram.count}")
+        lines.append(f"{name}_sum{self._labels(**labels)} {histogram.total}")
+        lines.append(f"{name}_count{self._labels(**labels)} {histogram.count}")
+
+    def render(self):
+        lines = []
+        with self._lock:
+            stage_name = f"{self.prefix}_stage_seconds"
+            lines.append(f"# HELP {stage_name} Time spent in each inference stage.")
+            lines.append(f"# TYPE {stage_name} histogram")
+            for stage, histogram in self._stages.items():
+                self._render_histogram(lines, stage_name, histogram, stage=stage)
+
+            batch_name = f"{self.prefix}_batch_size"
+            lines.append(f"# HELP {batch_name} Number of images per model call.")
+            lines.append(f"# TYPE {batch_name} histogram")
+            self._render_histogram(lines, batch_name, self._batch_sizes)
+
+            for name in sorted({name for name, _ in self._counters}):
+                metric = f"{self.prefix}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                for (counter, labels), value in self._counters.items():
+                    if counter == name:
+                        lines.append(f"{metric}{self._labels(**dict(labels))} {value}")
+
+            for name, value in self._gauges.items():
+                metric = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric}{self._labels()} {value}")
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,91 @@
+"""
+Framing used between the Node server and the long-running classifier workers.
+
+Every message is length-prefixed with a 4 byte big-endian unsigned integer.
+
+Request:  <header length><JSON header><body length><raw body bytes>
+Response: <payload length><JSON payload>
+
+The header always carries an integer ``id`` and an ``op`` (``predict`` for
+image bytes); the response echoes the ``id`` so callers can pipeline requests.
+"""
+
+import json
+import struct
+
+_LENGTH = struct.Struct('>I')
+
+# Uploads are capped well below this by multer; anything larger is a broken stream
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+
+class ProtocolError(Exception):
+    """Raised when the peer sends a truncated or oversized frame."""
+
+
+def _read_exact(stream, size):
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = stream.read(remaining)
+        if not chunk:
+            if remaining == size:
+                return None
+            raise ProtocolError(f"Stream closed with {remaining} of {size} bytes outstanding")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def _read_frame(stream, allow_eof=False):
+    prefix = _read_exact(stream, _LENGTH.size)
+    if prefix is None:
+        if allow_eof:
+            return None
+        raise ProtocolError("Stream closed before frame length")
+    (length,) = _LENGTH.unpack(prefix)
+    if length > MAX_FRAME_BYTES:
+        raise ProtocolError(f"Frame of {length} bytes exceeds limit of {MAX_FRAME_BYTES}")
+    if length == 0:
+        return b''
+    data = _read_exact(stream, length)
+    if data is None:
+        raise ProtocolError("Stream closed before frame body")
+    return data
+
+
+def _write_frame(stream, data):
+    stream.write(_LENGTH.pack(len(data)))
+    stream.write(data)
+
+
+def read_request(stream):
+    """Read one request; returns ``(header, body)`` or ``None`` on a clean EOF."""
+    raw_header = _read_frame(stream, allow_eof=True)
+    if raw_header is None:
+        return None
+    try:
+        header = json.loads(raw_header.decode('utf-8'))
+    except ValueError as e:
+        raise ProtocolError(f"Invalid request header: {e}")
+    body = _read_frame(stream)
+    return header, body
+
+
+def write_request(stream, header, body=b''):
+    _write_frame(stream, json.dumps(header).encode('utf-8'))
+    _write_frame(stream, body)
+    stream.flush()
+
+
+def read_response(stream):
+    """Read one response payload; returns ``None`` on a clean EOF."""
+    raw = _read_frame(stream, allow_eof=True)
+    if raw is None:
+        return None
+    return json.loads(raw.decode('utf-8'))
+
+
+def write_response(stream, payload):
+    _write_frame(stream, json.dumps(payload).encode('utf-8'))
+    stream.flush()
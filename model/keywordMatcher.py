@@ -0,0 +1,132 @@
+"""
+Filename keyword matching for the recipe classifier.
+
+The keyword tables live in recipeKeywords.json and are compiled into one
+Aho-Corasick automaton, so a filename is scanned once no matter how many
+keywords there are. When several keywords occur in the same name, the one
+listed first wins (tables in order, then keys in file order), which is the
+order the old per-key substring checks used. KeywordTable re-reads the file
+when its mtime changes, so long-running processes pick up new keywords
+without a restart.
+"""
+
+import os
+import sys
+import json
+import time
+from collections import deque
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over (keyword, value) pairs in priority order."""
+
+    def __init__(self, entries):
+        # entries: iterable of (keyword, payload); earlier entries have priority
+        self._goto = [{}]
+        self._fail = [0]
+        self._best = [None]
+        self._payloads = []
+
+        for priority, (keyword, payload) in enumerate(entries):
+            self._payloads.append(payload)
+            keyword = keyword.lower()
+            if not keyword:
+                continue
+            node = 0
+            for char in keyword:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(None)
+                node = next_node
+            if self._best[node] is None:
+                self._best[node] = priority
+
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                link = self._goto[fallback].get(char, 0)
+                self._fail[child] = link if link != child else 0
+                # A node also ends every keyword that ends at its failure target
+                inherited = self._best[self._fail[child]]
+                if inherited is not None and (self._best[child] is None or inherited < self._best[child]):
+                    self._best[child] = inherited
+                queue.append(child)
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def match(self, text):
+        """Payload of the highest-priority keyword occurring anywhere in text, or None."""
+        goto, fail, best_at = self._goto, self._fail, self._best
+        node = 0
+        best = None
+        for char in text.lower():
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            found = best_at[node]
+            if found is not None and (best is None or found < best):
+                best = found
+                if best == 0:
+                    break
+        return None if best is None else self._payloads[best]
+
+
+class KeywordTable:
+    """Keyword tables from a JSON file, recompiled whenever the file changes."""
+
+    def __init__(self, path, tables, check_interval=1.0):
+        self.path = path
+        self.tables = tables
+        self.check_interval = check_interval
+        self._mtime = None
+        self._checked = 0.0
+        self._matcher = KeywordMatcher([])
+        self.data = {}
+        self.reload()
+
+    def reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            # Keep serving the last good tables if an edit is half-written or invalid
+            sys.stderr.write(f"Could not load keywords from {self.path}: {e}\n")
+            return False
+
+        entries = [(keyword, (table, keyword, value))
+                   for table in self.tables
+                   for keyword, value in data.get(table, {}).items()]
+        self._matcher = KeywordMatcher(entries)
+        self.data = data
+        self._mtime = mtime
+        return True
+
+    def _check_for_changes(self):
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def match(self, text):
+        """(table, keyword, value) for the first keyword found in text, or None."""
+        self._check_for_changes()
+        return self._matcher.match(text)
@@ -0,0 +1,452 @@
+"""
+Versioned model hot-swapping for the long-running classifier workers.
+
+The registry serves one model file. A watcher thread polls it, and once a
+change has stayed put for one poll interval the new file is copied to
+versions/<name>-<version><ext> next to it (the version is the start of its
+SHA-256), loaded and warmed up on a background thread while the current
+model keeps answering. Swapping is a reference change under a lock: every
+batch runs start to finish on the model that was current when it began, and
+the old model is only closed after its last in-flight batch returns, so no
+request is dropped or sees a half-loaded model.
+
+With a shadow fraction the new version is held as a candidate instead: that
+fraction of live batches is also run on it by a shadow thread, after the
+answer from the current model has gone out, and the latency and top-1
+agreement of the two are recorded. The candidate is promoted by promote(),
+or automatically once enough shadowed images agree often enough.
+
+The versions directory keeps the most recent copies (and whatever exports
+share their name) so a bad release can be rolled back by copying one back.
+If it cannot be written, e.g. on a read-only model directory, the model file
+is loaded in place and there is nothing to roll back to.
+"""
+
+import os
+import sys
+import time
+import queue
+import random
+import shutil
+import threading
+import traceback
+from collections import deque
+
+import numpy as np
+
+from predictionCache import file_fingerprint
+
+VERSIONS_DIR = 'versions'
+VERSION_LENGTH = 12
+SHADOW_QUEUE_SIZE = 4
+LATENCY_WINDOW = 1000
+
+
+def _file_state(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _log(message):
+    sys.stderr.write(f"Model registry: {message}\n")
+
+
+class LoadedModel:
+    """One loaded version, closed once it is retired and its last in-flight batch has returned."""
+
+    def __init__(self, version, path, fingerprint, runtime, load_seconds):
+        self.version = version
+        self.path = path
+        self.fingerprint = fingerprint
+        self.runtime = runtime
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._retired = False
+
+    def acquire(self):
+        with self._lock:
+            self._in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+            close = self._retired and self._in_flight == 0
+        if close:
+            self._close()
+
+    def retire(self):
+        with self._lock:
+            self._retired = True
+            close = self._in_flight == 0
+        if close:
+            self._close()
+
+    def _close(self):
+        close = getattr(self.runtime, 'close', None)
+        if close is not None:
+            close()
+
+    def describe(self):
+        return {
+            'version': self.version,
+            'path': self.path,
+            'loaded_at': self.loaded_at,
+            'load_seconds': self.load_seconds,
+        }
+
+
+class ShadowStats:
+    """Agreement and latency of a candidate against the current model on the same batches."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.images = 0
+        self.agreed = 0
+        self.dropped = 0
+        self.errors = 0
+        self._current_seconds = deque(maxlen=LATENCY_WINDOW)
+        self._candidate_seconds = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, current, candidate, current_seconds, candidate_seconds):
+        agreed = int((np.argmax(current, axis=1) == np.argmax(candidate, axis=1)).sum())
+        with self._lock:
+            self.batches += 1
+            self.images += len(current)
+            self.agreed += agreed
+            self._current_seconds.append(current_seconds)
+            self._candidate_seconds.append(candidate_seconds)
+
+    def drop(self):
+        with self._lock:
+            self.dropped += 1
+
+    def error(self):
+        with self._lock:
+            self.errors += 1
+
+    @property
+    def agreement(self):
+        with self._lock:
+            return self.agreed / self.images if self.images else 0.0
+
+    @staticmethod
+    def _latency(samples):
+        if not samples:
+            return None
+        values = np.array(samples) * 1000.0
+        return {'mean_ms': float(values.mean()), 'p95_ms': float(np.percentile(values, 95))}
+
+    def summary(self):
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'images': self.images,
+                'agreement': self.agreed / self.images if self.images else None,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'current_latency': self._latency(self._current_seconds),
+                'candidate_latency': self._latency(self._candidate_seconds),
+            }
+
+
+class ModelRegistry:
+    """The current (and optional candidate) version of one model file, swapped without a restart.
+
+    loader(path) returns a runtime with predict(batch) and warmup(batch_sizes);
+    on_swap(model) runs just before a version starts answering, e.g. to point
+    the prediction cache at it.
+    """
+
+    def __init__(self, model_path, loader, warmup_batch_sizes=(1,), poll_interval=2.0, shadow_fraction=0.0,
+                 promote_after=0, min_agreement=0.99, keep_versions=3, on_swap=None):
+        self.model_path = model_path
+        self.loader = loader
+        self.warmup_batch_sizes = tuple(warmup_batch_sizes)
+        self.poll_interval = poll_interval
+        self.shadow_fraction = shadow_fraction
+        self.promote_after = promote_after
+        self.min_agreement = min_agreement
+        self.keep_versions = keep_versions
+        self.on_swap = on_swap
+
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._local = threading.local()
+        self._rng = random.Random()
+        self._current = None
+        self._candidate = None
+        self._shadow_stats = ShadowStats()
+        self._loaded_state = None
+        self._last_error = None
+        self._swaps = 0
+
+        self._stop = threading.Event()
+        self._watcher = None
+        self._shadow_queue = queue.Queue(SHADOW_QUEUE_SIZE)
+        self._shadow_thread = None
+
+    def start(self):
+        """Load and warm up the model synchronously, then start watching the file."""
+        state = _file_state(self.model_path)
+        self._promote(self._load(*self._snapshot(self.model_path)))
+        self._loaded_state = state
+        if self.poll_interval > 0:
+            self._watcher = threading.Thread(target=self._watch, name="model-registry-watcher", daemon=True)
+            self._watcher.start()
+        if self.shadow_fraction > 0:
+            self._shadow_thread = threading.Thread(target=self._run_shadow, name="model-registry-shadow",
+                                                   daemon=True)
+            self._shadow_thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+        if self._shadow_thread is not None:
+            self._shadow_queue.put(None)
+            self._shadow_thread.join()
+        with self._lock:
+            models = [self._current, self._candidate]
+            self._current = self._candidate = None
+        for model in models:
+            if model is not None:
+                model.retire()
+
+    @property
+    def current(self):
+        return self._current
+
+    @property
+    def candidate(self):
+        return self._candidate
+
+    def predict(self, batch):
+        """Class probabilities for a batch from the current version, shadowed on the candidate if sampled."""
+        with self._lock:
+            model = self._current
+            model.acquire()
+            candidate = self._candidate
+            if candidate is not None and self._rng.random() < self.shadow_fraction:
+                candidate.acquire()
+                # Taken with the candidate, so the comparison is only ever counted for this version
+                stats = self._shadow_stats
+            else:
+                candidate = None
+
+        started = time.perf_counter()
+        try:
+            probabilities = model.runtime.predict(batch)
+        except Exception:
+            if candidate is not None:
+                candidate.release()
+            raise
+        finally:
+            model.release()
+        self._local.model = model
+
+        if candidate is not None:
+            try:
+                self._shadow_queue.put_nowait((candidate.version, candidate, stats, batch, probabilities,
+                                               time.perf_counter() - started))
+            except queue.Full:
+                # The shadow thread is behind; live traffic never waits for it
+                stats.drop()
+                candidate.release()
+        return probabilities
+
+    def last_model(self):
+        """The version that answered this thread's most recent predict()."""
+        return getattr(self._local, 'model', None)
+
+    def reload(self):
+        """Load the model file now instead of at the next poll; returns False if a load is already running."""
+        if self._load_lock.locked():
+            return False
+        threading.Thread(target=self._load_changed, args=(True,), name="model-registry-loader",
+                         daemon=True).start()
+        return True
+
+    def promote(self):
+        """Make the candidate the current version."""
+        with self._lock:
+            candidate = self._candidate
+            self._candidate = None
+        if candidate is None:
+            raise ValueError("No candidate model to promote")
+        self._promote(candidate)
+        return candidate
+
+    def reject(self):
+        """Drop the candidate and keep the current version."""
+        with self._lock:
+            candidate = self._candidate
+            self._candidate = None
+        if candidate is None:
+            raise ValueError("No candidate model to reject")
+        candidate.retire()
+        _log(f"rejected candidate {candidate.version}")
+        return candidate
+
+    def status(self):
+        with self._lock:
+            current, candidate = self._current, self._candidate
+        return {
+            'current': current.describe() if current else None,
+            'candidate': candidate.describe() if candidate else None,
+            'shadow_fraction': self.shadow_fraction,
+            'shadow': self._shadow_stats.summary() if candidate else None,
+            'swaps': self._swaps,
+            'last_error': self._last_error,
+        }
+
+    def _watch(self):
+        seen = _file_state(self.model_path)
+        while not self._stop.wait(self.poll_interval):
+            state = _file_state(self.model_path)
+            # Only load a file that has stopped changing, so a copy in progress is never picked up
+            if state is not None and state == seen and state != self._loaded_state:
+                self._load_changed()
+            seen = state
+
+    def _load_changed(self, force=False):
+        if not self._load_lock.acquire(blocking=False):
+            return
+        try:
+            state = _file_state(self.model_path)
+            if state is None or (state == self._loaded_state and not force):
+                return
+            # A file that fails to load is not retried until it changes again (or on reload())
+            self._loaded_state = state
+            versioned_path = None
+            try:
+                versioned_path, fingerprint = self._snapshot(self.model_path)
+                if any(m is not None and m.fingerprint == fingerprint for m in (self._current, self._candidate)):
+                    return
+                model = self._load(versioned_path, fingerprint)
+            except Exception as e:
+                traceback.print_exc()
+                self._last_error = f"Could not load {self.model_path}: {e}"
+                _log(self._last_error)
+                # Keep versions/ to files that loaded, so every entry there is safe to roll back to
+                if versioned_path not in (None, self.model_path) and os.path.exists(versioned_path):
+                    os.remove(versioned_path)
+                return
+            self._last_error = None
+
+            if self.shadow_fraction > 0:
+                with self._lock:
+                    previous = self._candidate
+                    self._candidate = model
+                    self._shadow_stats = ShadowStats()
+                if previous is not None:
+                    previous.retire()
+                _log(f"shadowing candidate {model.version} on {self.shadow_fraction:.0%} of batches")
+            else:
+                self._promote(model)
+        finally:
+            self._load_lock.release()
+
+    def _load(self, versioned_path, fingerprint):
+        started = time.perf_counter()
+        runtime = self.loader(versioned_path)
+        runtime.warmup(self.warmup_batch_sizes)
+        model = LoadedModel(fingerprint[:VERSION_LENGTH], versioned_path, fingerprint, runtime,
+                            time.perf_counter() - started)
+        _log(f"loaded {model.version} in {model.load_seconds:.2f}s")
+        return model
+
+    def _snapshot(self, path):
+        # Hash the copy rather than the original, which may be replaced again while we read it
+        directory = os.path.join(os.path.dirname(os.path.abspath(path)), VERSIONS_DIR)
+        stem, extension = os.path.splitext(os.path.basename(path))
+        tmp_path = os.path.join(directory, f".{stem}.{os.getpid()}.tmp")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            shutil.copyfile(path, tmp_path)
+        except OSError as e:
+            # A read-only model directory still serves, only without copies to roll back to
+            _log(f"cannot keep versions in {directory} ({e}); loading {path} in place")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return path, file_fingerprint(path)
+        fingerprint = file_fingerprint(tmp_path)
+        versioned_path = os.path.join(directory, f"{stem}-{fingerprint[:VERSION_LENGTH]}{extension}")
+        if os.path.exists(versioned_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, versioned_path)
+        return versioned_path, fingerprint
+
+    def _promote(self, model):
+        if self.on_swap is not None:
+            self.on_swap(model)
+        with self._lock:
+            previous = self._current
+            self._current = model
+            self._swaps += 1
+        if previous is not None:
+            previous.retire()
+            _log(f"now serving {model.version} (was {previous.version})")
+        self._prune_versions()
+
+    def _prune_versions(self):
+        directory = os.path.join(os.path.dirname(os.path.abspath(self.model_path)), VERSIONS_DIR)
+        stem = os.path.splitext(os.path.basename(self.model_path))[0] + '-'
+        versions = {}
+        if not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            if name.startswith(stem):
+                version = name[len(stem):len(stem) + VERSION_LENGTH]
+                path = os.path.join(directory, name)
+                versions.setdefault(version, []).append(path)
+        with self._lock:
+            active = {m.version for m in (self._current, self._candidate) if m is not None}
+        newest = sorted(versions, key=lambda v: max(os.path.getmtime(p) for p in versions[v]), reverse=True)
+        for version in newest[self.keep_versions:]:
+            if version in active:
+                continue
+            for path in versions[version]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _run_shadow(self):
+        while True:
+            job = self._shadow_queue.get()
+            if job is None:
+                return
+            version, candidate, stats, batch, current_probabilities, current_seconds = job
+            with self._lock:
+                stale = self._candidate is None or self._candidate.version != version
+            if stale:
+                # Queued for a candidate that has since been promoted, rejected or replaced
+                candidate.release()
+                continue
+            try:
+                started = time.perf_counter()
+                candidate_probabilities = candidate.runtime.predict(batch)
+                stats.record(current_probabilities, candidate_probabilities, current_seconds,
+                             time.perf_counter() - started)
+            except Exception:
+                traceback.print_exc()
+                stats.error()
+            finally:
+                candidate.release()
+
+            if (self.promote_after and stats.images >= self.promote_after
+                    and stats.agreement >= self.min_agreement and self._candidate is candidate):
+                _log(f"candidate {candidate.version} agreed on {stats.agreement:.1%} of "
+                     f"{stats.images} shadowed images; promoting it")
+                try:
+                    self.promote()
+                except ValueError:
+                    pass  # promoted or rejected in the meantime
@@ -0,0 +1,216 @@
+"""
+Model loading helpers shared by the classifier scripts.
+
+TensorFlow is only imported when a runtime is constructed so that the calling
+script can finish configuring the process first. Every runtime exposes
+``predict(batch)`` returning class probabilities for a (N, 224, 224, 3) batch;
+the Keras runtime also has ``predict_with_embeddings(batch)``.
+"""
+
+import os
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+import sys
+import threading
+import contextlib
+
+import numpy as np
+
+import threadingProfile
+
+RUNTIMES = ('keras', 'tflite')
+
+# Quantized variants written by tools/image_classification/quantize_model.py
+VARIANTS = ('fp32', 'float16', 'int8')
+
+
+def tflite_path_for(model_path, variant='fp32'):
+    """Location of the .tflite export (or a quantized variant) for a Keras model file."""
+    stem = os.path.splitext(model_path)[0]
+    if variant == 'fp32':
+        return stem + '.tflite'
+    return f"{stem}_{variant}.tflite"
+
+
+def export_tflite(model_path, force=False):
+    """Convert a Keras model to its fp32 .tflite export unless one newer than the model exists."""
+    output_path = tflite_path_for(model_path)
+    if not force and os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(model_path):
+        return output_path
+
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(model_path, compile=False)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    # The converter prints a summary, which would corrupt a caller's results on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        flatbuffer = converter.convert()
+    # Written beside the target and renamed, so a worker never maps half a flatbuffer
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(flatbuffer)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def compile_predict(model, jit_compile=False):
+    """Wrap a Keras model in a tf.function with a fixed (None, H, W, C) float32 signature.
+
+    Calling the model directly skips the per-call setup of Model.predict(), and
+    the fixed signature means one trace serves every batch size (XLA still
+    compiles once per distinct batch size). Returns a numpy-in, numpy-out function.
+    """
+    import tensorflow as tf
+
+    signature = [tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32)]
+    function = tf.function(lambda batch: model(batch, training=False),
+                           input_signature=signature, jit_compile=jit_compile)
+
+    def predict(batch):
+        return function(np.asarray(batch, dtype=np.float32)).numpy()
+    return predict
+
+
+def compile_predict_with_embeddings(model, jit_compile=False):
+    """Like compile_predict(), but the function returns (probabilities, embeddings).
+
+    The embeddings are the penultimate layer's activations, flattened to (N, D),
+    computed in the same forward pass as the probabilities.
+    """
+    import tensorflow as tf
+
+    two_headed = tf.keras.Model(model.inputs, [model.outputs[0], model.layers[-2].output])
+    signature = [tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32)]
+    function = tf.function(lambda batch: two_headed(batch, training=False),
+                           input_signature=signature, jit_compile=jit_compile)
+
+    def predict(batch):
+        probabilities, embeddings = function(np.asarray(batch, dtype=np.float32))
+        return probabilities.numpy(), embeddings.numpy().reshape(len(batch), -1)
+    return predict
+
+
+class KerasRuntime:
+    """Full Keras model loaded from an HDF5 file, run through a compiled predict function."""
+
+    def __init__(self, model_path, jit_compile=False):
+        from tensorflow.keras.models import load_model
+
+        self.model_path = model_path
+        self.model = load_model(model_path, compile=False)
+        self.jit_compile = jit_compile
+        self._predict = compile_predict(self.model, jit_compile)
+        self._predict_with_embeddings = None
+
+    def predict(self, batch):
+        """Return class probabilities for a (N, 224, 224, 3) batch."""
+        return self._predict(batch)
+
+    def predict_with_embeddings(self, batch):
+        """Return (class probabilities, penultimate-layer embeddings) for a (N, 224, 224, 3) batch."""
+        if self._predict_with_embeddings is None:
+            self._predict_with_embeddings = compile_predict_with_embeddings(self.model, self.jit_compile)
+        return self._predict_with_embeddings(batch)
+
+    def warmup(self, batch_sizes=(1,)):
+        """Trace (and with XLA, compile) ahead of the first real request."""
+        for batch_size in batch_sizes:
+            self._predict(np.zeros((batch_size,) + tuple(self.model.input_shape[1:]), dtype=np.float32))
+
+
+class TFLiteRuntime:
+    """TFLite flatbuffer run through tf.lite.Interpreter.
+
+    The interpreter memory-maps the model file, and the input tensor is only
+    reallocated when the batch size changes, so steady-state calls write
+    straight into the interpreter's own input buffer. Full-integer models are
+    quantized on the way in and dequantized on the way out, so callers always
+    pass and receive float32. The flatbuffer only exposes the output layer, so
+    there is no predict_with_embeddings().
+    """
+
+    def __init__(self, model_path, num_threads=None, shared_weights=False):
+        import tensorflow as tf
+
+        self.model_path = model_path
+        # XNNPACK repacks the weights into memory of its own; the builtin kernels read the mapped file
+        resolver = (tf.lite.experimental.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES if shared_weights
+                    else tf.lite.experimental.OpResolverType.AUTO)
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads,
+                                               experimental_op_resolver_type=resolver)
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = None
+        # The interpreter is not thread safe; the batcher may call from several threads
+        self._lock = threading.Lock()
+        self._allocate(1)
+
+    def _allocate(self, batch_size):
+        shape = [batch_size] + list(self._input['shape'][1:])
+        self.interpreter.resize_tensor_input(self._input['index'], shape)
+        self.interpreter.allocate_tensors()
+        self._batch_size = batch_size
+
+    def predict(self, batch):
+        """Return class probabilities for a (N, 224, 224, 3) batch."""
+        with self._lock:
+            if len(batch) != self._batch_size:
+                self._allocate(len(batch))
+            # tensor() returns a view of the interpreter's buffer; it must not outlive invoke()
+            self.interpreter.tensor(self._input['index'])()[...] = self._quantize(batch)
+            self.interpreter.invoke()
+            return self._dequantize(self.interpreter.get_tensor(self._output['index']))
+
+    def warmup(self, batch_sizes=(1,)):
+        """Allocate and run once so the first request does not pay for it."""
+        for batch_size in batch_sizes:
+            self.predict(np.zeros([batch_size] + list(self._input['shape'][1:]), dtype=np.float32))
+
+    def _quantize(self, batch):
+        scale, zero_point = self._input['quantization']
+        if not scale:
+            return batch
+        limits = np.iinfo(self._input['dtype'])
+        return np.clip(np.round(batch / scale + zero_point), limits.min, limits.max)
+
+    def _dequantize(self, output):
+        scale, zero_point = self._output['quantization']
+        if not scale:
+            return np.array(output)
+        return (output.astype(np.float32) - zero_point) * scale
+
+
+def resolve_model_path(model_path, runtime='keras', variant='fp32'):
+    """The file load_runtime() will actually read for these options.
+
+    The fp32 .tflite export is written when it is missing or older than the
+    model; quantized variants must already have been written by
+    tools/image_classification/quantize_model.py.
+    """
+    if variant not in VARIANTS:
+        raise ValueError(f"Unknown model variant: {variant}")
+    if runtime not in RUNTIMES:
+        raise ValueError(f"Unknown runtime: {runtime}")
+    if (runtime == 'tflite' or variant != 'fp32') and not model_path.endswith('.tflite'):
+        if variant == 'fp32':
+            return export_tflite(model_path)
+        path = tflite_path_for(model_path, variant)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No {variant} variant at {path}; "
+                                    f"write it with tools/image_classification/quantize_model.py")
+        return path
+    return model_path
+
+
+def load_runtime(model_path, runtime='keras', variant='fp32', threading_config=None, jit_compile=False):
+    """Construct the requested runtime; 'tflite' and quantized variants use the exports next to model_path.
+
+    threading_config comes from threadingProfile.select_config() and is applied before the model loads.
+    jit_compile enables XLA for the Keras runtime and is ignored for TFLite.
+    """
+    model_path = resolve_model_path(model_path, runtime, variant)
+    threadingProfile.apply_env(threading_config)
+    if model_path.endswith('.tflite'):
+        return TFLiteRuntime(model_path, num_threads=(threading_config or {}).get('intra_op'))
+    threadingProfile.apply_tf(threading_config)
+    return KerasRuntime(model_path, jit_compile)
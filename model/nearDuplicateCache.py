@@ -0,0 +1,202 @@
+"""
+Near-duplicate cache of recipe predictions, keyed by a 64-bit perceptual hash.
+
+Re-encoded, resized or re-taken photos of the same dish have dHashes a few
+bits apart, so a lookup returns the closest stored prediction within
+max_distance bits. The hash is split into four 16-bit chunks, each with its
+own exact-match table: two hashes at most 3 bits apart must agree on at least
+one chunk (pigeonhole), so only the entries sharing a chunk are compared. A
+dHash only sees brightness structure, so entries also keep the image's mean
+colour and only match images of a similar colour. Nearly flat images have
+almost no bits set and would all look alike, so they are never cached.
+
+The in-memory tier is an LRU bounded by entry count; the optional SQLite tier
+survives restarts and is shared by the one-shot classifier processes. Every
+entry belongs to a namespace (the rule and model settings that produced it),
+so changing those settings never returns a stale answer.
+"""
+
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+CHUNKS = 4
+CHUNK_BITS = 64 // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+MAX_DISTANCE = CHUNKS - 1
+DEFAULT_COLOR_TOLERANCE = 24
+# Hashes with fewer set (or clear) bits than this carry too little structure to match on
+MIN_STRUCTURE_BITS = 8
+
+
+def hash_chunks(value):
+    return [(value >> (CHUNK_BITS * i)) & CHUNK_MASK for i in range(CHUNKS)]
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def is_informative(value):
+    bits = bin(value).count('1')
+    return MIN_STRUCTURE_BITS <= bits <= 64 - MIN_STRUCTURE_BITS
+
+
+def _quantize_color(color):
+    return tuple(int(round(float(channel))) for channel in color)
+
+
+def _to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class _DiskTier:
+    def __init__(self, db_path, max_entries):
+        self.max_entries = max_entries
+        self._puts = 0
+        self.connection = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS near_duplicates ("
+            "namespace TEXT, hash INTEGER, c0 INTEGER, c1 INTEGER, c2 INTEGER, c3 INTEGER, "
+            "r INTEGER, g INTEGER, b INTEGER, prediction TEXT, last_used REAL, "
+            "PRIMARY KEY (namespace, hash, r, g, b))")
+        for i in range(CHUNKS):
+            self.connection.execute(
+                f"CREATE INDEX IF NOT EXISTS near_duplicates_c{i} ON near_duplicates (namespace, c{i})")
+        self.connection.commit()
+
+    def candidates(self, namespace, value):
+        chunks = hash_chunks(value)
+        rows = self.connection.execute(
+            "SELECT hash, prediction, r, g, b FROM near_duplicates WHERE namespace = ? AND "
+            "(c0 = ? OR c1 = ? OR c2 = ? OR c3 = ?)", [namespace] + chunks).fetchall()
+        return [((_to_unsigned(row[0]), tuple(row[2:])), row[1]) for row in rows]
+
+    def touch(self, namespace, key):
+        value, color = key
+        with self.connection:
+            self.connection.execute(
+                "UPDATE near_duplicates SET last_used = ? WHERE namespace = ? AND hash = ? AND r = ? AND g = ? AND b = ?",
+                [time.time(), namespace, _to_signed(value)] + list(color))
+
+    def put(self, namespace, key, prediction):
+        value, color = key
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO near_duplicates VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [namespace, _to_signed(value)] + hash_chunks(value) + list(color) + [prediction, time.time()])
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self.connection.execute(
+                    "DELETE FROM near_duplicates WHERE rowid IN ("
+                    "SELECT rowid FROM near_duplicates ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,))
+
+    def close(self):
+        self.connection.close()
+
+
+class NearDuplicateCache:
+    """Two-tier LRU of predictions, looked up by Hamming distance between perceptual hashes."""
+
+    def __init__(self, namespace='', max_entries=4096, max_distance=MAX_DISTANCE,
+                 color_tolerance=DEFAULT_COLOR_TOLERANCE, db_path=None, max_disk_entries=100000):
+        if not 0 <= max_distance <= MAX_DISTANCE:
+            raise ValueError(f"max_distance must be between 0 and {MAX_DISTANCE} for {CHUNKS} hash chunks")
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.color_tolerance = color_tolerance
+
+        self._entries = OrderedDict()
+        self._buckets = [{} for _ in range(CHUNKS)]
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+
+        self._disk = _DiskTier(db_path, max_disk_entries) if db_path else None
+
+    def _closest(self, value, color, candidates):
+        # candidates: ((hash, colour), prediction) pairs
+        best = None
+        for key, prediction in candidates:
+            distance = hamming(value, key[0])
+            if distance > self.max_distance or (best is not None and distance >= best[2]):
+                continue
+            if max(abs(a - b) for a, b in zip(color, key[1])) > self.color_tolerance:
+                continue
+            best = (key, prediction, distance)
+        return best
+
+    def get(self, value, color):
+        """(prediction, distance) of the closest similar-coloured entry within max_distance, or None."""
+        if not is_informative(value):
+            return None
+        color = _quantize_color(color)
+        with self._lock:
+            keys = set()
+            for bucket, chunk in zip(self._buckets, hash_chunks(value)):
+                keys.update(bucket.get(chunk, ()))
+            best = self._closest(value, color, ((key, self._entries[key]) for key in keys))
+            if best is not None:
+                self._entries.move_to_end(best[0])
+                self._hits += 1
+                return best[1], best[2]
+
+            best = self._closest(value, color, self._disk.candidates(self.namespace, value)) if self._disk else None
+            if best is None:
+                self._misses += 1
+                return None
+            self._disk_hits += 1
+            self._disk.touch(self.namespace, best[0])
+            self._remember(best[0], best[1])
+            return best[1], best[2]
+
+    def put(self, value, prediction, color):
+        if not is_informative(value):
+            return
+        key = (value, _quantize_color(color))
+        with self._lock:
+            self._remember(key, prediction)
+            if self._disk:
+                self._disk.put(self.namespace, key, prediction)
+
+    def _remember(self, key, prediction):
+        if self.max_entries <= 0:
+            return
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        else:
+            for bucket, chunk in zip(self._buckets, hash_chunks(key[0])):
+                bucket.setdefault(chunk, set()).add(key)
+        self._entries[key] = prediction
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            for bucket, chunk in zip(self._buckets, hash_chunks(evicted[0])):
+                members = bucket[chunk]
+                members.discard(evicted)
+                if not members:
+                    del bucket[chunk]
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._disk_hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'disk_hits': self._disk_hits,
+                'misses': self._misses,
+                'hit_rate': (self._hits + self._disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        if self._disk:
+            self._disk.close()
@@ -0,0 +1,191 @@
+"""
+Content-addressed cache of classifier results.
+
+Entries are keyed by the SHA-256 of the raw upload bytes and hold the class
+index, label and probability vector. The in-memory tier is an LRU bounded by
+entry count and bytes; the optional SQLite tier survives restarts and is
+shared by concurrent one-shot processes. Every entry belongs to the SHA-256
+fingerprint of the model file that produced it, so replacing the model
+invalidates the cache without any manual step. Entries of other models are
+left in place, so model variants (Keras, TFLite, quantized) can share one
+SQLite file; the tier's LRU limit ages out those no model uses any more.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Rough per-entry bookkeeping overhead on top of the probability vector
+_ENTRY_OVERHEAD = 256
+
+
+def content_key(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_fingerprint(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CachedPrediction:
+    __slots__ = ('index', 'label', 'probabilities')
+
+    def __init__(self, index, label, probabilities):
+        self.index = index
+        self.label = label
+        self.probabilities = np.asarray(probabilities, dtype=np.float32)
+
+    @property
+    def nbytes(self):
+        return self.probabilities.nbytes + len(self.label) + _ENTRY_OVERHEAD
+
+
+class _DiskTier:
+    def __init__(self, db_path, max_entries):
+        self.max_entries = max_entries
+        self._puts = 0
+        self.connection = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "fingerprint TEXT, key TEXT, class_index INTEGER, label TEXT, probabilities BLOB, last_used REAL, "
+            "PRIMARY KEY (fingerprint, key))")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS models (path TEXT PRIMARY KEY, stat TEXT, fingerprint TEXT)")
+        self.connection.commit()
+
+    def fingerprint(self, model_path):
+        """Model hash, reused while the file's size and mtime are unchanged."""
+        # Re-hashing a large model on every one-shot start would cost more than a hit saves
+        path = os.path.abspath(model_path)
+        stat = os.stat(path)
+        model_stat = f"{stat.st_size}:{stat.st_mtime_ns}"
+        row = self.connection.execute("SELECT stat, fingerprint FROM models WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == model_stat:
+            return row[1]
+
+        # Rows of the previous file at this path, or of other models, are left to the LRU eviction
+        fingerprint = file_fingerprint(path)
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO models VALUES (?, ?, ?)", (path, model_stat, fingerprint))
+        return fingerprint
+
+    def get(self, fingerprint, key):
+        row = self.connection.execute(
+            "SELECT class_index, label, probabilities FROM predictions WHERE fingerprint = ? AND key = ?",
+            (fingerprint, key)).fetchone()
+        if row is None:
+            return None
+        with self.connection:
+            self.connection.execute("UPDATE predictions SET last_used = ? WHERE fingerprint = ? AND key = ?",
+                                    (time.time(), fingerprint, key))
+        return CachedPrediction(row[0], row[1], np.frombuffer(row[2], dtype=np.float32))
+
+    def put(self, fingerprint, key, entry):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?)",
+                (fingerprint, key, entry.index, entry.label, entry.probabilities.tobytes(), time.time()))
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self.connection.execute(
+                    "DELETE FROM predictions WHERE rowid IN ("
+                    "SELECT rowid FROM predictions ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,))
+
+    def close(self):
+        self.connection.close()
+
+
+class PredictionCache:
+    """Two-tier LRU cache of predictions for the currently loaded model file."""
+
+    def __init__(self, model_path, max_entries=1024, max_bytes=64 * 1024 * 1024,
+                 db_path=None, max_disk_entries=100000):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+
+        self._disk = _DiskTier(db_path, max_disk_entries) if db_path else None
+        self.set_model(model_path)
+
+    def set_model(self, model_path):
+        """Point the cache at a (possibly new) model file; entries from other models stop matching."""
+        fingerprint = self._disk.fingerprint(model_path) if self._disk else file_fingerprint(model_path)
+        with self._lock:
+            self.model_path = model_path
+            if getattr(self, 'fingerprint', None) != fingerprint:
+                self.fingerprint = fingerprint
+                self._entries.clear()
+                self._bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry
+
+            entry = self._disk.get(self.fingerprint, key) if self._disk else None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._disk_hits += 1
+            self._remember(key, entry)
+            return entry
+
+    def put(self, key, index, label, probabilities, fingerprint=None):
+        """Store a prediction; with fingerprint, only if it came from the model the cache currently serves."""
+        entry = CachedPrediction(index, label, probabilities)
+        with self._lock:
+            if fingerprint is not None and fingerprint != self.fingerprint:
+                return entry
+            self._remember(key, entry)
+            if self._disk:
+                self._disk.put(self.fingerprint, key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        if self.max_entries <= 0 or entry.nbytes > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.nbytes
+        self._entries[key] = entry
+        self._bytes += entry.nbytes
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._disk_hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self._hits,
+                'disk_hits': self._disk_hits,
+                'misses': self._misses,
+                'hit_rate': (self._hits + self._disk_hits) / lookups if lookups else 0.0,
+                'model_fingerprint': self.fingerprint,
+            }
+
+    def close(self):
+        if self._disk:
+            self._disk.close()
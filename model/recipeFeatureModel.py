@@ -0,0 +1,132 @@
+"""
+Small linear classifier over the recipe classifier's per-image features.
+
+The model is a weight matrix and bias over standardized feature vectors, so
+scoring any number of images is one matrix multiply and a softmax in NumPy,
+with no TensorFlow import. It is fitted from labelled feedback by
+tools/feedback/train_feature_model.py as either a multinomial logistic
+regression or a nearest-centroid classifier (whose squared distances reduce to
+the same linear form), and saved as a small .npz together with the class names
+and the feature layout it was trained on.
+
+Usage: python model/recipeFeatureModel.py info <model.npz>
+"""
+
+import sys
+
+import numpy as np
+
+KINDS = ('logistic', 'centroid')
+
+
+def softmax(logits):
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    np.exp(shifted, out=shifted)
+    shifted /= shifted.sum(axis=1, keepdims=True)
+    return shifted
+
+
+class FeatureModel:
+    """Linear scores W·((x - mean) / scale) + b over named feature columns."""
+
+    def __init__(self, classes, weights, bias, mean, scale, feature_names, feature_version, kind='logistic'):
+        self.classes = np.asarray(classes, dtype=str)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.feature_names = [str(name) for name in feature_names]
+        self.feature_version = int(feature_version)
+        self.kind = kind
+        if self.weights.shape != (len(self.feature_names), len(self.classes)) or self.bias.shape != (len(self.classes),):
+            raise ValueError(f"Weights {self.weights.shape} do not match {len(self.feature_names)} features "
+                             f"and {len(self.classes)} classes")
+
+    def probabilities(self, features):
+        """(N, classes) class probabilities for an (N, features) matrix."""
+        standardized = (np.asarray(features, dtype=np.float32) - self.mean) / self.scale
+        return softmax(standardized @ self.weights + self.bias)
+
+    def predict(self, features):
+        """(labels, confidences) for an (N, features) matrix; confidence is the top class probability."""
+        probabilities = self.probabilities(features)
+        best = probabilities.argmax(axis=1)
+        return self.classes[best], probabilities[np.arange(len(best)), best].astype(np.float64)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez(f, classes=self.classes, weights=self.weights, bias=self.bias, mean=self.mean,
+                     scale=self.scale, feature_names=np.asarray(self.feature_names, dtype=str),
+                     feature_version=self.feature_version, kind=self.kind)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['classes'], data['weights'], data['bias'], data['mean'], data['scale'],
+                       data['feature_names'], data['feature_version'], str(data['kind']))
+
+
+def _standardize(features):
+    mean = features.mean(axis=0)
+    scale = features.std(axis=0)
+    # Constant columns carry nothing; keep them at zero instead of dividing by zero
+    scale[scale < 1e-6] = 1.0
+    return (features - mean) / scale, mean, scale
+
+
+def fit_logistic(features, labels, classes, l2=1e-3, iterations=500, learning_rate=0.5):
+    """(weights, bias, mean, scale) of a multinomial logistic regression, by full-batch gradient descent.
+
+    labels are indices into classes. The loss is convex and the inputs are
+    standardized, so a fixed step size converges without tuning.
+    """
+    x, mean, scale = _standardize(np.asarray(features, dtype=np.float64))
+    targets = np.zeros((len(x), len(classes)))
+    targets[np.arange(len(x)), labels] = 1.0
+    weights = np.zeros((x.shape[1], len(classes)))
+    bias = np.zeros(len(classes))
+    for _ in range(iterations):
+        error = (softmax(x @ weights + bias) - targets) / len(x)
+        weights -= learning_rate * (x.T @ error + l2 * weights)
+        bias -= learning_rate * error.sum(axis=0)
+    return weights, bias, mean, scale
+
+
+def fit_centroid(features, labels, classes):
+    """(weights, bias, mean, scale) of a nearest-centroid classifier in linear form.
+
+    argmin |x - c|^2 equals argmax x·c - |c|^2 / 2, and the softmax of that
+    score is a Gaussian posterior with unit variance around each centroid.
+    """
+    x, mean, scale = _standardize(np.asarray(features, dtype=np.float64))
+    centroids = np.zeros((len(classes), x.shape[1]))
+    np.add.at(centroids, labels, x)
+    centroids /= np.bincount(labels, minlength=len(classes))[:, None]
+    return centroids.T, -0.5 * (centroids ** 2).sum(axis=1), mean, scale
+
+
+def fit(features, labels, feature_names, feature_version, kind='logistic', **options):
+    """FeatureModel fitted to (N, features) rows and N string labels."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown model kind {kind!r}; expected one of {', '.join(KINDS)}")
+    classes, indices = np.unique(np.asarray(labels, dtype=str), return_inverse=True)
+    fitter = fit_logistic if kind == 'logistic' else fit_centroid
+    weights, bias, mean, scale = fitter(features, indices, classes, **options)
+    return FeatureModel(classes, weights, bias, mean, scale, feature_names, feature_version, kind)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2 or argv[0] != 'info':
+        print("Usage: python model/recipeFeatureModel.py info <model.npz>")
+        sys.exit(1)
+
+    model = FeatureModel.load(argv[1])
+    print(f"{argv[1]}: {model.kind} model, {len(model.classes)} classes over {len(model.feature_names)} features "
+          f"(feature layout version {model.feature_version})")
+    print(f"  features: {', '.join(model.feature_names)}")
+    print(f"  classes:  {', '.join(model.classes)}")
+
+
+if __name__ == "__main__":
+    main()
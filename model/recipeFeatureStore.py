@@ -0,0 +1,182 @@
+"""
+Appendable on-disk store of per-image features, keyed by content hash.
+
+Records are fixed-width rows of a NumPy structured array written back to back
+in one binary file, which readers memory-map; a JSON sidecar next to it
+records the row layout so a file written with a different layout is never
+misread. The first field of every row is the SHA-256 digest of the raw image
+bytes, and an in-memory dict from digest to row number is the hash index.
+
+Any number of processes can share a store: appends are whole-row writes under
+an exclusive file lock (where the platform has fcntl), and readers pick up
+rows appended by others on the next lookup that misses. The first copy of a
+key wins; later puts of the same key are ignored.
+
+Usage: python model/recipeFeatureStore.py info <store.bin>
+"""
+
+import os
+import sys
+import json
+import hashlib
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are not locked
+    fcntl = None
+
+KEY_FIELD = ('key', 'u1', (32,))
+
+
+def content_digest(data):
+    """Raw SHA-256 digest of image bytes, the store's key."""
+    return hashlib.sha256(data).digest()
+
+
+def _descr(dtype):
+    # JSON round-trips tuples as lists, so compare layouts in list form
+    return json.loads(json.dumps(dtype.descr))
+
+
+class FeatureStore:
+    """Memory-mapped, append-only table of fixed-width feature records."""
+
+    def __init__(self, path, fields, version=1):
+        self.path = path
+        self.dtype = np.dtype([KEY_FIELD] + list(fields))
+        self.version = version
+        self._index = {}
+        self._records = np.zeros(0, dtype=self.dtype)
+        self._mapped_size = 0
+
+        self._check_schema()
+        self.refresh()
+
+    def _check_schema(self):
+        schema = {'version': self.version, 'dtype': _descr(self.dtype)}
+        meta_path = self.path + '.json'
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                existing = json.load(f)
+            if existing != schema:
+                raise ValueError(f"{self.path} was written with a different feature layout "
+                                 f"(version {existing.get('version')}); use a new path or delete it")
+            return
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(schema, f, indent=2)
+            f.write('\n')
+        os.replace(tmp_path, meta_path)
+        open(self.path, 'ab').close()
+
+    def refresh(self):
+        """Map rows appended since the last refresh, including those from other processes."""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        # A trailing partial row can only come from an interrupted append; ignore it
+        size -= size % self.dtype.itemsize
+        if size == self._mapped_size:
+            return
+
+        start = len(self._records)
+        if size:
+            self._records = np.memmap(self.path, dtype=self.dtype, mode='r', shape=(size // self.dtype.itemsize,))
+        self._mapped_size = size
+
+        keys = np.ascontiguousarray(self._records['key'][start:]).tobytes()
+        for offset in range(len(self._records) - start):
+            self._index.setdefault(keys[offset * 32:(offset + 1) * 32], start + offset)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    @property
+    def records(self):
+        """Read-only structured array of every row, for offline analysis."""
+        self.refresh()
+        return self._records
+
+    def get(self, key):
+        """The record for a digest, or None."""
+        row = self._index.get(key)
+        if row is None:
+            self.refresh()
+            row = self._index.get(key)
+            if row is None:
+                return None
+        return self._records[row]
+
+    def put(self, key, record):
+        self.put_many([key], [record])
+
+    def put_many(self, keys, records):
+        """Append records (sequences or structured rows of the feature fields) for new keys."""
+        with open(self.path, 'ab') as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                # Under the lock, so keys another process just appended are skipped too
+                self.refresh()
+                rows = self._new_rows(keys, records)
+                if len(rows):
+                    # Drop a partial row left by an interrupted writer so new rows stay aligned
+                    size = os.fstat(f.fileno()).st_size
+                    if size % self.dtype.itemsize:
+                        f.truncate(size - size % self.dtype.itemsize)
+                    f.write(rows.tobytes())
+                    f.flush()
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        self.refresh()
+        return len(rows)
+
+    def _new_rows(self, keys, records):
+        rows = np.zeros(len(keys), dtype=self.dtype)
+        fresh = np.zeros(len(keys), dtype=bool)
+        seen = set()
+        for i, (key, record) in enumerate(zip(keys, records)):
+            if key in self._index or key in seen:
+                continue
+            seen.add(key)
+            fresh[i] = True
+            rows['key'][i] = np.frombuffer(key, dtype=np.uint8)
+            for name in self.dtype.names[1:]:
+                rows[name][i] = record[name]
+        return rows[fresh]
+
+    def close(self):
+        self._records = np.zeros(0, dtype=self.dtype)
+        self._index.clear()
+        self._mapped_size = 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2 or argv[0] != 'info':
+        print("Usage: python model/recipeFeatureStore.py info <store.bin>")
+        sys.exit(1)
+
+    path = argv[1]
+    with open(path + '.json', 'r') as f:
+        schema = json.load(f)
+    dtype = np.dtype([(field[0], field[1], tuple(field[2])) if len(field) == 3 else tuple(field)
+                      for field in schema['dtype']])
+    rows = os.path.getsize(path) // dtype.itemsize
+    print(f"{path}: {rows} records of {dtype.itemsize} bytes (layout version {schema['version']})")
+    for field in schema['dtype']:
+        print(f"  {field[0]:<16} {field[1]} {tuple(field[2]) if len(field) == 3 else ''}")
+
+
+if __name__ == "__main__":
+    main()
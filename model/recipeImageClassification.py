@@ -1,81 +1,49 @@
+import time
+_IMPORT_START = time.perf_counter()
+
 import os
 import sys
 import json
+import atexit
+import base64
+import hashlib
+import functools
+import argparse
 import numpy as np
 import traceback
-import time
-from PIL import Image, UnidentifiedImageError, ImageStat
-import glob
+from PIL import Image, UnidentifiedImageError
 import shutil
 import random
+import sqlite3
+
+from imagePreprocessing import ImageContext
+from inferenceMetrics import StageTimer, metrics_enabled_from_env
+from keywordMatcher import KeywordTable
+from nearDuplicateCache import NearDuplicateCache, MAX_DISTANCE
+from recipeFeatureStore import FeatureStore, content_digest
+from recipeFeatureModel import FeatureModel
+from embeddingIndex import EmbeddingIndex, model_digest
+from structuredLogging import get_logger
+
+# Per-stage timings, printed as a JSON trailer when NUTRIHELP_METRICS=1
+metrics = StageTimer(metrics_enabled_from_env())
+if metrics.enabled:
+    metrics.record('import', time.perf_counter() - _IMPORT_START)
+
+# JSON lines in python_debug.log via a background writer; debug level is off unless NUTRIHELP_LOG_LEVEL=DEBUG
+logger = get_logger('nutrihelp.recipe')
 
 def debug_log(message):
-    try:
-        with open("python_debug.log", "a") as f:
-            f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - {message}\n")
-    except Exception as e:
-        sys.stderr.write(f"Could not write to debug log: {str(e)}\n")
+    logger.debug(message)
 
 def handle_error(error_message, exit_code=1):
     sys.stderr.write(f"ERROR: {error_message}\n")
-    try:
-        debug_log(f"ERROR: {error_message}")
-    except:
-        pass  # If debug logging fails, just continue
+    logger.error(error_message)
     sys.exit(exit_code)
 
-DISH_OVERRIDES = {
-    "chilli": "chili_con_carne",
-    "chili": "chili_con_carne",
-    "spag": "spaghetti_bolognese",
-    "bolognese": "spaghetti_bolognese",
-    "spaghetti": "spaghetti_bolognese",
-    "carbonara": "spaghetti_carbonara",
-    "lasagna": "lasagne",
-    "lasagne": "lasagne",
-    "curry": "chicken_curry",
-    "risotto": "mushroom_risotto",
-    "stir_fry": "stir_fried_vegetables",
-    "stirfry": "stir_fried_vegetables",
-    "steak": "steak",
-    "mac": "macaroni_cheese",
-    "macaroni": "macaroni_cheese",
-    "pizza": "pizza",
-    "burger": "hamburger",
-    "hamburger": "hamburger",
-    "salad": "greek_salad",
-    "cake": "chocolate_cake",
-    "soup": "miso_soup",
-    "cupcake": "cup_cakes",
-    "pasta": "spaghetti_bolognese",
-    "bread": "garlic_bread",
-    "bruschetta": "bruschetta",
-    "fish": "mussels",
-    "fried": "french_fries",
-    "rice": "fried_rice",
-    "tart": "apple_pie",
-    "pie": "apple_pie",
-    "icecream": "ice_cream",
-    "ice cream": "ice_cream",
-    # Add more food types
-    "sushi": "mussels",
-    "roll": "mussels",
-    "maki": "mussels",
-    "chicken": "chicken_wings",
-    "potato": "french_fries",
-    "wing": "chicken_wings",
-    "beef": "steak",
-    "pork": "baby_back_ribs",
-    "chocolate": "chocolate_cake",
-    "noodle": "ramen",
-    "dumpling": "dumplings",
-    "taco": "nachos",
-    "burrito": "nachos",
-    "cheese": "macaroni_cheese",
-    "egg": "eggs_benedict",
-    "yogurt": "frozen_yogurt",
-    "yoghurt": "frozen_yogurt"
-}
+# Filename keywords live in recipeKeywords.json; custom_food_types take priority over dish_overrides
+KEYWORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recipeKeywords.json')
+filename_keywords = KeywordTable(KEYWORDS_PATH, ['custom_food_types', 'dish_overrides'])
 
 class_mapping = {
     0: 'apple_pie',
@@ -124,12 +92,6 @@ class_mapping = {
     43: 'sushi'
 }
 
-custom_food_types = {
-    'sushi': 'sushi',
-    'bento': 'mussels',
-    'japanese': 'edamame'
-}
-
 # Improved color to food mapping - more specific and accurate categories
 color_to_food = {
     # Primarily red foods
@@ -192,7 +154,9 @@ except AttributeError:
             RESIZE_FILTER = Image.NEAREST
 
 def is_valid_image(image_path):
-    """Check if the file is a valid image."""
+    """Check if the file (a path or an ImageContext) is a valid image."""
+    if isinstance(image_path, ImageContext):
+        return image_path.has_image_signature
     try:
         with open(image_path, 'rb') as f:
             header = f.read(12)
@@ -205,7 +169,7 @@ def is_valid_image(image_path):
         return False
 
 def preprocess_image(image_path, target_size=(224, 224)):
-    """Preprocess an image for analysis."""
+    """Preprocess an image (a path or an ImageContext) for analysis."""
     try:
         debug_log(f"Attempting to preprocess image: {image_path}")
         
@@ -214,16 +178,8 @@ def preprocess_image(image_path, target_size=(224, 224)):
             return None
             
         try:
-            img = Image.open(image_path)
-            
-            if img.mode != "RGB":
-                img = img.convert("RGB")
-                
-            img = img.resize(target_size, RESIZE_FILTER)
-            
-            img_array = np.array(img)
-            
-            return img_array
+            context = ImageContext.of(image_path)
+            return context.model_input(target_size, RESIZE_FILTER)
             
         except UnidentifiedImageError:
             debug_log(f"Invalid image format: {image_path}")
@@ -246,15 +202,12 @@ def extract_filename_hints(filename):
     
     filename = os.path.splitext(filename)[0]
     
-    for key, value in custom_food_types.items():
-        if key in filename:
-            debug_log(f"Found custom food keyword '{key}' in filename '{filename}'")
-            return value
-    
-    for key, value in DISH_OVERRIDES.items():
-        if key in filename:
-            debug_log(f"Found keyword '{key}' in filename '{filename}'")
-            return value
+    match = filename_keywords.match(filename)
+    if match:
+        table, key, value = match
+        kind = "custom food keyword" if table == 'custom_food_types' else "keyword"
+        debug_log(f"Found {kind} '{key}' in filename '{filename}'")
+        return value
             
     return None
 
@@ -283,127 +236,608 @@ def get_color_name(r, g, b):
     else:
         return 'beige'
 
-def analyze_image_color(image_path):
-    """Analyze the dominant colors in an image."""
+def analyze_image_color(image_path, top_k=3):
+    """Dominant colours of an image (a path or an ImageContext) as [(color, share), ...].
+
+    Every thumbnail pixel is labelled through COLOR_LUT, so a plate of red sauce
+    and green salad reports both colours instead of the beige of their mean.
+    The most common colour comes first.
+    """
     try:
-        with Image.open(image_path) as img:
-            if img.mode != "RGB":
-                img = img.convert("RGB")
-                
-            img = img.resize((100, 100), RESIZE_FILTER)
-            
-            stat = ImageStat.Stat(img)
-            r_mean = stat.mean[0]
-            g_mean = stat.mean[1]
-            b_mean = stat.mean[2]
-            
-            dominant_color = get_color_name(r_mean, g_mean, b_mean)
-            
-            return dominant_color
+        pixels = ImageContext.of(image_path).thumbnail((100, 100), RESIZE_FILTER)
+        return top_colors(color_histogram(pixels), top_k)
     except Exception as e:
         debug_log(f"Error in color analysis: {str(e)}")
-        return 'beige'  # Default to most common food color
+        return [('beige', 1.0)]  # Default to most common food color
 
 def analyze_image_texture(image_path):
-    """Analyze the texture complexity of an image."""
+    """Analyze the texture complexity of an image (a path or an ImageContext)."""
     try:
-        with Image.open(image_path) as img:
-            if img.mode != "L":
-                img = img.convert("L")
-                
-            img = img.resize((100, 100), RESIZE_FILTER)
-            
-            img_array = np.array(img)
-            
-            grad_x = np.gradient(img_array, axis=0)
-            grad_y = np.gradient(img_array, axis=1)
-            
-            grad_mag = np.sqrt(grad_x**2 + grad_y**2)
-            
-            avg_grad = np.mean(grad_mag)
-            
-            if avg_grad < 5:
-                return 'smooth'  # Smooth texture (ice cream, soup)
-            elif avg_grad < 15:
-                return 'medium'  # Medium texture (pasta, rice)
-            else:
-                return 'complex'  # Complex texture (salad, stir fry)
+        img_array = ImageContext.of(image_path).grayscale((100, 100), RESIZE_FILTER)
+        
+        grad_x = np.gradient(img_array, axis=0)
+        grad_y = np.gradient(img_array, axis=1)
+        
+        grad_mag = np.sqrt(grad_x**2 + grad_y**2)
+        
+        avg_grad = np.mean(grad_mag)
+        
+        if avg_grad < 5:
+            return 'smooth'  # Smooth texture (ice cream, soup)
+        elif avg_grad < 15:
+            return 'medium'  # Medium texture (pasta, rice)
+        else:
+            return 'complex'  # Complex texture (salad, stir fry)
     except Exception as e:
         debug_log(f"Error in texture analysis: {str(e)}")
         return 'medium'  # Default to medium texture
 
-def find_image_file():
-    """Find the most recent image file in the uploads directory."""
-    debug_log("Looking for image files...")
+# Conditions in the same order as get_color_name; the first match wins
+COLOR_ORDER = ['red', 'green', 'yellow', 'orange', 'blue', 'white', 'black', 'brown', 'beige', 'dark']
+
+def color_indices(means):
+    """Vectorized get_color_name for an (N, 3) array of RGB values, as indices into COLOR_ORDER."""
+    r, g, b = means[:, 0], means[:, 1], means[:, 2]
+    conditions = [
+        (r > 200) & (g < 100) & (b < 100),
+        (r < 100) & (g > 150) & (b < 100),
+        (r > 200) & (g > 200) & (b < 100),
+        (r > 150) & (g > 100) & (b < 100),
+        (r < 100) & (g < 100) & (b > 150),
+        (r > 200) & (g > 200) & (b > 200),
+        (r < 50) & (g < 50) & (b < 50),
+        (r > 100) & (g > 50) & (b < 50),
+        (r > 150) & (g > 100) & (b > 100) & (np.abs(r - g) < 50) & (np.abs(r - b) < 50),
+        (r < 100) & (g < 100) & (b < 100),
+    ]
+    return np.select(conditions, range(len(COLOR_ORDER)), default=COLOR_ORDER.index('beige'))
+
+# Colour label for every RGB value quantized to 32 levels per channel, taken from the
+# get_color_name rules at the centre of each cell. Only cells straddling a threshold
+# can differ from the exact rules, by less than one cell (8 values).
+LUT_BITS = 5
+
+def build_color_lut(bits=LUT_BITS):
+    """Flat (2**(3 * bits),) uint8 table of COLOR_ORDER indices, indexed by (r << 2*bits) | (g << bits) | b."""
+    step = 256 >> bits
+    centres = np.arange(1 << bits) * step + (step - 1) / 2
+    r, g, b = np.meshgrid(centres, centres, centres, indexing='ij')
+    return color_indices(np.stack([r.ravel(), g.ravel(), b.ravel()], axis=1)).astype(np.uint8)
+
+COLOR_LUT = build_color_lut()
+
+def pixel_color_labels(pixels):
+    """COLOR_ORDER index of every pixel of a (..., 3) uint8 array, in one table lookup."""
+    quantized = pixels >> (8 - LUT_BITS)
+    index = ((quantized[..., 0].astype(np.intp) << (2 * LUT_BITS))
+             | (quantized[..., 1].astype(np.intp) << LUT_BITS)
+             | quantized[..., 2])
+    return COLOR_LUT[index]
+
+def color_histogram(pixels):
+    """Share of the pixels of a (..., 3) uint8 array that fall under each COLOR_ORDER colour."""
+    labels = pixel_color_labels(pixels).ravel()
+    return np.bincount(labels, minlength=len(COLOR_ORDER)) / max(1, labels.size)
+
+def color_histograms(thumbnails):
+    """(N, len(COLOR_ORDER)) colour shares of an (N, H, W, 3) uint8 batch."""
+    count = len(thumbnails)
+    labels = pixel_color_labels(thumbnails).reshape(count, -1).astype(np.intp)
+    # Offset each image into its own block of bins so one bincount covers the batch
+    labels += np.arange(count, dtype=np.intp)[:, None] * len(COLOR_ORDER)
+    counts = np.bincount(labels.ravel(), minlength=count * len(COLOR_ORDER))
+    return counts.reshape(count, len(COLOR_ORDER)) / max(1, labels.shape[1])
+
+def top_colors(shares, top_k=3):
+    """[(color, share), ...] for the top_k colours present, most common first; ties keep COLOR_ORDER."""
+    order = np.argsort(-shares, kind='stable')[:top_k]
+    return [(COLOR_ORDER[i], float(shares[i])) for i in order if shares[i] > 0]
+
+def texture_names(avg_grads):
+    """Vectorized texture thresholds of analyze_image_texture."""
+    return np.select([avg_grads < 5, avg_grads < 15], ['smooth', 'medium'], default='complex')
+
+def luma(thumbnails):
+    """(N, H, W) float32 greyscale of an (N, H, W, 3) uint8 batch."""
+    # Same integer luma transform as PIL's convert("L"), so results match the single-image path
+    gray = (thumbnails[..., 0].astype(np.uint32) * 19595
+            + thumbnails[..., 1].astype(np.uint32) * 38470
+            + thumbnails[..., 2].astype(np.uint32) * 7471 + 0x8000) >> 16
+    return gray.astype(np.float32)
+
+def gradient_magnitudes(thumbnails):
+    """(N, H, W) gradient magnitude of the greyscale version of each (N, H, W, 3) uint8 thumbnail."""
+    gray = luma(thumbnails)
+    grad_x = np.gradient(gray, axis=1)
+    grad_y = np.gradient(gray, axis=2)
+    return np.sqrt(grad_x * grad_x + grad_y * grad_y)
+
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+@functools.lru_cache(maxsize=8)
+def _pooling_matrix(size, cells):
+    """(cells, size) matrix that averages size samples into cells nearly equal runs."""
+    edges = np.linspace(0, size, cells + 1).astype(np.intp)
+    matrix = np.zeros((cells, size), dtype=np.float32)
+    for cell in range(cells):
+        matrix[cell, edges[cell]:edges[cell + 1]] = 1.0 / (edges[cell + 1] - edges[cell])
+    return matrix
+
+def dhashes(thumbnails):
+    """64-bit difference hash of each (N, H, W, 3) uint8 thumbnail, as a uint64 array.
+
+    The greyscale image is averaged down to 8 rows of 9 cells and each bit
+    records whether a cell is brighter than its left neighbour, so re-encoded
+    or resized copies of a photo land within a few bits of each other.
+    """
+    height, width = thumbnails.shape[1:3]
+    gray = thumbnails.astype(np.float32) @ LUMA_WEIGHTS
+    # Both averages as matrix products: (8, H) @ (N, H, W) @ (W, 9)
+    cells = _pooling_matrix(height, 8) @ gray @ _pooling_matrix(width, 9).T
+    bits = (cells[:, :, 1:] > cells[:, :, :-1]).reshape(len(thumbnails), 64)
+    return np.packbits(bits, axis=1).view('>u8').ravel().astype(np.uint64)
+
+def image_signature(image_path):
+    """(dHash, mean RGB) of an image (a path or an ImageContext), or None if it cannot be decoded."""
+    try:
+        thumbnail = ImageContext.of(image_path).thumbnail((100, 100), RESIZE_FILTER)[None]
+        return int(dhashes(thumbnail)[0]), channel_means(thumbnail)[0]
+    except Exception as e:
+        debug_log(f"Error computing image signature: {str(e)}")
+        return None
+
+def stack_thumbnails(images, size=(100, 100)):
+    """Stack paths, ImageContexts or (H, W, 3) uint8 arrays into an (N, H, W, 3) uint8 batch.
+
+    Returns the batch and a boolean mask of the images that could be decoded.
+    """
+    batch = np.zeros((len(images), size[1], size[0], 3), dtype=np.uint8)
+    valid = np.ones(len(images), dtype=bool)
+    for i, image in enumerate(images):
+        try:
+            if isinstance(image, np.ndarray):
+                if image.shape[:2] != (size[1], size[0]):
+                    image = np.asarray(Image.fromarray(image).convert("RGB").resize(size, RESIZE_FILTER))
+                batch[i] = image
+            else:
+                batch[i] = ImageContext.of(image).thumbnail(size, RESIZE_FILTER)
+        except Exception as e:
+            debug_log(f"Could not load image {i} for batch analysis: {str(e)}")
+            valid[i] = False
+    return batch, valid
+
+# Per-image features kept in the feature store (NUTRIHELP_FEATURE_STORE), so the rule stage,
+# the feedback tools and rule experiments can reuse them without decoding the image again.
+# Bump FEATURE_VERSION whenever a field or the way it is computed changes.
+FEATURE_VERSION = 2
+FEATURE_THUMBNAIL_SIZE = (32, 32)
+FEATURE_FIELDS = [
+    ('mean_rgb', '<f4', (3,)),
+    ('color_shares', '<f4', (len(COLOR_ORDER),)),
+    ('gradient_mean', '<f4'),
+    ('gradient_std', '<f4'),
+    ('dhash', '<u8'),
+    ('thumbnail', 'u1', (FEATURE_THUMBNAIL_SIZE[1], FEATURE_THUMBNAIL_SIZE[0], 3)),
+]
+FEATURE_DTYPE = np.dtype(FEATURE_FIELDS)
+
+def open_feature_store(path=None):
+    """The feature store at path (default NUTRIHELP_FEATURE_STORE), or None when unset or unusable."""
+    path = path or os.environ.get('NUTRIHELP_FEATURE_STORE')
+    if not path:
+        return None
+    try:
+        return FeatureStore(path, FEATURE_FIELDS, FEATURE_VERSION)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Feature store disabled: {str(e)}")
+        return None
+
+def channel_means(thumbnails):
+    """(N, 3) RGB means of an (N, H, W, 3) uint8 batch."""
+    pixels = thumbnails.reshape(len(thumbnails), -1, 3)
+    # A float32 matmul sums exactly while H * W * 255 < 2**24 and is far faster than a strided reduction
+    sums = np.ones(pixels.shape[1], dtype=np.float32) @ pixels.astype(np.float32)
+    return sums.astype(np.float64) / pixels.shape[1]
+
+def _file_fingerprint(path):
+    try:
+        stat = os.stat(path)
+        return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        return None
+
+def duplicate_cache_namespace(confidence_threshold=None):
+    """Fingerprint of the rules and model settings a cached prediction depends on."""
+    settings = {
+        'rules': RULES_VERSION,
+        'color_to_food': color_to_food,
+        'food_categories': food_categories,
+        'cascade': confidence_threshold,
+        'feature_model': _file_fingerprint(FEATURE_MODEL_PATH) if FEATURE_MODEL_PATH else None,
+    }
+    if confidence_threshold is not None:
+        settings['model'] = [CASCADE_RUNTIME, _file_fingerprint(CASCADE_MODEL_PATH)]
+        settings['embedding_index'] = [_file_fingerprint(EMBEDDING_INDEX_PATH) if EMBEDDING_INDEX_PATH else None,
+                                       KNN_NEIGHBOURS, KNN_WEIGHT]
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+
+def open_duplicate_cache(path=None, confidence_threshold=None, max_distance=None):
+    """Near-duplicate cache backed by the SQLite file at path (default NUTRIHELP_DUPLICATE_CACHE), or None."""
+    path = path or os.environ.get('NUTRIHELP_DUPLICATE_CACHE')
+    if not path:
+        return None
+    if max_distance is None:
+        max_distance = int(os.environ.get('NUTRIHELP_DUPLICATE_DISTANCE', MAX_DISTANCE))
+    try:
+        return NearDuplicateCache(duplicate_cache_namespace(confidence_threshold),
+                                  max_distance=max_distance, db_path=path)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        logger.warning(f"Near-duplicate cache disabled: {str(e)}")
+        return None
+
+def compute_features(thumbnails, with_thumbnails=True):
+    """FEATURE_DTYPE records for an (N, 100, 100, 3) uint8 thumbnail batch.
+
+    The small thumbnails are only needed for storage and are left blank without with_thumbnails.
+    """
+    features = np.zeros(len(thumbnails), dtype=FEATURE_DTYPE)
+    features['mean_rgb'] = channel_means(thumbnails)
+    features['color_shares'] = color_histograms(thumbnails)
+    magnitudes = gradient_magnitudes(thumbnails)
+    features['gradient_mean'] = magnitudes.mean(axis=(1, 2), dtype=np.float64)
+    features['gradient_std'] = magnitudes.std(axis=(1, 2), dtype=np.float64)
+    features['dhash'] = dhashes(thumbnails)
+    if with_thumbnails:
+        for i, thumbnail in enumerate(thumbnails):
+            features['thumbnail'][i] = np.asarray(Image.fromarray(thumbnail).resize(FEATURE_THUMBNAIL_SIZE, RESIZE_FILTER))
+    return features
+
+def image_features(images, store=None):
+    """Features for paths, ImageContexts or uint8 arrays, reusing and filling the store.
+
+    Returns the FEATURE_DTYPE records and a boolean mask of the images that
+    could be decoded. Arrays have no upload bytes to hash and are never stored.
+    """
+    features = np.zeros(len(images), dtype=FEATURE_DTYPE)
+    valid = np.ones(len(images), dtype=bool)
+    sources = list(images)
+    keys = [None] * len(images)
+    missing = []
+    for i, image in enumerate(images):
+        if store is not None and not isinstance(image, np.ndarray):
+            try:
+                sources[i] = ImageContext.of(image)
+                keys[i] = content_digest(sources[i].data)
+            except OSError:
+                pass  # stack_thumbnails reports it as undecodable
+            else:
+                stored = store.get(keys[i])
+                if stored is not None:
+                    features[i] = tuple(stored[name] for name in FEATURE_DTYPE.names)
+                    continue
+        missing.append(i)
+
+    if missing:
+        thumbnails, decoded = stack_thumbnails([sources[i] for i in missing])
+        computed = compute_features(thumbnails, with_thumbnails=store is not None)
+        features[missing] = computed
+        valid[missing] = decoded
+        if store is not None:
+            new = [j for j, i in enumerate(missing) if decoded[j] and keys[i] is not None]
+            if new:
+                store.put_many([keys[missing[j]] for j in new], computed[new])
+    return features, valid
+
+# Input columns of the feature model, in order
+FEATURE_MODEL_INPUTS = ([f'color_share_{name}' for name in COLOR_ORDER]
+                        + ['mean_r', 'mean_g', 'mean_b', 'gradient_mean', 'gradient_std'])
+
+def feature_matrix(features):
+    """(N, len(FEATURE_MODEL_INPUTS)) float32 feature model input from FEATURE_DTYPE records."""
+    return np.column_stack([features['color_shares'], features['mean_rgb'],
+                            features['gradient_mean'], features['gradient_std']]).astype(np.float32)
+
+# How often each kind of rule names the right dish family; a rule that then picks
+# one of k dishes at random is right about reliability / k of the time
+JAPANESE_CONTEXT_RELIABILITY = 0.6
+COLOR_TEXTURE_RELIABILITY = 0.8
+COLOR_ONLY_RELIABILITY = 0.4
+
+# Bump RULES_VERSION whenever rule_prediction changes, so cached near-duplicate answers are dropped
+RULES_VERSION = 1
+
+def _pick(options, reliability, rng):
+    return rng.choice(options), reliability / len(options)
+
+def has_japanese_context(file_name):
+    return any(japan_term in file_name.lower() for japan_term in ["japan", "japanese", "nihon", "nippon", "tokyo"])
+
+def rule_prediction(dominant_color, texture_type, file_name='', color_share=1.0, seed=None):
+    """Pick a dish from the colour/texture rules once filename hints have been ruled out.
+
+    Returns (prediction, confidence), where confidence estimates how likely the
+    rule's answer is to be right; the random fallback has confidence 0. Colour
+    rules are scaled by color_share, the fraction of the image in dominant_color.
+    Random choices are seeded with seed (the image's perceptual hash), so the
+    same image, or a near-duplicate, always gets the same answer.
+    """
+    rng = random.Random(seed) if seed is not None else random
+    if has_japanese_context(file_name):
+        debug_log(f"Japanese food context detected in filename: {file_name}")
+        return _pick(food_categories['japanese'], JAPANESE_CONTEXT_RELIABILITY, rng)
     
-    if not os.path.exists('uploads'):
-        os.makedirs('uploads')
-        debug_log("Created uploads directory")
-        
-    if os.path.exists('uploads/image.jpg'):
-        if is_valid_image('uploads/image.jpg'):
-            debug_log("Found valid image.jpg in uploads directory")
-            return 'uploads/image.jpg'
-        else:
-            debug_log("Found image.jpg but it's not a valid image file")
+    prediction = None
     
-    try:
-        uploaded_files = glob.glob('uploads/*.*')
-        debug_log(f"Files in uploads directory: {uploaded_files}")
+    if dominant_color == 'green' and texture_type == 'complex':
+        prediction, confidence = _pick(food_categories['salad'], COLOR_TEXTURE_RELIABILITY, rng)
+        debug_log(f"Green + complex texture detected: classified as {prediction}")
         
-        if not uploaded_files:
-            handle_error("No files found in uploads directory")
-
-        image_files = [f for f in uploaded_files if f.lower().endswith(('.jpg', '.jpeg', '.png')) and is_valid_image(f)]
-        debug_log(f"Image files found: {image_files}")
+    elif dominant_color == 'beige' and texture_type in ['regular', 'medium']:
+        prediction, confidence = _pick(food_categories['bread'], COLOR_TEXTURE_RELIABILITY, rng)
+        debug_log(f"Beige + regular texture detected: classified as {prediction}")
         
-        if not image_files:
-            handle_error("No valid image files found in uploads directory")
-            
-        latest_file = max(image_files, key=os.path.getmtime)
-        debug_log(f"Selected most recent image file: {latest_file}")
+    elif dominant_color == 'dark' and texture_type == 'smooth':
+        prediction, confidence = _pick(food_categories['soup'], COLOR_TEXTURE_RELIABILITY, rng)
+        debug_log(f"Dark + smooth texture detected: classified as {prediction}")
         
-        return latest_file
-            
-    except Exception as e:
-        handle_error(f"Error finding image file: {str(e)}")
+    elif dominant_color in ['brown', 'beige'] and texture_type == 'medium':
+        prediction, confidence = _pick(food_categories['pasta'], COLOR_TEXTURE_RELIABILITY, rng)
+        debug_log(f"Brown/beige + medium texture detected: classified as {prediction}")
+        
+    elif dominant_color == 'white' and texture_type == 'smooth':
+        prediction, confidence = _pick(['ice_cream', 'frozen_yogurt'], COLOR_TEXTURE_RELIABILITY, rng)
+        debug_log(f"White + smooth texture detected: classified as {prediction}")
+        
+    elif dominant_color == 'red' and texture_type in ['medium', 'complex']:
+        prediction, confidence = _pick(['steak', 'baby_back_ribs', 'chicken_curry'], COLOR_TEXTURE_RELIABILITY, rng)
+        debug_log(f"Red + medium/complex texture detected: classified as {prediction}")
+        
+    elif dominant_color in ['white', 'beige'] and texture_type == 'complex':
+        prediction, confidence = 'sushi', COLOR_TEXTURE_RELIABILITY  # Best substitute for sushi
+        debug_log(f"White/beige + complex texture detected: possible sushi, classified as {prediction}")
+        
+    if not prediction and dominant_color in color_to_food:
+        food_options = color_to_food[dominant_color]
+        prediction, confidence = _pick(food_options, COLOR_ONLY_RELIABILITY, rng)
+        debug_log(f"Selected {prediction} from {dominant_color} foods based on color only")
+
+    if prediction:
+        return prediction, confidence * color_share
+        
+    categories = list(food_categories.keys())
+    random_category = rng.choice(categories)
+    fallback_prediction = rng.choice(food_categories[random_category])
+    debug_log(f"Using random category ({random_category}) fallback prediction: {fallback_prediction}")
+    return fallback_prediction, 0.0
+
+PREDICTION_MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'prediction_models')
+
+# Feature model: a linear classifier over the stored features, trained from feedback by
+# tools/feedback/train_feature_model.py. When present it replaces the colour/texture rules;
+# set NUTRIHELP_FEATURE_MODEL to an empty string to keep the rules.
+FEATURE_MODEL_PATH = os.environ.get('NUTRIHELP_FEATURE_MODEL',
+                                    os.path.join(PREDICTION_MODELS_DIR, 'recipe_feature_model.npz'))
+
+_feature_model = None
+
+def load_feature_model():
+    """The feature model, loaded on first use and kept resident; None if there is no usable one."""
+    global _feature_model
+    if _feature_model is None:
+        _feature_model = False
+        if FEATURE_MODEL_PATH and os.path.exists(FEATURE_MODEL_PATH):
+            try:
+                model = FeatureModel.load(FEATURE_MODEL_PATH)
+                if model.feature_names != FEATURE_MODEL_INPUTS or model.feature_version != FEATURE_VERSION:
+                    raise ValueError("it was trained on a different feature layout; retrain it")
+                _feature_model = model
+                debug_log(f"Loaded feature model {FEATURE_MODEL_PATH} ({model.kind}, {len(model.classes)} classes)")
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Feature model {FEATURE_MODEL_PATH} unavailable, using the colour/texture rules: {str(e)}")
+    return _feature_model or None
+
+# Cascade: rule answers below the confidence threshold are escalated to the CNN
+# written by tools/image_classification/fix_model.py. Filename hints always answer directly.
+# Rule confidences are reliability / dishes * color_share, so they top out at 0.4 (soup,
+# ice cream) and 0.8 (sushi); 3-dish texture rules reach 0.27, pasta 0.2, colour-only
+# rules 0.13 and Japanese filenames 0.15. The default of 0.2 therefore escalates every
+# colour-only or Japanese-filename answer and any texture answer whose dominant colour
+# covers less than 3/4 of the image (1/2 for soup and ice cream). The expected escalation
+# rate is the share of uploads without a clean colour/texture match; at 0.5 it was 100%.
+# Compare thresholds on real feedback with tools/feedback/replay_feedback.py --cascade.
+CASCADE_MODEL_PATH = os.environ.get('NUTRIHELP_RECIPE_MODEL',
+                                    os.path.join(PREDICTION_MODELS_DIR, 'best_model_class.hdf5'))
+CASCADE_RUNTIME = os.environ.get('NUTRIHELP_RECIPE_RUNTIME', 'keras')
+# With workers the cascade model runs in a workerPool.WorkerPool; only tflite workers share the weights
+CASCADE_WORKERS = int(os.environ.get('NUTRIHELP_RECIPE_WORKERS', 0))
+CASCADE_POOL_RUNTIME = os.environ.get('NUTRIHELP_RECIPE_POOL_RUNTIME', 'tflite')
+CONFIDENCE_THRESHOLD = float(os.environ.get('NUTRIHELP_RECIPE_CONFIDENCE', 0.2))
+MODEL_INPUT_SIZE = (224, 224)
+ESCALATION_BATCH_SIZE = 32
+
+# Embedding index: example photos of dishes embedded by the cascade model's penultimate layer,
+# written by tools/image_classification/add_examples.py. Its k-NN vote is blended with the
+# model's softmax, so dishes added there are recognised without retraining the model.
+EMBEDDING_INDEX_PATH = os.environ.get('NUTRIHELP_EMBEDDING_INDEX',
+                                      os.path.join(PREDICTION_MODELS_DIR, 'recipe_embeddings.npz'))
+KNN_NEIGHBOURS = int(os.environ.get('NUTRIHELP_KNN_NEIGHBOURS', 5))
+KNN_WEIGHT = float(os.environ.get('NUTRIHELP_KNN_WEIGHT', 0.5))
+
+_cascade_model = None
+_embedding_index = None
+
+def cascade_enabled_from_env():
+    return os.environ.get('NUTRIHELP_RECIPE_CASCADE', '').lower() in ('1', 'true', 'yes')
+
+def load_cascade_model():
+    """The escalation model, loaded on first use and kept resident; None if it cannot be loaded."""
+    global _cascade_model
+    if _cascade_model is None:
+        try:
+            with metrics.stage('model_load'):
+                if CASCADE_WORKERS > 0:
+                    from workerPool import WorkerPool
+                    _cascade_model = WorkerPool(CASCADE_MODEL_PATH, CASCADE_WORKERS, runtime=CASCADE_POOL_RUNTIME)
+                    atexit.register(_cascade_model.close)
+                else:
+                    from modelRuntime import load_runtime
+                    _cascade_model = load_runtime(CASCADE_MODEL_PATH, CASCADE_RUNTIME)
+            debug_log(f"Loaded cascade model {CASCADE_MODEL_PATH} "
+                      f"({f'{CASCADE_WORKERS} {CASCADE_POOL_RUNTIME} workers' if CASCADE_WORKERS > 0 else CASCADE_RUNTIME})")
+        except Exception as e:
+            logger.warning(f"Cascade model unavailable, keeping rule predictions: {str(e)}")
+            _cascade_model = False
+    return _cascade_model or None
+
+def load_embedding_index():
+    """The embedding index, loaded on first use and kept resident; None if there is no usable one."""
+    global _embedding_index
+    if _embedding_index is None:
+        _embedding_index = False
+        if EMBEDDING_INDEX_PATH and os.path.exists(EMBEDDING_INDEX_PATH):
+            try:
+                index = EmbeddingIndex.load(EMBEDDING_INDEX_PATH)
+                if index.model != model_digest(CASCADE_MODEL_PATH):
+                    raise ValueError("it was built with a different cascade model; rebuild it")
+                _embedding_index = index if len(index) else False
+                debug_log(f"Loaded embedding index {EMBEDDING_INDEX_PATH} ({len(index)} examples, {index.mode})")
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Embedding index {EMBEDDING_INDEX_PATH} unavailable, using the model alone: {str(e)}")
+    return _embedding_index or None
+
+def combine_predictions(probabilities, vote, knn_weight=KNN_WEIGHT):
+    """(class, score) from the model's softmax row blended with a k-NN vote of {class: share}.
+
+    Classes only known to the index score from the vote alone. Without a vote
+    this is the model's top mapped class and its probability.
+    """
+    head_weight = 1.0 - knn_weight if vote else 1.0
+    scores = {class_mapping[i]: head_weight * float(p) for i, p in enumerate(probabilities) if i in class_mapping}
+    for label, share in vote.items():
+        scores[label] = scores.get(label, 0.0) + knn_weight * share
+    if not scores:
+        return None, 0.0
+    best = max(scores, key=scores.get)
+    return best, scores[best]
+
+def model_input_batch(images):
+    """(N, 224, 224, 3) float32 batch in [0, 1] from paths, ImageContexts or uint8 arrays.
+
+    Returns the batch and a boolean mask of the images that could be decoded.
+    """
+    batch = np.zeros((len(images), MODEL_INPUT_SIZE[1], MODEL_INPUT_SIZE[0], 3), dtype=np.float32)
+    valid = np.ones(len(images), dtype=bool)
+    for i, image in enumerate(images):
+        try:
+            if isinstance(image, np.ndarray):
+                pixels = np.asarray(Image.fromarray(image).convert("RGB").resize(MODEL_INPUT_SIZE, RESIZE_FILTER))
+            else:
+                pixels = ImageContext.of(image).model_input(MODEL_INPUT_SIZE, RESIZE_FILTER)
+            np.divide(pixels, np.float32(255.0), out=batch[i], dtype=np.float32)
+        except Exception as e:
+            debug_log(f"Could not load image {i} for the cascade model: {str(e)}")
+            valid[i] = False
+    return batch, valid
+
+def escalate(images, rule_results):
+    """Re-check low-confidence (prediction, confidence) rule results with the cascade model.
+
+    Returns one prediction per image: the model's answer (blended with the
+    embedding index's k-NN vote when there is an index) when it is at least
+    as confident as the rule, otherwise the rule's. Rule answers are kept
+    as-is when the model is unavailable. A worker pool gets every batch at
+    once, so the batches run side by side.
+    """
+    runtime = load_cascade_model()
+    if runtime is None:
+        return [prediction for prediction, _ in rule_results]
+    # TFLite exports and worker pools have no embedding output, so they answer with the softmax alone
+    index = load_embedding_index() if hasattr(runtime, 'predict_with_embeddings') else None
+    submit = getattr(runtime, 'submit', None)
+
+    def input_batches():
+        for start in range(0, len(images), ESCALATION_BATCH_SIZE):
+            with metrics.stage('model_input'):
+                batch, valid = model_input_batch(images[start:start + ESCALATION_BATCH_SIZE])
+            yield start, valid, batch
 
-def predict_class(image_path=None):
-    """Predict food class from image."""
+    batches = input_batches()
+    if submit is not None:
+        # Every batch is queued before the first result is awaited, so the pool's workers share them
+        batches = [(start, valid, submit(batch)) for start, valid, batch in batches]
+
+    predictions = []
+    for start, valid, batch in batches:
+        with metrics.stage('model_predict'):
+            if submit is not None:
+                probabilities = batch.result()
+            elif index is not None:
+                probabilities, embeddings = runtime.predict_with_embeddings(batch)
+            else:
+                probabilities = runtime.predict(batch)
+        if index is not None:
+            with metrics.stage('knn'):
+                votes = index.vote(embeddings, KNN_NEIGHBOURS)
+        else:
+            votes = [{}] * len(probabilities)
+        for row, vote, decoded, (rule_class, rule_confidence) in zip(
+                probabilities, votes, valid, rule_results[start:start + ESCALATION_BATCH_SIZE]):
+            model_class, score = combine_predictions(row, vote)
+            if decoded and model_class is not None and score >= rule_confidence:
+                debug_log(f"Cascade model: {model_class} ({score:.3f}) over rule {rule_class} ({rule_confidence:.3f})")
+                predictions.append(model_class)
+            else:
+                predictions.append(rule_class)
+    return predictions
+
+def _hint_name(image):
+    if isinstance(image, ImageContext):
+        return os.path.basename(image.path) if image.path else ''
+    if isinstance(image, (str, os.PathLike)):
+        return os.path.basename(image)
+    return ''
+
+def predict_class(image_path=None, original_filename=None, confidence_threshold=None, feature_store=None,
+                  duplicate_cache=None):
+    """Predict food class from image.
+
+    image_path is a file path, raw image bytes or an ImageContext; original_filename
+    is the name the image was uploaded under and is checked for keyword hints first.
+    Without a hint, a trained feature model (FEATURE_MODEL_PATH) classifies the
+    image's features, or the colour/texture rules do when there is none.
+    With a confidence_threshold, rule or feature model answers less confident than it are escalated
+    to the cascade model; at the default CONFIDENCE_THRESHOLD every colour-only rule answer is,
+    and only clean colour/texture matches stay on the rules. With a feature_store, colour and texture come from the
+    stored features of an image seen before instead of a fresh decode. With a
+    duplicate_cache, a near-duplicate of an earlier image gets that image's answer
+    without the analysis and model stages.
+    """
     debug_log("Starting prediction process")
     
-    if not image_path:
-        image_path = find_image_file()
-        debug_log(f"Using image file: {image_path}")
+    if image_path is None:
+        handle_error("No image provided")
     
     try:
-        if not os.path.exists(image_path):
-            handle_error(f"Cannot open image file: {image_path} (file does not exist)")
+        if isinstance(image_path, (bytes, bytearray, ImageContext)):
+            context = ImageContext.of(image_path)
+        else:
+            context = None
+            if not os.path.exists(image_path):
+                handle_error(f"Cannot open image file: {image_path} (file does not exist)")
         
-        file_name = os.path.basename(image_path)
+        file_name = _hint_name(image_path)
         debug_log(f"Analyzing file: {file_name}")
             
-        if "sushi" in file_name.lower():
-            debug_log(f"Detected sushi in filename: {file_name}")
-            return "sushi"  # Return sushi as match for sushi
-            
         filename_hint = None
         
-        if os.path.exists('uploads/original_filename.txt'):
-            try:
-                with open('uploads/original_filename.txt', 'r') as f:
-                    original_filename = f.read().strip()
-                    if "sushi" in original_filename.lower():
-                        debug_log(f"Detected sushi in original filename: {original_filename}")
-                        return "sushi"  # Return sushi as match for sushi
-                        
-                    filename_hint = extract_filename_hints(original_filename)
-                    debug_log(f"Filename hint from original_filename.txt: {original_filename} -> {filename_hint}")
-            except Exception as e:
-                debug_log(f"Error reading original_filename.txt: {str(e)}")
+        # Sushi and other custom_food_types keywords win over dish_overrides here
+        if original_filename:
+            filename_hint = extract_filename_hints(original_filename)
+            debug_log(f"Filename hint from original filename: {original_filename} -> {filename_hint}")
                 
         if not filename_hint:
-            filename_hint = extract_filename_hints(file_name)
+            with metrics.stage('filename_hints'):
+                filename_hint = extract_filename_hints(file_name)
             debug_log(f"Filename hint from file name: {file_name} -> {filename_hint}")
             
         if filename_hint:
@@ -412,83 +846,205 @@ def predict_class(image_path=None):
         
         debug_log("Using image analysis for prediction (no model)")
         
-        dominant_color = analyze_image_color(image_path)
-        debug_log(f"Dominant color detected: {dominant_color}")
+        # Read once; the first analyzer decodes and both share the same thumbnail
+        if context is None:
+            with metrics.stage('read'):
+                context = ImageContext(image_path)
         
-        texture_type = analyze_image_texture(image_path)
-        debug_log(f"Texture type detected: {texture_type}")
-        
-        if any(japan_term in file_name.lower() for japan_term in ["japan", "japanese", "nihon", "nippon", "tokyo"]):
-            debug_log(f"Japanese food context detected in filename: {file_name}")
-            prediction = random.choice(food_categories['japanese'])
-            return prediction
+        # The Japanese rule depends on the file name, so neither the feature model nor
+        # look-alikes in the cache can answer for it
+        japanese_context = has_japanese_context(file_name)
+        feature_model = None if japanese_context else load_feature_model()
+        features = None
+        if feature_store is not None or feature_model is not None:
+            with metrics.stage('features'):
+                features, decoded = image_features([context], feature_store)
+            signature = (int(features['dhash'][0]), features['mean_rgb'][0]) if decoded[0] else None
+        else:
+            with metrics.stage('hash'):
+                signature = image_signature(context)
         
-        prediction = None
+        use_cache = duplicate_cache is not None and signature is not None and not japanese_context
+        if use_cache:
+            with metrics.stage('near_duplicate'):
+                cached = duplicate_cache.get(*signature)
+            if cached is not None:
+                debug_log(f"Near-duplicate of an earlier image ({cached[1]} bits apart): {cached[0]}")
+                return cached[0]
         
-        if dominant_color == 'green' and texture_type == 'complex':
-            prediction = random.choice(food_categories['salad'])
-            debug_log(f"Green + complex texture detected: classified as {prediction}")
-            
-        elif dominant_color == 'beige' and texture_type in ['regular', 'medium']:
-            prediction = random.choice(food_categories['bread'])
-            debug_log(f"Beige + regular texture detected: classified as {prediction}")
-            
-        elif dominant_color == 'dark' and texture_type == 'smooth':
-            prediction = random.choice(food_categories['soup'])
-            debug_log(f"Dark + smooth texture detected: classified as {prediction}")
-            
-        elif dominant_color in ['brown', 'beige'] and texture_type == 'medium':
-            prediction = random.choice(food_categories['pasta'])
-            debug_log(f"Brown/beige + medium texture detected: classified as {prediction}")
-            
-        elif dominant_color == 'white' and texture_type == 'smooth':
-            prediction = random.choice(['ice_cream', 'frozen_yogurt'])
-            debug_log(f"White + smooth texture detected: classified as {prediction}")
-            
-        elif dominant_color == 'red' and texture_type in ['medium', 'complex']:
-            prediction = random.choice(['steak', 'baby_back_ribs', 'chicken_curry'])
-            debug_log(f"Red + medium/complex texture detected: classified as {prediction}")
-            
-        elif dominant_color in ['white', 'beige'] and texture_type == 'complex':
-            prediction = 'sushi'  # Best substitute for sushi
-            debug_log(f"White/beige + complex texture detected: possible sushi, classified as {prediction}")
-            
-        if not prediction and dominant_color in color_to_food:
-            food_options = color_to_food[dominant_color]
-            prediction = random.choice(food_options)
-            debug_log(f"Selected {prediction} from {dominant_color} foods based on color only")
-
-        if prediction:
-            return prediction
+        if feature_model is not None and decoded[0]:
+            with metrics.stage('feature_model'):
+                labels, confidences = feature_model.predict(feature_matrix(features))
+            prediction, confidence = str(labels[0]), float(confidences[0])
+            debug_log(f"Feature model prediction: {prediction} ({confidence:.3f})")
+        else:
+            if features is not None:
+                if decoded[0]:
+                    colors = top_colors(features['color_shares'][0].astype(np.float64))
+                    texture_type = str(texture_names(features['gradient_mean'].astype(np.float64))[0])
+                else:
+                    # Same defaults as the analyzers use on a decode error
+                    colors, texture_type = [('beige', 1.0)], 'medium'
+            else:
+                with metrics.stage('color'):
+                    colors = analyze_image_color(context)
+                with metrics.stage('texture'):
+                    texture_type = analyze_image_texture(context)
+            dominant_color, color_share = colors[0]
+            debug_log(f"Dominant colors detected: {', '.join(f'{name} {share:.0%}' for name, share in colors)}")
+            debug_log(f"Texture type detected: {texture_type}")
             
-        categories = list(food_categories.keys())
-        random_category = random.choice(categories)
-        fallback_prediction = random.choice(food_categories[random_category])
-        debug_log(f"Using random category ({random_category}) fallback prediction: {fallback_prediction}")
-        return fallback_prediction
+            prediction, confidence = rule_prediction(dominant_color, texture_type, file_name, color_share,
+                                                     seed=signature[0] if signature else 0)
+        if confidence_threshold is not None and confidence < confidence_threshold:
+            debug_log(f"Rule confidence {confidence:.3f} below {confidence_threshold}; escalating to model")
+            prediction = escalate([context], [(prediction, confidence)])[0]
+        if use_cache:
+            duplicate_cache.put(signature[0], prediction, signature[1])
+        return prediction
         
     except Exception as e:
-        debug_log(f"Error during prediction: {str(e)}")
+        logger.exception("Error during prediction")
         traceback.print_exc()
         handle_error(f"Error during prediction: {str(e)}")
 
+def predict_many(images, chunk_size=256, confidence_threshold=None, feature_store=None, duplicate_cache=None):
+    """Predict food classes for many images (paths, ImageContexts or uint8 arrays) at once.
+
+    Applies the same filename hints, feature model or rules, cascade, feature
+    store and near-duplicate cache as predict_class, but features are computed
+    and scored for a whole chunk of thumbnails in NumPy and escalated images go
+    through the model in batches.
+    """
+    feature_model = load_feature_model()
+    predictions = [None] * len(images)
+    pending = []
+    for i, image in enumerate(images):
+        file_name = _hint_name(image)
+        if "sushi" in file_name.lower():
+            predictions[i] = "sushi"
+            continue
+        hint = extract_filename_hints(file_name)
+        if hint:
+            predictions[i] = hint
+        else:
+            pending.append(i)
+
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        features, valid = image_features([images[i] for i in chunk], feature_store)
+        shares = features['color_shares'].astype(np.float64)
+        dominant = shares.argmax(axis=1)
+        colors = np.array(COLOR_ORDER)[dominant]
+        color_shares = shares[np.arange(len(chunk)), dominant]
+        textures = texture_names(features['gradient_mean'].astype(np.float64))
+        # Same defaults as the single-image analyzers use on a decode error
+        colors[~valid] = 'beige'
+        color_shares[~valid] = 1.0
+        textures[~valid] = 'medium'
+        if feature_model is not None:
+            model_labels, model_confidences = feature_model.predict(feature_matrix(features))
+        uncertain = []
+        cacheable = []
+        for j, (i, color, share, texture, decoded, record) in enumerate(
+                zip(chunk, colors, color_shares, textures, valid, features)):
+            file_name = _hint_name(images[i])
+            japanese_context = has_japanese_context(file_name)
+            if duplicate_cache is not None and decoded and not japanese_context:
+                cached = duplicate_cache.get(int(record['dhash']), record['mean_rgb'])
+                if cached is not None:
+                    predictions[i] = cached[0]
+                    continue
+                cacheable.append((i, record))
+            if feature_model is not None and decoded and not japanese_context:
+                predictions[i], confidence = str(model_labels[j]), float(model_confidences[j])
+            else:
+                predictions[i], confidence = rule_prediction(str(color), str(texture), file_name, float(share),
+                                                             seed=int(record['dhash']) if decoded else 0)
+            if confidence_threshold is not None and confidence < confidence_threshold and decoded:
+                uncertain.append((i, confidence))
+        if uncertain:
+            escalated = escalate([images[i] for i, _ in uncertain],
+                                 [(predictions[i], confidence) for i, confidence in uncertain])
+            for (i, _), prediction in zip(uncertain, escalated):
+                predictions[i] = prediction
+        for i, record in cacheable:
+            duplicate_cache.put(int(record['dhash']), predictions[i], record['mean_rgb'])
+
+    return predictions
+
+def read_job(source):
+    """Load a JSON job: {"image_path" or "image_base64", optional "original_filename"}."""
+    if source == '-':
+        job = json.load(sys.stdin)
+    else:
+        with open(source, 'r') as f:
+            job = json.load(f)
+    if job.get('image_base64'):
+        image = base64.b64decode(job['image_base64'])
+    elif job.get('image_path'):
+        image = job['image_path']
+    else:
+        raise ValueError("Job needs image_path or image_base64")
+    return image, job.get('original_filename')
+
+def main(argv=None):
+    global CASCADE_WORKERS
+    parser = argparse.ArgumentParser(description="Recipe image classifier")
+    parser.add_argument('images', nargs='*', help="Image files to classify; several print one JSON line each")
+    parser.add_argument('--original-filename', help="Name the image was uploaded under, used for keyword hints")
+    parser.add_argument('--job', metavar='FILE',
+                        help="Read a JSON job with image_path or image_base64 and original_filename ('-' for stdin)")
+    parser.add_argument('--cascade', action='store_true', default=cascade_enabled_from_env(),
+                        help="Escalate low-confidence rule answers to the model (default: NUTRIHELP_RECIPE_CASCADE)")
+    parser.add_argument('--feature-store', default=os.environ.get('NUTRIHELP_FEATURE_STORE'),
+                        help="Feature store file to reuse and extend (default: NUTRIHELP_FEATURE_STORE)")
+    parser.add_argument('--workers', type=int, default=CASCADE_WORKERS,
+                        help="Run the cascade model in this many processes sharing one memory-mapped model "
+                             "(default: NUTRIHELP_RECIPE_WORKERS or 0)")
+    parser.add_argument('--confidence-threshold', type=float, default=CONFIDENCE_THRESHOLD,
+                        help="Rule confidence below which the cascade escalates (default: NUTRIHELP_RECIPE_CONFIDENCE or 0.2)")
+    parser.add_argument('--duplicate-cache', default=os.environ.get('NUTRIHELP_DUPLICATE_CACHE'),
+                        help="SQLite file of earlier predictions reused for near-duplicate images "
+                             "(default: NUTRIHELP_DUPLICATE_CACHE)")
+    parser.add_argument('--duplicate-distance', type=int,
+                        help=f"Largest dHash distance in bits counted as a near-duplicate, 0-{MAX_DISTANCE} "
+                             f"(default: NUTRIHELP_DUPLICATE_DISTANCE or {MAX_DISTANCE})")
+    args = parser.parse_args(argv)
+    CASCADE_WORKERS = args.workers
+    threshold = args.confidence_threshold if args.cascade else None
+    feature_store = open_feature_store(args.feature_store)
+    duplicate_cache = open_duplicate_cache(args.duplicate_cache, threshold, args.duplicate_distance)
+
+    logger.info("Starting script")
+    
+    if args.job:
+        image, original_filename = read_job(args.job)
+        prediction = predict_class(image, original_filename, threshold, feature_store, duplicate_cache)
+    elif len(args.images) > 1:
+        debug_log(f"Classifying {len(args.images)} images from the command line")
+        for path, prediction in zip(args.images, predict_many(args.images, confidence_threshold=threshold,
+                                                                 feature_store=feature_store,
+                                                                 duplicate_cache=duplicate_cache)):
+            print(json.dumps({'path': path, 'prediction': prediction}))
+        metrics.emit(os.environ.get('NUTRIHELP_METRICS_FILE'), classifier='recipe')
+        return
+    elif args.images:
+        debug_log(f"Using image path from command line: {args.images[0]}")
+        prediction = predict_class(args.images[0], args.original_filename, threshold, feature_store,
+                                   duplicate_cache)
+    else:
+        handle_error("No image provided; pass an image path or --job")
+    
+    print(prediction)
+    debug_log(f"Script completed successfully with prediction: {prediction}")
+    metrics.emit(os.environ.get('NUTRIHELP_METRICS_FILE'), classifier='recipe')
+
 if __name__ == "__main__":
     try:
-        with open("python_debug.log", "w") as f:
-            f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - Starting script\n")
-        
-        if len(sys.argv) > 1:
-            image_path = sys.argv[1]
-            debug_log(f"Using image path from command line: {image_path}")
-            prediction = predict_class(image_path)
-        else:
-            debug_log("No command line argument provided, searching for images in uploads directory")
-            prediction = predict_class()
-        
-        print(prediction)
-        debug_log(f"Script completed successfully with prediction: {prediction}")
+        main()
         sys.exit(0)
     except Exception as e:
         traceback.print_exc()
-        debug_log(f"Unexpected error: {str(e)}")
-        handle_error(f"Unexpected error: {str(e)}")
\ No newline at end of file
+        logger.exception("Unexpected error")
+        handle_error(f"Unexpected error: {str(e)}")
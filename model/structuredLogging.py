@@ -0,0 +1,125 @@
+"""
+Buffered JSON-lines logging for the classifier scripts.
+
+Records are level-filtered in the calling thread, then handed to a queue; a
+background QueueListener owns the process's only open file handle. Every line
+carries the current request ID, taken from a context variable so concurrent
+requests in one process stay distinguishable.
+
+Every one-shot classifier run is its own process writing the same file, so by
+default lines are only appended and rotation is left to an outside tool such
+as logrotate: the file is reopened when it has been moved away. Rotating from
+inside the process is only correct when it is the file's single writer (e.g. a
+lone --serve worker with its own NUTRIHELP_LOG_FILE); with several writers
+records are lost or land in the renamed file, and on Windows the rename fails.
+
+Configured through the environment:
+  NUTRIHELP_LOG_LEVEL     DEBUG/INFO/WARNING/ERROR (default WARNING)
+  NUTRIHELP_LOG_FILE      log path (default python_debug.log in the working directory)
+  NUTRIHELP_LOG_MAX_MB    rotate in-process after this many MB; single writer only (default 0: never)
+  NUTRIHELP_LOG_BACKUPS   rotated files to keep with NUTRIHELP_LOG_MAX_MB (default 3)
+  NUTRIHELP_REQUEST_ID    request ID for one-shot runs (default: a random ID)
+"""
+
+import os
+import copy
+import json
+import time
+import uuid
+import queue
+import atexit
+import logging
+import contextvars
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, WatchedFileHandler
+
+DEFAULT_LOG_FILE = 'python_debug.log'
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+_listener = None
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:12]
+
+
+def set_request_id(value):
+    """Tag subsequent records in this context; returns a token for reset_request_id()."""
+    return _request_id.set(value)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created))
+                    + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'request_id': getattr(record, 'request_id', None),
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _RequestIdQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Runs in the logging thread, where the request's context variable is visible.
+        # Arguments and tracebacks are rendered here because they may not survive the queue.
+        record = copy.copy(record)
+        record.request_id = _request_id.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name='nutrihelp.classifier'):
+    """The shared classifier logger, configured from the environment on first use."""
+    global _listener
+
+    root = logging.getLogger('nutrihelp')
+    if _listener is None:
+        level = os.environ.get('NUTRIHELP_LOG_LEVEL', 'WARNING').upper()
+        root.setLevel(getattr(logging, level, logging.WARNING))
+        root.propagate = False
+
+        path = os.environ.get('NUTRIHELP_LOG_FILE', DEFAULT_LOG_FILE)
+        max_bytes = int(float(os.environ.get('NUTRIHELP_LOG_MAX_MB', 0)) * 1024 * 1024)
+        if max_bytes > 0:
+            file_handler = RotatingFileHandler(path, maxBytes=max_bytes,
+                                               backupCount=int(os.environ.get('NUTRIHELP_LOG_BACKUPS', 3)),
+                                               encoding='utf-8', delay=True)
+        else:
+            file_handler = WatchedFileHandler(path, encoding='utf-8', delay=True)
+        file_handler.setFormatter(JsonLinesFormatter())
+
+        records = queue.SimpleQueue()
+        root.handlers[:] = [_RequestIdQueueHandler(records)]
+        _listener = QueueListener(records, file_handler)
+        _listener.start()
+        # Flushes the queue on normal exit and sys.exit()
+        atexit.register(_stop_listener)
+
+        if os.environ.get('NUTRIHELP_REQUEST_ID'):
+            set_request_id(os.environ['NUTRIHELP_REQUEST_ID'])
+        else:
+            set_request_id(new_request_id())
+
+    return logging.getLogger(name)
@@ -0,0 +1,83 @@
+"""
+TensorFlow thread pool settings chosen by tools/image_classification/tune_threading.py.
+
+The profile file holds the best measured configuration per host type (CPU
+architecture and core count) and per (workers, batch size) pair. A
+configuration is a dict with ``intra_op``, ``inter_op`` and ``onednn`` keys.
+oneDNN is toggled through the environment, so apply_env() must run before
+TensorFlow is imported; apply_tf() sets the thread pools after the import.
+"""
+
+import os
+import sys
+import json
+import platform
+
+DEFAULT_PROFILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'threading_profile.json')
+
+
+def host_key():
+    return f"{platform.machine() or 'unknown'}-{os.cpu_count() or 1}cpu"
+
+
+def split_cores(workers):
+    """Fallback when no profile exists: share the cores evenly between worker processes."""
+    return {'intra_op': max(1, (os.cpu_count() or 1) // max(1, workers)), 'inter_op': None, 'onednn': None}
+
+
+def load_profile(path=DEFAULT_PROFILE_PATH):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_profile(profile, path=DEFAULT_PROFILE_PATH):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(profile, f, indent=2, sort_keys=True)
+        f.write('\n')
+    os.replace(tmp_path, path)
+
+
+def record_config(profile, workers, batch_size, config, host=None):
+    """Store the winning config for this host, replacing any earlier run for the same load."""
+    entries = profile.setdefault(host or host_key(), [])
+    entries[:] = [entry for entry in entries
+                  if (entry['workers'], entry['batch_size']) != (workers, batch_size)]
+    entries.append(dict(config, workers=workers, batch_size=batch_size))
+    entries.sort(key=lambda entry: (entry['workers'], entry['batch_size']))
+    return profile
+
+
+def select_config(profile, workers, batch_size, host=None):
+    """The tuned config closest to the expected load on this host, or None."""
+    entries = profile.get(host or host_key())
+    if not entries:
+        return None
+    best = min(entries, key=lambda entry: (abs(entry['workers'] - workers),
+                                           abs(entry['batch_size'] - batch_size)))
+    return {key: best.get(key) for key in ('intra_op', 'inter_op', 'onednn')}
+
+
+def apply_env(config):
+    if config and config.get('onednn') is not None:
+        if 'tensorflow' in sys.modules:
+            sys.stderr.write("TensorFlow already imported; oneDNN setting from the profile may not apply\n")
+        os.environ['TF_ENABLE_ONEDNN_OPTS'] = '1' if config['onednn'] else '0'
+
+
+def apply_tf(config):
+    """Set the TensorFlow thread pools; must run before the first op executes."""
+    if not config:
+        return
+    import tensorflow as tf
+
+    try:
+        if config.get('intra_op'):
+            tf.config.threading.set_intra_op_parallelism_threads(config['intra_op'])
+        if config.get('inter_op'):
+            tf.config.threading.set_inter_op_parallelism_threads(config['inter_op'])
+    except RuntimeError as e:
+        # Raised once the runtime is initialised; the defaults stay in place
+        sys.stderr.write(f"Could not apply threading profile: {e}\n")
@@ -0,0 +1,365 @@
+"""
+Multi-process inference for the Keras classifiers.
+
+By default the workers run the model's .tflite export, converted once next to
+the HDF5 file when it is missing or older than the model. Each worker's
+interpreter memory-maps the flatbuffer and runs TFLite's builtin kernels, which
+read the weights straight from the mapping, so they stay in read-only pages
+shared by every worker and resident memory grows by each worker's activations
+and interpreter state, not by another copy of the model.
+
+runtime='xnnpack' runs the same export through the XNNPACK delegate, which is
+several times faster on convolutions but repacks the weights into memory of
+each worker's own. Use it when cores rather than RAM are the limit.
+
+runtime='keras' keeps the Keras graph instead, for models the converter cannot
+handle. The model is exported once to a flat weights file plus a JSON manifest
+holding the architecture and tensor offsets, and each worker rebuilds the graph
+from the manifest and reads the weights through a memory map rather than
+parsing the HDF5 file. Keras then copies them into the worker's own variables,
+so Keras workers do not share weight memory: each one holds a full copy.
+
+Each worker has its own task queue, and the pool hands each batch to the worker
+with the fewest outstanding batches, so it always knows where a batch is. A
+worker that exits fails the batches it had started; the ones still waiting in
+its queue go to the other workers, and the pool fails every pending batch once
+no worker is left.
+
+Usage: python model/workerPool.py export <model.h5|model.hdf5> [--runtime tflite|xnnpack|keras] [--force]
+"""
+
+import os
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+import sys
+import json
+import time
+import queue
+import argparse
+import itertools
+import threading
+import multiprocessing
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+
+import threadingProfile
+from modelRuntime import export_tflite
+
+POOL_RUNTIMES = ('tflite', 'xnnpack', 'keras')
+
+# Tensor offsets are aligned so the memory-mapped views are SIMD friendly
+ALIGNMENT = 64
+# Seconds between checks that every worker process is still alive
+LIVENESS_INTERVAL = 1.0
+
+_READY = 'ready'
+_STARTED = 'started'
+_STOP = 'stop'
+
+
+def shared_weights_paths(model_path):
+    """Return (manifest path, weights path) for a model file."""
+    stem = os.path.splitext(model_path)[0]
+    return stem + '.weights.json', stem + '.weights.bin'
+
+
+def export_shared_weights(model_path, force=False):
+    """Write the flat weights export for a model unless an up to date one exists."""
+    manifest_path, data_path = shared_weights_paths(model_path)
+    source = os.stat(model_path)
+
+    if not force and os.path.exists(manifest_path) and os.path.exists(data_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('source_size') == source.st_size and manifest.get('source_mtime') == source.st_mtime:
+            return manifest_path
+
+    from tensorflow.keras.models import load_model
+
+    model = load_model(model_path, compile=False)
+
+    tensors = []
+    offset = 0
+    with open(data_path + '.tmp', 'wb') as f:
+        for weight in model.get_weights():
+            weight = np.ascontiguousarray(weight)
+            padding = -offset % ALIGNMENT
+            f.write(b'\0' * padding)
+            offset += padding
+            tensors.append({'dtype': weight.dtype.str, 'shape': list(weight.shape), 'offset': offset})
+            f.write(weight.tobytes())
+            offset += weight.nbytes
+    os.replace(data_path + '.tmp', data_path)
+
+    manifest = {
+        'source_size': source.st_size,
+        'source_mtime': source.st_mtime,
+        'weights_file': os.path.basename(data_path),
+        'architecture': model.to_json(),
+        'tensors': tensors,
+    }
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+    return manifest_path
+
+
+def load_shared_model(manifest_path):
+    """Rebuild a Keras model from an export, reading weights through a memory map.
+
+    set_weights() copies the mapped arrays into the model's variables, so the
+    model holds its own copy of the weights.
+    """
+    from tensorflow.keras.models import model_from_json
+
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+
+    data_path = os.path.join(os.path.dirname(manifest_path), manifest['weights_file'])
+    data = np.memmap(data_path, dtype=np.uint8, mode='r')
+
+    weights = []
+    for tensor in manifest['tensors']:
+        dtype = np.dtype(tensor['dtype'])
+        count = int(np.prod(tensor['shape'], dtype=np.int64))
+        start = tensor['offset']
+        view = data[start:start + count * dtype.itemsize].view(dtype)
+        weights.append(view.reshape(tensor['shape']))
+
+    model = model_from_json(manifest['architecture'])
+    model.set_weights(weights)
+    return model
+
+
+def _load_worker_model(model_path, manifest_path, threading_config, jit_compile=False, shared_weights=True):
+    threadingProfile.apply_env(threading_config)
+    if manifest_path is None:
+        from modelRuntime import TFLiteRuntime
+
+        runtime = TFLiteRuntime(model_path, num_threads=threading_config.get('intra_op'), shared_weights=shared_weights)
+        runtime.warmup()
+        return runtime.predict
+
+    from modelRuntime import compile_predict
+
+    threadingProfile.apply_tf(threading_config)
+    model = load_shared_model(manifest_path)
+    predict = compile_predict(model, jit_compile)
+    predict(np.zeros((1,) + tuple(model.input_shape[1:]), dtype=np.float32))
+    return predict
+
+
+def _worker_main(model_path, manifest_path, threading_config, jit_compile, shared_weights, tasks, results):
+    try:
+        predict = _load_worker_model(model_path, manifest_path, threading_config, jit_compile, shared_weights)
+    except Exception as e:
+        results.put((_READY, None, f"Error loading model: {e}"))
+        return
+    results.put((_READY, os.getpid(), None))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        task_id, batch = task
+        # Tells the pool which batches to fail if this process dies while running them
+        results.put((_STARTED, task_id, os.getpid()))
+        try:
+            results.put((task_id, predict(batch), None))
+        except Exception as e:
+            results.put((task_id, None, str(e)))
+
+
+class WorkerPool:
+    """A fixed set of model processes sharing one memory-mapped model file."""
+
+    def __init__(self, model_path, workers=None, threading_config=None, jit_compile=False, runtime='tflite'):
+        if runtime not in POOL_RUNTIMES:
+            raise ValueError(f"Unknown pool runtime: {runtime}")
+        if runtime != 'keras' and not model_path.endswith('.tflite'):
+            model_path = export_tflite(model_path)
+        self.model_path = model_path
+        self.workers = workers or os.cpu_count() or 1
+        if model_path.endswith('.tflite'):
+            self.manifest_path = None
+        else:
+            self.manifest_path = export_shared_weights(model_path)
+
+        # Without a tuned profile, split the cores so workers do not oversubscribe the box
+        threading_config = threading_config or threadingProfile.split_cores(self.workers)
+
+        context = multiprocessing.get_context('spawn')
+        self._results = context.Queue()
+        self._processes = []
+        self._queues = {}
+        for _ in range(self.workers):
+            tasks = context.Queue()
+            process = context.Process(target=_worker_main,
+                                      args=(self.model_path, self.manifest_path, threading_config, jit_compile,
+                                            runtime != 'xnnpack',
+                                            tasks, self._results),
+                                      daemon=True)
+            process.start()
+            self._processes.append(process)
+            self._queues[process.pid] = tasks
+
+        self._futures = {}
+        # Batches not answered yet, the worker each one was handed to and those it has started
+        self._batches = {}
+        self._owners = {}
+        self._started = set()
+        self._exited = set()
+        self._failed = None
+        self._closing = False
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+
+        ready = 0
+        while ready < len(self._processes):
+            try:
+                _, _, error = self._results.get(timeout=LIVENESS_INTERVAL)
+            except queue.Empty:
+                # A worker killed while loading (e.g. out of memory) never reports back
+                exited = [process for process in self._processes if not process.is_alive()]
+                if not exited:
+                    continue
+                error = f"Worker {exited[0].pid} exited with code {exited[0].exitcode} while loading the model"
+            if error:
+                self.close()
+                raise RuntimeError(error)
+            ready += 1
+
+        self._collector = threading.Thread(target=self._collect, name="worker-pool-results", daemon=True)
+        self._collector.start()
+
+    def submit(self, batch):
+        """Queue a batch for the least busy worker; returns a Future of its probabilities."""
+        future = Future()
+        with self._lock:
+            if self._failed is not None:
+                future.set_exception(self._failed)
+                return future
+            task_id = next(self._ids)
+            self._futures[task_id] = future
+            self._batches[task_id] = batch
+            self._dispatch(task_id)
+        return future
+
+    def _dispatch(self, task_id):
+        """Hand a batch to the live worker with the fewest outstanding batches; call with the lock held."""
+        load = Counter(self._owners.values())
+        pid = min((pid for pid in self._queues if pid not in self._exited), key=lambda pid: load[pid])
+        self._owners[task_id] = pid
+        self._queues[pid].put((task_id, self._batches[task_id]))
+
+    def predict(self, batch):
+        return self.submit(batch).result()
+
+    def warmup(self, batch_sizes=(1,)):
+        """Nothing to do: each worker warms up before it reports ready."""
+
+    def _collect(self):
+        checked = time.monotonic()
+        while True:
+            try:
+                task_id, probabilities, error = self._results.get(timeout=LIVENESS_INTERVAL)
+            except queue.Empty:
+                task_id = None
+            if time.monotonic() - checked >= LIVENESS_INTERVAL:
+                self._check_workers()
+                checked = time.monotonic()
+            if task_id is None:
+                continue
+            if task_id == _STOP:
+                return
+            if task_id == _STARTED:
+                with self._lock:
+                    if probabilities in self._owners:
+                        self._started.add(probabilities)
+                continue
+            with self._lock:
+                self._owners.pop(task_id, None)
+                self._batches.pop(task_id, None)
+                self._started.discard(task_id)
+                future = self._futures.pop(task_id, None)
+            if future is None:
+                continue
+            if error:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(probabilities)
+
+    def _check_workers(self):
+        """Fail the batches workers that have exited were running, and everything once none is left.
+
+        Batches an exited worker had not started yet are handed to another worker.
+        """
+        if self._closing:
+            return
+        for process in self._processes:
+            if process.pid in self._exited or process.is_alive():
+                continue
+            self._exited.add(process.pid)
+            error = RuntimeError(f"Worker {process.pid} exited with code {process.exitcode}")
+            sys.stderr.write(f"Worker pool: {error}\n")
+            with self._lock:
+                assigned = [task_id for task_id, pid in self._owners.items() if pid == process.pid]
+                lost = [task_id for task_id in assigned if task_id in self._started]
+                waiting = [task_id for task_id in assigned if task_id not in self._started]
+                if len(self._exited) == len(self._processes):
+                    self._failed = RuntimeError("Every worker process has exited")
+                    lost = list(self._futures)
+                futures = []
+                for task_id in lost:
+                    self._owners.pop(task_id, None)
+                    self._batches.pop(task_id, None)
+                    self._started.discard(task_id)
+                    futures.append(self._futures.pop(task_id))
+                if self._failed is None:
+                    for task_id in waiting:
+                        self._dispatch(task_id)
+            for future in futures:
+                future.set_exception(self._failed or error)
+
+    def close(self):
+        self._closing = True
+        for tasks in self._queues.values():
+            tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        # Batches left for workers that died are never read; without this, exit waits to flush them
+        for tasks in self._queues.values():
+            tasks.cancel_join_thread()
+        self._results.put((_STOP, None, None))
+        collector = getattr(self, '_collector', None)
+        if collector:
+            collector.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Model exports for the worker pool")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help="Write the export the pool's workers load")
+    export_parser.add_argument('model_path')
+    export_parser.add_argument('--runtime', choices=POOL_RUNTIMES, default='tflite',
+                               help="Pool runtime to export for: tflite and xnnpack share the .tflite export")
+    export_parser.add_argument('--force', action='store_true', help="Rewrite even if the export is current")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.runtime != 'keras':
+            print(f"TFLite export written to {export_tflite(args.model_path, force=args.force)}")
+        else:
+            print(f"Shared weights manifest written to {export_shared_weights(args.model_path, force=args.force)}")
+    except Exception as e:
+        print(f"Error exporting {args.model_path}: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 const express = require('express');
 const router = express.Router();
 const { checkFileIntegrity, generateBaseline } = require('../tools/integrity/integrityService');
+const imageClassificationService = require('../services/imageClassificationService');
 
 /**
  * @swagger
@@ -65,5 +66,32 @@ router.get('/integrity-check', (req, res) => {
   }
 });
 
+/**
+ * @swagger
+ * /api/system/classifier-metrics:
+ *   get:
+ *     summary: Image classifier worker metrics in Prometheus text format
+ *     tags: [System]
+ *     responses:
+ *       200:
+ *         description: Request counters and per-stage latency histograms
+ *         content:
+ *           text/plain:
+ *             schema:
+ *               type: string
+ *       204:
+ *         description: No classifier worker is running yet
+ */
+router.get('/classifier-metrics', async (req, res) => {
+  try {
+    const metrics = await imageClassificationService.metrics();
+    if (metrics === null) {
+      return res.status(204).end();
+    }
+    res.type('text/plain; version=0.0.4').send(metrics);
+  } catch (err) {
+    res.status(500).json({ error: "Failed to read classifier metrics", details: err.message });
+  }
+});
 
 module.exports = router;
\ No newline at end of file
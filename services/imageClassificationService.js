@@ -0,0 +1,179 @@
+const { spawn } = require('child_process');
+
+// Keeps one `model/imageClassification.py --serve` worker alive so the model is
+// loaded once instead of on every upload. Messages use the length-prefixed
+// framing described in model/inferenceProtocol.py.
+
+const LENGTH_BYTES = 4;
+const DEFAULT_TIMEOUT_MS = 30000;
+
+const frame = (payload) => {
+  const length = Buffer.alloc(LENGTH_BYTES);
+  length.writeUInt32BE(payload.length, 0);
+  return Buffer.concat([length, payload]);
+};
+
+class ImageClassificationService {
+  constructor(options = {}) {
+    this.pythonPath = options.pythonPath || process.env.PYTHON_PATH || 'python';
+    this.scriptPath = options.scriptPath || 'model/imageClassification.py';
+    this.extraArgs = options.extraArgs
+      || (process.env.IMAGE_CLASSIFIER_ARGS || '').split(' ').filter(Boolean);
+    this.timeoutMs = options.timeoutMs || DEFAULT_TIMEOUT_MS;
+
+    this.worker = null;
+    this.buffer = Buffer.alloc(0);
+    this.pending = new Map();
+    this.nextId = 1;
+  }
+
+  start() {
+    if (this.worker) {
+      return this.worker;
+    }
+
+    const worker = spawn(this.pythonPath, [this.scriptPath, '--serve', ...this.extraArgs]);
+    this.worker = worker;
+    this.buffer = Buffer.alloc(0);
+
+    worker.stdout.on('data', (data) => this.onData(data));
+
+    // The worker reports load warnings and per-request tracebacks on stderr;
+    // failures are also returned in the response frame, so only log here.
+    worker.stderr.on('data', (data) => {
+      console.error('Image classification worker:', data.toString());
+    });
+
+    worker.on('error', (err) => {
+      console.error('Error starting image classification worker:', err);
+      this.onExit(worker, err);
+    });
+
+    worker.on('close', (code) => {
+      if (code !== 0) {
+        console.error('Image classification worker exited with code:', code);
+      }
+      this.onExit(worker, new Error(`Model worker exited with code ${code}`));
+    });
+
+    worker.stdin.on('error', (err) => {
+      console.error('Error writing to image classification worker:', err);
+    });
+
+    return worker;
+  }
+
+  onExit(worker, err) {
+    if (this.worker !== worker) {
+      return;
+    }
+    this.worker = null;
+    for (const { reject, timer } of this.pending.values()) {
+      clearTimeout(timer);
+      reject(err);
+    }
+    this.pending.clear();
+  }
+
+  onData(data) {
+    this.buffer = Buffer.concat([this.buffer, data]);
+
+    while (this.buffer.length >= LENGTH_BYTES) {
+      const length = this.buffer.readUInt32BE(0);
+      if (this.buffer.length < LENGTH_BYTES + length) {
+        return;
+      }
+      const payload = this.buffer.subarray(LENGTH_BYTES, LENGTH_BYTES + length);
+      this.buffer = this.buffer.subarray(LENGTH_BYTES + length);
+
+      let response;
+      try {
+        response = JSON.parse(payload.toString('utf8'));
+      } catch (err) {
+        console.error('Invalid response from image classification worker:', err);
+        continue;
+      }
+
+      const entry = this.pending.get(response.id);
+      if (!entry) {
+        continue;
+      }
+      this.pending.delete(response.id);
+      clearTimeout(entry.timer);
+
+      if (response.error) {
+        entry.reject(new Error(response.error));
+      } else {
+        entry.resolve(response);
+      }
+    }
+  }
+
+  request(op, body = Buffer.alloc(0)) {
+    const worker = this.start();
+    const id = this.nextId++;
+
+    return new Promise((resolve, reject) => {
+      const timer = setTimeout(() => {
+        this.pending.delete(id);
+        reject(new Error('Image classification timed out'));
+      }, this.timeoutMs);
+
+      this.pending.set(id, { resolve, reject, timer });
+
+      const header = Buffer.from(JSON.stringify({ id, op }), 'utf8');
+      worker.stdin.write(Buffer.concat([frame(header), frame(body)]));
+    });
+  }
+
+  predict(imageData) {
+    return this.request('predict', imageData);
+  }
+
+  // Queue depth and achieved batch sizes reported by the worker's scheduler
+  stats() {
+    return this.request('stats');
+  }
+
+  // Prometheus text with request counters and per-stage latency histograms;
+  // null when no worker is running, so a metrics scrape never starts one
+  async metrics() {
+    if (!this.worker) {
+      return null;
+    }
+    const response = await this.request('metrics');
+    return response.prometheus;
+  }
+
+  // Loaded model versions, the shadowed candidate and its agreement statistics
+  async models() {
+    const response = await this.request('models');
+    return response.models;
+  }
+
+  // Load the model file again now instead of waiting for the watcher
+  async reload() {
+    const response = await this.request('reload');
+    return response.models;
+  }
+
+  // Swap the shadowed candidate in, or drop it
+  async promote() {
+    const response = await this.request('promote');
+    return response.models;
+  }
+
+  async reject() {
+    const response = await this.request('reject');
+    return response.models;
+  }
+
+  stop() {
+    if (this.worker) {
+      this.worker.stdin.end();
+    }
+  }
+}
+
+module.exports = new ImageClassificationService();
+module.exports.ImageClassificationService = ImageClassificationService;
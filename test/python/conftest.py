@@ -0,0 +1,7 @@
+"""Behaviour tests for the Python classifier modules in model/; run with npm run test:python."""
+
+import os
+import sys
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'model')
+sys.path.insert(0, os.path.abspath(MODEL_DIR))
@@ -0,0 +1,100 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from recipeFeatureStore import FeatureStore, content_digest
+
+FIELDS = [('value', 'f4'), ('shares', 'f4', (3,))]
+SHARED_KEYS = 300
+OWN_KEYS = 50
+
+
+def key(name):
+    return content_digest(str(name).encode())
+
+
+def record(value):
+    return {'value': value, 'shares': [value, value / 2, value / 4]}
+
+
+def test_put_and_get_round_trip(tmp_path):
+    store = FeatureStore(str(tmp_path / 'features.bin'), FIELDS)
+    assert store.put_many([key(1), key(2)], [record(1.0), record(2.0)]) == 2
+
+    row = store.get(key(2))
+    assert row['value'] == 2.0
+    np.testing.assert_allclose(row['shares'], [2.0, 1.0, 0.5])
+    assert store.get(key(3)) is None
+    assert len(store) == 2
+
+
+def test_first_copy_of_a_key_wins(tmp_path):
+    store = FeatureStore(str(tmp_path / 'features.bin'), FIELDS)
+    store.put(key(1), record(1.0))
+    assert store.put_many([key(1), key(2), key(2)], [record(9.0), record(2.0), record(8.0)]) == 1
+
+    assert store.get(key(1))['value'] == 1.0
+    assert store.get(key(2))['value'] == 2.0
+    assert len(store) == 2
+
+
+def test_reader_sees_rows_appended_by_another_writer(tmp_path):
+    path = str(tmp_path / 'features.bin')
+    reader = FeatureStore(path, FIELDS)
+    writer = FeatureStore(path, FIELDS)
+    writer.put(key('late'), record(5.0))
+
+    assert reader.get(key('late'))['value'] == 5.0
+
+
+def test_different_layout_is_refused(tmp_path):
+    path = str(tmp_path / 'features.bin')
+    FeatureStore(path, FIELDS)
+    with pytest.raises(ValueError, match='different feature layout'):
+        FeatureStore(path, [('value', 'f8')])
+
+
+def test_partial_row_from_an_interrupted_append_is_dropped(tmp_path):
+    path = tmp_path / 'features.bin'
+    store = FeatureStore(str(path), FIELDS)
+    store.put(key(1), record(1.0))
+    with open(path, 'ab') as f:
+        f.write(b'\x01\x02\x03')
+
+    store.put(key(2), record(2.0))
+    reopened = FeatureStore(str(path), FIELDS)
+    assert reopened.get(key(1))['value'] == 1.0
+    assert reopened.get(key(2))['value'] == 2.0
+    assert path.stat().st_size == 2 * reopened.dtype.itemsize
+
+
+def _append_worker(path, worker, barrier):
+    store = FeatureStore(path, FIELDS)
+    barrier.wait()
+    # Every worker races to add the same shared keys one at a time, then a batch of its own
+    for n in range(SHARED_KEYS):
+        store.put(key(n), record(float(worker)))
+    names = [f"{worker}-{n}" for n in range(OWN_KEYS)]
+    store.put_many([key(name) for name in names], [record(float(worker)) for _ in names])
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_concurrent_appends_keep_rows_whole_and_keys_unique(tmp_path):
+    path = str(tmp_path / 'features.bin')
+    FeatureStore(path, FIELDS)
+    context = multiprocessing.get_context('fork')
+    workers = 4
+    barrier = context.Barrier(workers)
+    processes = [context.Process(target=_append_worker, args=(path, worker, barrier)) for worker in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+        assert process.exitcode == 0
+
+    store = FeatureStore(path, FIELDS)
+    keys = {bytes(row) for row in store.records['key']}
+    assert len(store) == len(keys) == SHARED_KEYS + workers * OWN_KEYS
+    for name in [0, SHARED_KEYS - 1] + [f"{worker}-{n}" for worker in range(workers) for n in (0, OWN_KEYS - 1)]:
+        assert store.get(key(name)) is not None
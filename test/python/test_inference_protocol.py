@@ -0,0 +1,67 @@
+import io
+import struct
+
+import pytest
+
+from inferenceProtocol import (MAX_FRAME_BYTES, ProtocolError, read_request, read_response, write_request,
+                               write_response)
+
+
+class TrickleStream:
+    """A pipe that hands out at most chunk_size bytes per read, like a busy stdin."""
+
+    def __init__(self, data, chunk_size):
+        self._data = io.BytesIO(data)
+        self.chunk_size = chunk_size
+
+    def read(self, size):
+        return self._data.read(min(size, self.chunk_size))
+
+
+def encoded_requests(*requests):
+    stream = io.BytesIO()
+    for header, body in requests:
+        write_request(stream, header, body)
+    return stream.getvalue()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 4096])
+def test_requests_split_across_reads_are_reassembled(chunk_size):
+    data = encoded_requests(({'id': 1, 'op': 'predict'}, b'\xff\xd8' + bytes(range(256)) * 3),
+                            ({'id': 2, 'op': 'stats'}, b''))
+    stream = TrickleStream(data, chunk_size)
+
+    assert read_request(stream) == ({'id': 1, 'op': 'predict'}, b'\xff\xd8' + bytes(range(256)) * 3)
+    assert read_request(stream) == ({'id': 2, 'op': 'stats'}, b'')
+    assert read_request(stream) is None
+
+
+def test_responses_split_across_reads_are_reassembled():
+    stream = io.BytesIO()
+    write_response(stream, {'id': 7, 'prediction': 'Apple Braeburn'})
+    write_response(stream, {'id': 8, 'error': 'bad image'})
+    trickle = TrickleStream(stream.getvalue(), 2)
+
+    assert read_response(trickle) == {'id': 7, 'prediction': 'Apple Braeburn'}
+    assert read_response(trickle) == {'id': 8, 'error': 'bad image'}
+    assert read_response(trickle) is None
+
+
+@pytest.mark.parametrize('cut', [2, 6, 20])
+def test_stream_closed_mid_request_is_an_error(cut):
+    data = encoded_requests(({'id': 1, 'op': 'predict'}, b'image bytes'))
+    with pytest.raises(ProtocolError):
+        read_request(TrickleStream(data[:-cut], 3))
+
+
+def test_oversized_frame_is_rejected_before_reading_it():
+    data = struct.pack('>I', MAX_FRAME_BYTES + 1) + b'x' * 16
+    with pytest.raises(ProtocolError, match='exceeds limit'):
+        read_request(io.BytesIO(data))
+
+
+def test_invalid_header_is_a_protocol_error():
+    header = b'not json'
+    data = struct.pack('>I', len(header)) + header + struct.pack('>I', 0)
+    with pytest.raises(ProtocolError, match='Invalid request header'):
+        read_request(io.BytesIO(data))
@@ -0,0 +1,80 @@
+import json
+import os
+
+import pytest
+
+from keywordMatcher import KeywordMatcher, KeywordTable
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('ushers', 'she'),      # she, he and hers all occur; she is listed first
+    ('ushe', 'she'),
+    ('HERS', 'he'),
+    ('hrs', None),
+])
+def test_earliest_listed_keyword_wins_among_overlapping_matches(text, expected):
+    matcher = KeywordMatcher([('she', 'she'), ('he', 'he'), ('hers', 'hers')])
+    assert matcher.match(text) == expected
+
+
+def test_keyword_ending_inside_a_longer_one_is_found_through_failure_links():
+    matcher = KeywordMatcher([('he', 'he'), ('she', 'she')])
+    assert matcher.match('she') == 'he'
+
+
+def test_priority_is_list_order_not_position_in_text():
+    matcher = KeywordMatcher([('bolognese', 'spaghetti_bolognese'), ('spag', 'spaghetti_carbonara')])
+    assert matcher.match('spag_bolognese_2024') == 'spaghetti_bolognese'
+
+
+def test_suffix_keyword_listed_first_beats_longer_keyword():
+    matcher = KeywordMatcher([('cake', 'cup_cakes'), ('carrot cake', 'carrot_cake')])
+    assert matcher.match('my carrot cake') == 'cup_cakes'
+
+
+@pytest.fixture
+def keyword_file(tmp_path):
+    path = tmp_path / 'keywords.json'
+
+    def write(tables, mtime_ns=None):
+        path.write_text(json.dumps(tables))
+        if mtime_ns is not None:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+        return str(path)
+    return write
+
+
+def test_earlier_tables_take_priority(keyword_file):
+    path = keyword_file({'custom_food_types': {'sushi': 'sushi'},
+                         'dish_overrides': {'sushi': 'miso_soup', 'ramen': 'ramen'}})
+    table = KeywordTable(path, ['custom_food_types', 'dish_overrides'])
+    assert table.match('sushi and ramen') == ('custom_food_types', 'sushi', 'sushi')
+    assert table.match('ramen') == ('dish_overrides', 'ramen', 'ramen')
+
+
+def test_table_reloads_when_the_file_changes(keyword_file):
+    path = keyword_file({'dish_overrides': {'spag': 'spaghetti_bolognese'}}, mtime_ns=1_000_000_000)
+    table = KeywordTable(path, ['dish_overrides'], check_interval=0)
+    assert table.match('tacos') is None
+
+    keyword_file({'dish_overrides': {'taco': 'tacos'}}, mtime_ns=2_000_000_000)
+    assert table.match('tacos') == ('dish_overrides', 'taco', 'tacos')
+    assert table.match('spag') is None
+
+
+def test_invalid_edit_keeps_the_last_good_tables(keyword_file, tmp_path):
+    path = keyword_file({'dish_overrides': {'spag': 'spaghetti_bolognese'}}, mtime_ns=1_000_000_000)
+    table = KeywordTable(path, ['dish_overrides'], check_interval=0)
+
+    (tmp_path / 'keywords.json').write_text('{"dish_overrides": {')
+    os.utime(path, ns=(2_000_000_000, 2_000_000_000))
+    assert table.match('spag') == ('dish_overrides', 'spag', 'spaghetti_bolognese')
+
+
+def test_table_is_not_restatted_within_the_check_interval(keyword_file):
+    path = keyword_file({'dish_overrides': {'spag': 'spaghetti_bolognese'}}, mtime_ns=1_000_000_000)
+    table = KeywordTable(path, ['dish_overrides'], check_interval=3600)
+    table.match('warm up the check timer')
+
+    keyword_file({'dish_overrides': {'taco': 'tacos'}}, mtime_ns=2_000_000_000)
+    assert table.match('taco') is None
@@ -0,0 +1,110 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from inferenceBatcher import MicroBatcher
+
+
+class Recorder:
+    """Predict function that records batch sizes and returns each image's first pixel value."""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, batch):
+        self.batch_sizes.append(len(batch))
+        return batch[:, 0, 0, :1].copy()
+
+
+def submit_all(batcher, values):
+    done = threading.Event()
+    results = {}
+
+    def callback_for(value):
+        def callback(row, error):
+            results[value] = (row, error)
+            if len(results) == len(values):
+                done.set()
+        return callback
+
+    for value in values:
+        batcher.submit(np.full((2, 2, 3), value, dtype=np.float32), callback_for(value))
+    return done, results
+
+
+@pytest.fixture
+def batcher_factory():
+    batchers = []
+
+    def factory(predict_fn, **options):
+        batcher = MicroBatcher(predict_fn, **options)
+        batcher.start()
+        batchers.append(batcher)
+        return batcher
+
+    yield factory
+    for batcher in batchers:
+        batcher.stop()
+
+
+def test_partial_batch_is_flushed_at_the_deadline(batcher_factory):
+    predict = Recorder()
+    batcher = batcher_factory(predict, max_batch_size=8, max_wait_ms=50)
+
+    started = time.monotonic()
+    done, results = submit_all(batcher, [1.0, 2.0, 3.0])
+    assert done.wait(2.0)
+    waited = time.monotonic() - started
+
+    assert predict.batch_sizes == [3]
+    assert waited >= 0.045
+    assert {value: float(row[0]) for value, (row, _) in results.items()} == {1.0: 1.0, 2.0: 2.0, 3.0: 3.0}
+
+
+def test_full_batch_does_not_wait_for_the_deadline(batcher_factory):
+    predict = Recorder()
+    batcher = batcher_factory(predict, max_batch_size=4, max_wait_ms=10000)
+
+    done, _ = submit_all(batcher, [1.0, 2.0, 3.0, 4.0])
+    assert done.wait(2.0)
+    assert predict.batch_sizes == [4]
+
+
+def test_deadline_follows_the_oldest_request(batcher_factory):
+    predict = Recorder()
+    batcher = batcher_factory(predict, max_batch_size=8, max_wait_ms=400)
+
+    started = time.monotonic()
+    first, _ = submit_all(batcher, [1.0])
+    time.sleep(0.3)
+    second, _ = submit_all(batcher, [2.0])
+    assert first.wait(2.0) and second.wait(2.0)
+
+    # One batch, flushed 400 ms after the first request rather than after the second
+    assert predict.batch_sizes == [2]
+    assert time.monotonic() - started < 0.6
+
+
+def test_predict_errors_reach_every_callback(batcher_factory):
+    def failing(batch):
+        raise RuntimeError("model failed")
+
+    batcher = batcher_factory(failing, max_batch_size=2, max_wait_ms=1)
+    done, results = submit_all(batcher, [1.0, 2.0])
+    assert done.wait(2.0)
+    assert all(row is None and str(error) == "model failed" for row, error in results.values())
+
+
+def test_stop_flushes_queued_requests():
+    predict = Recorder()
+    batcher = MicroBatcher(predict, max_batch_size=8, max_wait_ms=10000)
+    batcher.start()
+    done, _ = submit_all(batcher, [1.0, 2.0])
+    batcher.stop()
+
+    assert done.is_set()
+    assert predict.batch_sizes == [2]
+    with pytest.raises(RuntimeError):
+        batcher.submit(np.zeros((2, 2, 3), dtype=np.float32), lambda row, error: None)
@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from modelRegistry import VERSIONS_DIR, ModelRegistry
+
+CLASSES = 3
+
+
+class FakeRuntime:
+    """Answers every image with the class named at the start of the model file."""
+
+    def __init__(self, path, gate=None):
+        with open(path, 'r') as f:
+            content = f.read()
+        if content.startswith('broken'):
+            raise ValueError("not a model")
+        self.label = int(content.split()[0])
+        self.gate = gate
+        self.entered = threading.Event()
+        self.closed = False
+
+    def warmup(self, batch_sizes):
+        pass
+
+    def predict(self, batch):
+        self.entered.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        return np.tile(np.eye(CLASSES, dtype=np.float32)[self.label], (len(batch), 1))
+
+    def close(self):
+        self.closed = True
+
+
+class Loader:
+    def __init__(self):
+        self.runtimes = []
+        self.gates = {}
+
+    def __call__(self, path):
+        runtime = FakeRuntime(path, self.gates.pop('next', None))
+        self.runtimes.append(runtime)
+        return runtime
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def predicted_class(registry):
+    return int(registry.predict(np.zeros((2, 4, 4, 3), dtype=np.float32)).argmax(axis=1)[0])
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    path = tmp_path / 'model.h5'
+    path.write_text('0 first release')
+    return path
+
+
+@pytest.fixture
+def registries():
+    started = []
+
+    def start(model_path, loader, **options):
+        registry = ModelRegistry(str(model_path), loader, poll_interval=0, **options)
+        registry.start()
+        started.append(registry)
+        return registry
+
+    yield start
+    for registry in started:
+        registry.stop()
+
+
+def swap_to(registry, model_path, content):
+    version = registry.current.version
+    model_path.write_text(content)
+    assert registry.reload()
+    wait_for(lambda: registry.current.version != version or registry.candidate is not None
+             or registry.status()['last_error'])
+
+
+def test_reload_swaps_in_the_new_version_and_closes_the_old_one(model_path, registries):
+    loader = Loader()
+    registry = registries(model_path, loader)
+    assert predicted_class(registry) == 0
+    first = registry.current
+
+    swap_to(registry, model_path, '1 second release')
+    assert predicted_class(registry) == 1
+    assert registry.last_model() is registry.current
+    assert loader.runtimes[0].closed and not loader.runtimes[1].closed
+    versions = os.listdir(model_path.parent / VERSIONS_DIR)
+    assert sorted(versions) == sorted(f"model-{v}.h5" for v in (first.version, registry.current.version))
+
+
+def test_retired_model_stays_open_until_its_batch_returns(model_path, registries):
+    loader = Loader()
+    gate = threading.Event()
+    loader.gates['next'] = gate
+    registry = registries(model_path, loader)
+    old_runtime = loader.runtimes[0]
+
+    answers = []
+    in_flight = threading.Thread(target=lambda: answers.append(predicted_class(registry)))
+    in_flight.start()
+    assert old_runtime.entered.wait(5)
+
+    swap_to(registry, model_path, '2 second release')
+    assert predicted_class(registry) == 2
+    assert not old_runtime.closed
+
+    gate.set()
+    in_flight.join(5)
+    assert answers == [0]
+    assert old_runtime.closed
+
+
+def test_failed_load_keeps_the_current_version(model_path, registries):
+    loader = Loader()
+    registry = registries(model_path, loader)
+    version = registry.current.version
+
+    swap_to(registry, model_path, 'broken weights')
+    assert registry.current.version == version
+    assert predicted_class(registry) == 0
+    assert 'not a model' in registry.status()['last_error']
+    # Only versions that loaded are kept for rollback
+    assert os.listdir(model_path.parent / VERSIONS_DIR) == [f"model-{version}.h5"]
+
+
+def test_shadow_candidate_is_compared_then_promoted(model_path, registries):
+    loader = Loader()
+    registry = registries(model_path, loader, shadow_fraction=1.0)
+    swap_to(registry, model_path, '1 candidate')
+    candidate = registry.candidate
+    assert candidate is not None
+
+    # Live answers still come from the current version
+    assert predicted_class(registry) == 0
+    wait_for(lambda: registry.status()['shadow']['images'] == 2)
+    assert registry.status()['shadow']['agreement'] == 0.0
+
+    assert registry.promote() is candidate
+    assert registry.current is candidate and registry.candidate is None
+    assert predicted_class(registry) == 1
+    assert loader.runtimes[0].closed
+
+
+def test_shadow_candidate_is_promoted_once_it_agrees_enough(model_path, registries):
+    loader = Loader()
+    registry = registries(model_path, loader, shadow_fraction=1.0, promote_after=4, min_agreement=1.0)
+    swap_to(registry, model_path, '0 retrained, same answers')
+    candidate = registry.candidate
+
+    predicted_class(registry)
+    predicted_class(registry)
+    wait_for(lambda: registry.current is candidate)
+    assert registry.candidate is None
+
+
+def test_rejected_candidate_is_closed(model_path, registries):
+    loader = Loader()
+    registry = registries(model_path, loader, shadow_fraction=1.0)
+    swap_to(registry, model_path, '1 candidate')
+    current = registry.current
+
+    registry.reject()
+    assert registry.current is current and registry.candidate is None
+    assert loader.runtimes[1].closed
+    with pytest.raises(ValueError):
+        registry.promote()
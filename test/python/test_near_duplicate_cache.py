@@ -0,0 +1,91 @@
+import pytest
+
+from nearDuplicateCache import CHUNK_BITS, MAX_DISTANCE, NearDuplicateCache, hamming, hash_chunks
+
+# 32 of 64 bits set, so it carries enough structure to be cached
+HASH = 0x0F0F0F0F0F0F0F0F
+COLOR = (120, 80, 40)
+
+
+def flip(value, *bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+def test_three_bits_apart_in_three_chunks_is_found_through_the_fourth():
+    cache = NearDuplicateCache()
+    cache.put(HASH, 'ramen', COLOR)
+    near = flip(HASH, 0, CHUNK_BITS, 2 * CHUNK_BITS)
+    assert sum(a != b for a, b in zip(hash_chunks(HASH), hash_chunks(near))) == 3
+
+    assert cache.get(near, COLOR) == ('ramen', 3)
+
+
+def test_four_bits_apart_is_not_a_duplicate():
+    cache = NearDuplicateCache()
+    cache.put(HASH, 'ramen', COLOR)
+
+    # One bit in every chunk: no chunk table matches
+    assert cache.get(flip(HASH, 0, CHUNK_BITS, 2 * CHUNK_BITS, 3 * CHUNK_BITS), COLOR) is None
+    # Four bits in one chunk: found through the other chunks but too far
+    assert cache.get(flip(HASH, 0, 1, 2, 3), COLOR) is None
+    assert cache.stats()['misses'] == 2
+
+
+def test_closest_entry_wins():
+    cache = NearDuplicateCache()
+    cache.put(flip(HASH, 0, 1), 'far', COLOR)
+    cache.put(flip(HASH, 0), 'near', COLOR)
+    assert cache.get(HASH, COLOR) == ('near', 1)
+
+
+def test_max_distance_is_limited_by_the_chunk_count():
+    with pytest.raises(ValueError):
+        NearDuplicateCache(max_distance=MAX_DISTANCE + 1)
+    cache = NearDuplicateCache(max_distance=1)
+    cache.put(HASH, 'ramen', COLOR)
+    assert cache.get(flip(HASH, 0, 40), COLOR) is None
+    assert hamming(HASH, flip(HASH, 0, 40)) == 2
+
+
+def test_different_colour_is_not_a_duplicate():
+    cache = NearDuplicateCache(color_tolerance=24)
+    cache.put(HASH, 'ramen', COLOR)
+    assert cache.get(HASH, (120, 80, 60)) == ('ramen', 0)
+    assert cache.get(HASH, (120, 80, 70)) is None
+
+
+def test_flat_images_are_never_cached():
+    cache = NearDuplicateCache()
+    cache.put(0x3, 'miso_soup', COLOR)
+    assert cache.get(0x3, COLOR) is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_evicted_entries_leave_the_chunk_tables():
+    cache = NearDuplicateCache(max_entries=1)
+    cache.put(HASH, 'ramen', COLOR)
+    other = ~HASH & ((1 << 64) - 1)
+    cache.put(other, 'sushi', COLOR)
+
+    assert cache.get(HASH, COLOR) is None
+    assert cache.get(other, COLOR) == ('sushi', 0)
+    assert all(HASH not in {key[0] for members in bucket.values() for key in members}
+               for bucket in cache._buckets)
+
+
+def test_disk_tier_is_shared_within_a_namespace(tmp_path):
+    db_path = str(tmp_path / 'duplicates.db')
+    first = NearDuplicateCache('rules-v1', db_path=db_path)
+    first.put(HASH, 'ramen', COLOR)
+    # Above 2**63, so it only round-trips if the signed SQLite integer is converted back
+    high = ~HASH & ((1 << 64) - 1)
+    first.put(high, 'sushi', COLOR)
+    first.close()
+
+    second = NearDuplicateCache('rules-v1', db_path=db_path)
+    assert second.get(flip(HASH, 5), COLOR) == ('ramen', 1)
+    assert second.get(high, COLOR) == ('sushi', 0)
+    assert second.stats()['disk_hits'] == 2
+    assert NearDuplicateCache('rules-v2', db_path=db_path).get(HASH, COLOR) is None
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from predictionCache import PredictionCache, content_key
+
+
+@pytest.fixture
+def model_file(tmp_path):
+    def write(name, content):
+        path = tmp_path / name
+        path.write_bytes(content)
+        return str(path)
+    return write
+
+
+def put(cache, key, index):
+    return cache.put(key, index, f"class {index}", np.eye(4, dtype=np.float32)[index])
+
+
+def test_memory_tier_evicts_least_recently_used(model_file):
+    cache = PredictionCache(model_file('model.h5', b'weights'), max_entries=2)
+    put(cache, 'a', 0)
+    put(cache, 'b', 1)
+    assert cache.get('a').index == 0  # 'b' is now the oldest
+    put(cache, 'c', 2)
+
+    assert cache.get('b') is None
+    assert cache.get('a').label == 'class 0'
+    assert cache.get('c').label == 'class 2'
+    assert cache.stats()['entries'] == 2
+
+
+def test_memory_tier_is_bounded_by_bytes(model_file):
+    one_entry = put(PredictionCache(model_file('model.h5', b'weights')), 'x', 0).nbytes
+    cache = PredictionCache(model_file('model.h5', b'weights'), max_entries=100, max_bytes=2 * one_entry)
+    for i, key in enumerate('abc'):
+        put(cache, key, i)
+
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] <= 2 * one_entry
+
+
+def test_disk_tier_survives_a_restart(model_file, tmp_path):
+    path = model_file('model.h5', b'weights')
+    db_path = str(tmp_path / 'cache.db')
+    first = PredictionCache(path, db_path=db_path)
+    key = content_key(b'image bytes')
+    put(first, key, 3)
+    first.close()
+
+    second = PredictionCache(path, db_path=db_path)
+    entry = second.get(key)
+    assert entry.index == 3
+    np.testing.assert_array_equal(entry.probabilities, np.eye(4, dtype=np.float32)[3])
+    assert second.stats()['disk_hits'] == 1
+    # Promoted to memory, so the next lookup does not touch SQLite
+    second.get(key)
+    assert second.stats()['hits'] == 1
+
+
+def test_models_sharing_a_database_keep_their_own_rows(model_file, tmp_path):
+    db_path = str(tmp_path / 'cache.db')
+    keras = PredictionCache(model_file('model.h5', b'keras weights'), db_path=db_path)
+    tflite = PredictionCache(model_file('model.tflite', b'tflite weights'), db_path=db_path)
+    put(keras, 'image', 1)
+    put(tflite, 'image', 2)
+    keras.close()
+    tflite.close()
+
+    # Opening each model again must not discard the other's rows
+    keras = PredictionCache(model_file('model.h5', b'keras weights'), db_path=db_path)
+    tflite = PredictionCache(model_file('model.tflite', b'tflite weights'), db_path=db_path)
+    assert keras.get('image').index == 1
+    assert tflite.get('image').index == 2
+
+
+def test_replaced_model_does_not_see_old_entries(model_file, tmp_path):
+    db_path = str(tmp_path / 'cache.db')
+    cache = PredictionCache(model_file('model.h5', b'old weights'), db_path=db_path)
+    put(cache, 'image', 1)
+
+    cache.set_model(model_file('model.h5', b'new weights, different size'))
+    assert cache.get('image') is None
+
+
+def test_put_for_another_model_is_not_stored(model_file):
+    cache = PredictionCache(model_file('model.h5', b'weights'))
+    cache.put('image', 1, 'class 1', np.eye(4)[1], fingerprint='not the current model')
+    assert cache.get('image') is None
@@ -0,0 +1,399 @@
+"""
+Classifier Benchmark Suite
+
+Measures both classifiers on deterministic synthetic images (see
+synthetic_images.py) and writes the results as JSON:
+
+- cold start: interpreter start, library import and model load, each in a
+  fresh process, plus that process's peak RSS
+- per-stage latency percentiles (decode, preprocess, predict, postprocess for
+  the fruit model; colour, texture and the full prediction for the recipe one)
+- throughput at several concurrency levels: pipelined requests against
+  `imageClassification.py --serve`, and parallel one-shot processes for the
+  recipe script, which has no long-running mode
+- peak RSS of the serving process
+
+With --baseline the run is compared metric by metric against a stored result
+and the script exits non-zero when any metric is worse by more than
+--threshold (default 20%).
+
+Usage:
+  python tools/benchmark/benchmark_classifiers.py [--classifier fruit|recipe|all] [--output results.json]
+  python tools/benchmark/benchmark_classifiers.py --save-baseline
+  python tools/benchmark/benchmark_classifiers.py --baseline tools/benchmark/baseline.json [--threshold 0.2]
+"""
+
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.abspath(os.path.join(BENCH_DIR, '..', '..'))
+MODEL_DIR = os.path.join(REPO_ROOT, 'model')
+sys.path.insert(0, MODEL_DIR)
+
+import synthetic_images
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+FRUIT_SCRIPT = os.path.join(MODEL_DIR, 'imageClassification.py')
+RECIPE_SCRIPT = os.path.join(MODEL_DIR, 'recipeImageClassification.py')
+
+
+def percentiles(seconds):
+    values = np.asarray(seconds, dtype=np.float64) * 1000.0
+    return {
+        'n': int(values.size),
+        'mean_ms': float(values.mean()),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p90_ms': float(np.percentile(values, 90)),
+        'p99_ms': float(np.percentile(values, 99)),
+    }
+
+
+def process_peak_rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb():
+    # VmHWM resets on exec; ru_maxrss on Linux carries over the parent's peak
+    peak = process_peak_rss_mb(os.getpid())
+    if peak is not None:
+        return peak
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+# Runs in a fresh interpreter so nothing is imported before the timer starts
+_STARTUP_PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {model_dir!r})
+if {classifier!r} == 'fruit':
+    import numpy, PIL.Image, tensorflow
+    import_done = time.perf_counter()
+    from modelRuntime import load_runtime
+    load_runtime({model_path!r}, {runtime!r})
+else:
+    import recipeImageClassification
+    import_done = time.perf_counter()
+load_done = time.perf_counter()
+peak = None
+with open('/proc/self/status') as f:
+    for line in f:
+        if line.startswith('VmHWM:'):
+            peak = int(line.split()[1]) / 1024
+print(json.dumps({{'import_s': import_done - start, 'model_load_s': load_done - import_done,
+                  'peak_rss_mb': peak}}))
+"""
+
+
+def measure_cold_start(classifier, model_path, runtime, repeats):
+    walls, imports, loads, peaks = [], [], [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        code = _STARTUP_PROBE.format(model_dir=MODEL_DIR, classifier=classifier,
+                                     model_path=model_path, runtime=runtime)
+        completed = subprocess.run([sys.executable, '-c', code],
+                                   capture_output=True, text=True, cwd=REPO_ROOT, check=True)
+        walls.append(time.perf_counter() - start)
+        probe = json.loads(completed.stdout.strip().splitlines()[-1])
+        imports.append(probe['import_s'])
+        loads.append(probe['model_load_s'])
+        peaks.append(probe['peak_rss_mb'] or 0.0)
+
+    wall, imported, loaded = float(np.median(walls)), float(np.median(imports)), float(np.median(loads))
+    return {
+        'total_s': wall,
+        'interpreter_s': max(0.0, wall - imported - loaded),
+        'import_s': imported,
+        'model_load_s': loaded,
+        'peak_rss_mb': max(peaks),
+    }
+
+
+def bench_fruit_stages(model_path, runtime_name, images, iterations):
+    import imagePreprocessing
+    from imageClassification import calories
+    from modelRuntime import load_runtime
+
+    runtime = load_runtime(model_path, runtime_name)
+    input_buffer = np.empty((1, 224, 224, 3), dtype=np.float32)
+    runtime.predict(input_buffer)
+
+    stages = {'decode': [], 'preprocess': [], 'predict': [], 'postprocess': []}
+    by_image = {}
+    for name, megapixels, fmt, data in images:
+        totals = by_image.setdefault(f"{megapixels:g}mp_{fmt.lower()}", [])
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            image = imagePreprocessing.open_image(data)
+            t1 = time.perf_counter()
+            imagePreprocessing.to_input_array(image, out=input_buffer[0])
+            t2 = time.perf_counter()
+            probabilities = runtime.predict(input_buffer)
+            t3 = time.perf_counter()
+            index = int(probabilities[0].argmax())
+            calories[index]
+            t4 = time.perf_counter()
+
+            stages['decode'].append(t1 - t0)
+            stages['preprocess'].append(t2 - t1)
+            stages['predict'].append(t3 - t2)
+            stages['postprocess'].append(t4 - t3)
+            totals.append(t4 - t0)
+
+    return {
+        'stages': {stage: percentiles(values) for stage, values in stages.items()},
+        'by_image': {key: percentiles(values) for key, values in by_image.items()},
+    }
+
+
+def bench_fruit_throughput(model_path, runtime_name, images, concurrency_levels, requests_per_level):
+    import inferenceProtocol
+
+    server = subprocess.Popen(
+        [sys.executable, FRUIT_SCRIPT, '--serve', '--model', model_path, '--runtime', runtime_name,
+         '--cache-entries', '0'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, cwd=REPO_ROOT)
+
+    payloads = [data for _, _, _, data in images]
+    results = {}
+    next_id = 0
+    try:
+        # Warm up so the first level does not pay for the model load
+        inferenceProtocol.write_request(server.stdin, {'id': next_id, 'op': 'predict'}, payloads[0])
+        inferenceProtocol.read_response(server.stdout)
+
+        for concurrency in concurrency_levels:
+            total = max(requests_per_level, concurrency * 4)
+            sent_at = {}
+            latencies = []
+            start = time.perf_counter()
+            for _ in range(min(concurrency, total)):
+                next_id += 1
+                sent_at[next_id] = time.perf_counter()
+                inferenceProtocol.write_request(server.stdin, {'id': next_id, 'op': 'predict'},
+                                                payloads[next_id % len(payloads)])
+            sent = len(sent_at)
+            while sent_at:
+                response = inferenceProtocol.read_response(server.stdout)
+                latencies.append(time.perf_counter() - sent_at.pop(response['id']))
+                if sent < total:
+                    next_id += 1
+                    sent += 1
+                    sent_at[next_id] = time.perf_counter()
+                    inferenceProtocol.write_request(server.stdin, {'id': next_id, 'op': 'predict'},
+                                                    payloads[next_id % len(payloads)])
+            elapsed = time.perf_counter() - start
+            results[f"c{concurrency}"] = {'images_per_s': total / elapsed, 'latency': percentiles(latencies)}
+
+        results['server_peak_rss_mb'] = process_peak_rss_mb(server.pid)
+    finally:
+        server.stdin.close()
+        server.wait(timeout=60)
+    return results
+
+
+def bench_recipe(work_dir, images, iterations, concurrency_levels, runs_per_level):
+    import recipeImageClassification as recipe
+
+    paths = []
+    for name, megapixels, fmt, data in images:
+        if fmt not in ('JPEG', 'PNG'):
+            continue
+        path = os.path.join(work_dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        paths.append((f"{megapixels:g}mp_{fmt.lower()}", path))
+
+    stages = {'color': [], 'texture': [], 'predict_class': []}
+    by_image = {}
+    for key, path in paths:
+        totals = by_image.setdefault(key, [])
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            recipe.analyze_image_color(path)
+            t1 = time.perf_counter()
+            recipe.analyze_image_texture(path)
+            t2 = time.perf_counter()
+            recipe.predict_class(path)
+            t3 = time.perf_counter()
+            stages['color'].append(t1 - t0)
+            stages['texture'].append(t2 - t1)
+            stages['predict_class'].append(t3 - t2)
+            totals.append(t3 - t2)
+
+    def run_once(path):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, RECIPE_SCRIPT, path], cwd=work_dir,
+                       capture_output=True, check=True)
+        return time.perf_counter() - start
+
+    throughput = {}
+    for concurrency in concurrency_levels:
+        total = max(runs_per_level, concurrency * 2)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(run_once, [paths[i % len(paths)][1] for i in range(total)]))
+        elapsed = time.perf_counter() - start
+        throughput[f"c{concurrency}"] = {'images_per_s': total / elapsed, 'latency': percentiles(latencies)}
+
+    return {
+        'stages': {stage: percentiles(values) for stage, values in stages.items()},
+        'by_image': {key: percentiles(values) for key, values in by_image.items()},
+        'throughput': throughput,
+    }
+
+
+def flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = float(value)
+    return flat
+
+
+# Absolute changes below these are timer noise, whatever the relative change
+NOISE_FLOORS = {'_ms': 0.5, '_s': 0.02, '_mb': 5.0, 'images_per_s': 0.5}
+
+
+def _noise_floor(metric):
+    for suffix, floor in NOISE_FLOORS.items():
+        if metric.endswith(suffix):
+            return floor
+    return 0.0
+
+
+def compare(results, baseline, threshold):
+    """Return (metric, baseline, current, change) for every metric worse than threshold."""
+    current = flatten({k: v for k, v in results.items() if k != 'meta'})
+    regressions = []
+    for metric, before in flatten({k: v for k, v in baseline.items() if k != 'meta'}).items():
+        if metric.endswith('.n') or metric not in current or before <= 0:
+            continue
+        after = current[metric]
+        if abs(after - before) < _noise_floor(metric):
+            continue
+        change = (after - before) / before
+        higher_is_better = metric.endswith('images_per_s')
+        if (higher_is_better and change < -threshold) or (not higher_is_better and change > threshold):
+            regressions.append((metric, before, after, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the image classifiers")
+    parser.add_argument('--classifier', choices=['fruit', 'recipe', 'all'], default='all')
+    parser.add_argument('--model', default=os.path.join('model', 'modeltt.h5'),
+                        help="Fruit model, relative to the repository root")
+    parser.add_argument('--runtime', choices=['keras', 'tflite'], default='keras')
+    parser.add_argument('--resolutions', type=float, nargs='+', default=list(synthetic_images.RESOLUTIONS_MP),
+                        help="Image sizes in megapixels")
+    parser.add_argument('--images-per-size', type=int, default=2)
+    parser.add_argument('--iterations', type=int, default=5, help="Repeats per image for stage latency")
+    parser.add_argument('--cold-starts', type=int, default=3, help="Fresh processes used for cold start")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--requests', type=int, default=40, help="Requests per concurrency level")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="Compare against this stored result")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Allowed relative regression")
+    parser.add_argument('--save-baseline', action='store_true', help=f"Also write results to {DEFAULT_BASELINE}")
+    args = parser.parse_args(argv)
+
+    images = list(synthetic_images.corpus(args.resolutions, per_size=args.images_per_size))
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'runtime': args.runtime,
+            'images': len(images),
+        }
+    }
+
+    if args.classifier in ('fruit', 'all'):
+        print("Benchmarking fruit classifier...")
+        model_path = os.path.join(REPO_ROOT, args.model)
+        fruit_results = {'cold_start': measure_cold_start('fruit', args.model, args.runtime, args.cold_starts)}
+        fruit_results.update(bench_fruit_stages(model_path, args.runtime, images, args.iterations))
+        fruit_results['throughput'] = bench_fruit_throughput(model_path, args.runtime, images,
+                                                             args.concurrency, args.requests)
+        results['fruit'] = fruit_results
+
+    if args.classifier in ('recipe', 'all'):
+        print("Benchmarking recipe classifier...")
+        work_dir = tempfile.mkdtemp(prefix='nutrihelp-bench-')
+        previous_dir = os.getcwd()
+        try:
+            # The recipe script logs and looks for hint files relative to the working directory
+            os.chdir(work_dir)
+            recipe_results = bench_recipe(work_dir, images, args.iterations, args.concurrency, args.requests)
+        finally:
+            os.chdir(previous_dir)
+            shutil.rmtree(work_dir, ignore_errors=True)
+        recipe_results['cold_start'] = measure_cold_start('recipe', args.model, args.runtime, args.cold_starts)
+        results['recipe'] = recipe_results
+
+    results['meta']['benchmark_peak_rss_mb'] = peak_rss_mb()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.save_baseline:
+        shutil.copyfile(args.output, DEFAULT_BASELINE)
+        print(f"Baseline saved to {DEFAULT_BASELINE}")
+
+    for classifier in ('fruit', 'recipe'):
+        if classifier in results:
+            cold = results[classifier]['cold_start']
+            print(f"\n{classifier}: cold start {cold['total_s']:.2f}s "
+                  f"(import {cold['import_s']:.2f}s, model load {cold['model_load_s']:.2f}s), "
+                  f"peak RSS {cold['peak_rss_mb']:.0f} MB")
+            for stage, summary in results[classifier]['stages'].items():
+                print(f"  {stage:14s} p50 {summary['p50_ms']:8.2f} ms  p99 {summary['p99_ms']:8.2f} ms")
+            for level, summary in results[classifier]['throughput'].items():
+                if isinstance(summary, dict):
+                    print(f"  {level:14s} {summary['images_per_s']:8.1f} images/s, "
+                          f"p99 {summary['latency']['p99_ms']:.1f} ms")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold * 100:.0f}%:")
+            for metric, before, after, change in regressions:
+                print(f"  {metric}: {before:.3f} -> {after:.3f} ({change * 100:+.1f}%)")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold * 100:.0f}% against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
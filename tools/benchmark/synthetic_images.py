@@ -0,0 +1,65 @@
+"""
+Deterministic synthetic photos for the classifier benchmarks.
+
+Images are smooth colour gradients with seeded blobs and sensor-like noise, so
+JPEG/PNG sizes and decode costs are in the same range as real phone uploads
+while staying byte-for-byte reproducible between runs and machines.
+"""
+
+import io
+
+import numpy as np
+from PIL import Image
+
+# Megapixel sizes from thumbnails up to current phone cameras (4:3)
+RESOLUTIONS_MP = (0.3, 1.0, 3.0, 12.0)
+FORMATS = ('JPEG', 'PNG')
+
+
+def dimensions(megapixels):
+    height = int(round((megapixels * 1e6 * 3 / 4) ** 0.5))
+    return int(round(height * 4 / 3)), height
+
+
+def generate_array(megapixels, seed=0):
+    """Return a (H, W, 3) uint8 image for the given size and seed."""
+    width, height = dimensions(megapixels)
+    rng = np.random.default_rng(seed)
+
+    y = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None]
+    x = np.linspace(0.0, 1.0, width, dtype=np.float32)[None, :]
+    start, end = rng.random((2, 3), dtype=np.float32) * 200 + 30
+    image = np.empty((height, width, 3), dtype=np.float32)
+    for channel in range(3):
+        image[..., channel] = start[channel] + (end[channel] - start[channel]) * (x + y) / 2
+
+    for _ in range(12):
+        cx, cy = rng.random() * width, rng.random() * height
+        radius = (0.05 + rng.random() * 0.2) * min(width, height)
+        color = rng.random(3, dtype=np.float32) * 255
+        mask = ((x * width - cx) ** 2 + (y * height - cy) ** 2) < radius ** 2
+        image[mask] = color
+
+    image += rng.normal(0.0, 6.0, image.shape).astype(np.float32)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def generate(megapixels, fmt='JPEG', seed=0):
+    """Return encoded image bytes for the given size, format and seed."""
+    buffer = io.BytesIO()
+    image = Image.fromarray(generate_array(megapixels, seed))
+    if fmt == 'JPEG':
+        image.save(buffer, format='JPEG', quality=90)
+    else:
+        image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def corpus(resolutions=RESOLUTIONS_MP, formats=FORMATS, per_size=3):
+    """Yield (name, megapixels, format, bytes) for the standard benchmark set."""
+    for megapixels in resolutions:
+        for fmt in formats:
+            for seed in range(per_size):
+                extension = 'jpg' if fmt == 'JPEG' else fmt.lower()
+                name = f"bench_{megapixels:g}mp_{seed}.{extension}"
+                yield name, megapixels, fmt, generate(megapixels, fmt, seed)
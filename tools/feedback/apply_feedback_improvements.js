@@ -7,19 +7,26 @@
  * Usage: node tools/feedback/apply_feedback_improvements.js [min_count]
  * 
  * - min_count: Minimum number of occurrences to consider a pattern significant (default: 3)
+ *
+ * Keyword updates are replayed against the feedback first (tools/feedback/replay_feedback.py)
+ * and only written when they improve accuracy.
  */
 
 require('dotenv').config();
 const fs = require('fs');
+const os = require('os');
 const path = require('path');
-const { execSync } = require('child_process');
+const { execSync, execFileSync } = require('child_process');
 const { createClient } = require('@supabase/supabase-js');
+const { readKeywords, writeKeywords } = require('../image_classification/keywordStore');
 
 // Configuration
 const MIN_FEEDBACK_COUNT = parseInt(process.argv[2]) || 3; // Minimum feedback count to trigger an update
 const UPDATE_KEYWORDS = true; // Whether to update keywords
 const UPDATE_MAPPINGS = true; // Whether to update food mappings
-const UPDATE_TEXTURES = true; // Whether to update texture analysis rules
+const REPLAY_GATE = true; // Only apply keyword updates that improve accuracy on replayed feedback
+const PYTHON_PATH = process.env.PYTHON_PATH || 'python';
+const REPLAY_SCRIPT = path.join(__dirname, 'replay_feedback.py');
 
 // Create Supabase client
 const supabase = createClient(process.env.SUPABASE_URL, process.env.SUPABASE_ANON_KEY);
@@ -103,6 +110,7 @@ async function analyzeFeedbackData() {
     });
     
     return {
+      feedbackData,
       totalFeedback: feedbackData.length,
       errorPatterns: significantPatterns,
       classCounts: correctClassCounts,
@@ -141,11 +149,45 @@ function applyMappingUpdates(errorPatterns) {
   });
 }
 
+/**
+ * Replay the feedback with candidate keyword tables and compare against the current ones
+ * @param {Object} candidateKeywords Keyword tables in the model/recipeKeywords.json layout
+ * @param {Array} feedbackData Feedback records, including their image_data
+ * @returns {boolean} Whether the candidate is more accurate
+ */
+function candidateImprovesAccuracy(candidateKeywords, feedbackData) {
+  const tmpDir = fs.mkdtempSync(path.join(os.tmpdir(), 'nutrihelp-replay-'));
+  const feedbackFile = path.join(tmpDir, 'feedback.json');
+  const candidateFile = path.join(tmpDir, 'candidate.json');
+  
+  try {
+    fs.writeFileSync(feedbackFile, JSON.stringify(feedbackData));
+    fs.writeFileSync(candidateFile, JSON.stringify(candidateKeywords, null, 2));
+    
+    console.log('Replaying feedback to measure the keyword updates...');
+    const output = execFileSync(
+      PYTHON_PATH,
+      [REPLAY_SCRIPT, feedbackFile, '--candidate', candidateFile, '--require-improvement', '--top', '5'],
+      { encoding: 'utf8' }
+    );
+    console.log(output);
+    return true;
+  } catch (error) {
+    // Exit status 1 means the replay ran and the candidate was not better
+    if (error.stdout) console.log(error.stdout);
+    if (error.status !== 1) console.error('Error replaying feedback:', error.message);
+    return false;
+  } finally {
+    fs.rmSync(tmpDir, { recursive: true, force: true });
+  }
+}
+
 /**
  * Apply keyword updates based on analysis
  * @param {Object} keywordSuggestions Keyword suggestions for each class
+ * @param {Array} feedbackData Feedback records used to measure the updates
  */
-function applyKeywordUpdates(keywordSuggestions) {
+function applyKeywordUpdates(keywordSuggestions, feedbackData) {
   if (!UPDATE_KEYWORDS) return;
   
   console.log('\nApplying keyword updates...');
@@ -172,49 +214,26 @@ function applyKeywordUpdates(keywordSuggestions) {
     console.log(`- "${keyword}" → "${className}"`);
   });
   
-  // Path to Python classification file
-  const pythonFile = path.join(__dirname, '../../model/recipeImageClassification.py');
-  
   try {
-    // Read Python file
-    const content = fs.readFileSync(pythonFile, 'utf8');
-    
-    // Find DISH_OVERRIDES dictionary
-    const dictRegex = /DISH_OVERRIDES = \{[^}]*\}/s;
-    const dictMatch = content.match(dictRegex);
-    
-    if (!dictMatch) {
-      console.error('Could not find DISH_OVERRIDES dictionary in Python file');
-      return;
-    }
-    
-    // Extract current dictionary content
-    let dictContent = dictMatch[0];
-    
-    // Add new keywords at the end of the dictionary
-    const insertPoint = dictContent.lastIndexOf('}');
-    let newDictContent = dictContent.substring(0, insertPoint);
+    const keywords = readKeywords();
     
     // Check if keywords already exist
     let addedCount = 0;
     
     for (const [keyword, className] of Object.entries(newKeywords)) {
-      if (!content.includes(`"${keyword}": `)) {
-        newDictContent += `    "${keyword}": "${className}",\n`;
+      if (!(keyword in keywords.dish_overrides) && !(keyword in keywords.custom_food_types)) {
+        keywords.dish_overrides[keyword] = className;
         addedCount++;
       }
     }
     
-    // Close dictionary
-    newDictContent += '}';
-    
     // Only update if new keywords were added
     if (addedCount > 0) {
-      // Replace original dictionary in file
-      const newContent = content.replace(dictRegex, newDictContent);
-      
-      // Write back to file
-      fs.writeFileSync(pythonFile, newContent);
+      if (REPLAY_GATE && !candidateImprovesAccuracy(keywords, feedbackData)) {
+        console.log('Keyword updates rejected: they do not improve accuracy on the collected feedback.');
+        return;
+      }
+      writeKeywords(keywords);
       console.log(`Successfully added ${addedCount} new keyword mappings!`);
     } else {
       console.log('No new keywords were added (all already exist).');
@@ -224,61 +243,6 @@ function applyKeywordUpdates(keywordSuggestions) {
   }
 }
 
-/**
- * Apply texture/color analysis updates based on analysis
- * @param {Array} errorPatterns Significant error patterns
- */
-function applyTextureUpdates(errorPatterns) {
-  if (!UPDATE_TEXTURES) return;
-  
-  console.log('\nApplying texture/color analysis updates...');
-  
-  // Path to Python classification file
-  const pythonFile = path.join(__dirname, '../../model/recipeImageClassification.py');
-  
-  try {
-    // Read Python file
-    const content = fs.readFileSync(pythonFile, 'utf8');
-    
-    let updatedContent = content;
-    let updateCount = 0;
-    
-    // Look for error patterns that could be texture/color related
-    errorPatterns.forEach(([pattern, count]) => {
-      const [_, correctClass] = pattern.split('_to_');
-      
-      // Look for white+complex texture classification section
-      if (correctClass === 'sushi') {
-        const textureSection = /# Add white\+complex texture classification[\s\S]*?prediction = '[^']+'/;
-        const textureMatch = content.match(textureSection);
-        
-        if (textureMatch) {
-          const updatedSection = textureMatch[0].replace(
-            /prediction = '[^']+'/,
-            `prediction = 'sushi'`
-          );
-          
-          updatedContent = updatedContent.replace(textureMatch[0], updatedSection);
-          updateCount++;
-        }
-      }
-      
-      // Update color_to_food or food_categories as needed for other classes
-      // This would need to be customized based on the specific needs
-    });
-    
-    // Only update if changes were made
-    if (updateCount > 0) {
-      fs.writeFileSync(pythonFile, updatedContent);
-      console.log(`Updated ${updateCount} texture/color analysis rules.`);
-    } else {
-      console.log('No texture/color analysis rules needed updating.');
-    }
-  } catch (error) {
-    console.error('Error updating texture/color analysis:', error);
-  }
-}
-
 /**
  * Main function to orchestrate the optimization process
  */
@@ -298,8 +262,7 @@ async function optimizeFromFeedback() {
   
   // Apply updates based on analysis
   applyMappingUpdates(analysis.errorPatterns);
-  applyKeywordUpdates(analysis.keywordSuggestions);
-  applyTextureUpdates(analysis.errorPatterns);
+  applyKeywordUpdates(analysis.keywordSuggestions, analysis.feedbackData);
   
   console.log('\nOptimization complete! The system has been updated based on user feedback.');
   console.log('Run a test to see the improvements:');
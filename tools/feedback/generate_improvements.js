@@ -6,6 +6,7 @@
 
 const fs = require('fs');
 const path = require('path');
+const { readKeywords } = require('../image_classification/keywordStore');
 
 // Configuration
 const FEEDBACK_DIR = path.join(__dirname, '../../feedback_data');
@@ -75,15 +76,16 @@ console.log('===============================\n');
 console.log('1. Keyword Matching Suggestions:');
 console.log('------------------');
 
-// Check if there are keywords that need to be added to DISH_OVERRIDES
+// Check if there are keywords that need to be added to the dish_overrides table
+const knownKeywords = readKeywords();
 const suggestedKeywords = {};
 sortedClasses.forEach(className => {
   // Generate possible keywords for each class
   const keywords = generateKeywordsForClass(className);
   
   keywords.forEach(keyword => {
-    // Check if keyword already exists in Python script
-    if (!pythonContent.includes(`"${keyword}": `)) {
+    // Check if keyword already exists in model/recipeKeywords.json
+    if (!(keyword in knownKeywords.dish_overrides) && !(keyword in knownKeywords.custom_food_types)) {
       // Determine which existing class this should map to
       const mappedClass = mapToExistingClass(className);
       suggestedKeywords[keyword] = mappedClass;
@@ -121,14 +123,11 @@ sortedClasses.forEach(className => {
 if (customClasses.length > 0) {
   console.log('The following classes are not in the original model, consider adding to custom_food_types:');
   
-  let code = '// In the Python script, find the custom_food_types dictionary and add the following:\n';
-  code += 'custom_food_types = {\n';
+  let code = '# Add them to model/recipeKeywords.json with:\n';
   customClasses.forEach(className => {
     const mappedClass = mapToExistingClass(className);
-    code += `    '${className}': '${mappedClass}',  // Map ${className} to ${mappedClass}\n`;
+    code += `node tools/image_classification/update_food_mapping.js ${className} ${mappedClass}\n`;
   });
-  code += '    // Keep existing entries\n';
-  code += '}\n';
   
   console.log(code);
 }
@@ -0,0 +1,239 @@
+"""
+Feedback Replay
+
+Replays collected classification feedback through the recipe classifier twice,
+once with the current rule tables and once with a candidate, and reports the
+accuracy, the confusions and the wall time of each. Automated rule changes
+(tools/feedback/apply_feedback_improvements.js) run it with
+--require-improvement so they are only applied when they measurably help.
+
+Feedback is a JSON or CSV export of the image_classification_feedback table:
+each record needs correct_class and either image_data (base64), image_path
+(relative to the export) or a filename found under --images-dir.
+
+A rule table file has the layout of model/recipeKeywords.json and may also
+replace color_to_food and food_categories. The classifier seeds its random
+rule fallbacks with each image's perceptual hash, so they pick the same dish
+under both tables and only real rule changes show up.
+
+Usage: python tools/feedback/replay_feedback.py <feedback.json|csv> --candidate <tables.json> [--workers N] [--require-improvement]
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import base64
+import argparse
+from collections import Counter, defaultdict
+from multiprocessing import Pool
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'model')
+sys.path.insert(0, MODEL_DIR)
+
+DEFAULT_TABLES = os.path.join(MODEL_DIR, 'recipeKeywords.json')
+
+# Per-worker state, set up once by _init_worker
+_recipe = None
+_tables = None
+_options = None
+
+
+def load_feedback(path, images_dir=None):
+    """(records, skipped) from a JSON or CSV export; records are (filename, correct_class, image bytes)."""
+    if path.lower().endswith('.csv'):
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            rows = json.load(f)
+        if isinstance(rows, dict):
+            rows = rows.get('data') or rows.get('feedback') or []
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    records = []
+    skipped = 0
+    for row in rows:
+        correct_class = (row.get('correct_class') or '').strip().lower()
+        filename = row.get('filename') or os.path.basename(row.get('image_path') or '')
+        data = None
+        try:
+            if row.get('image_data'):
+                data = base64.b64decode(row['image_data'])
+            else:
+                candidates = []
+                if row.get('image_path'):
+                    candidates.append(os.path.join(base_dir, row['image_path']))
+                if images_dir and filename:
+                    candidates.append(os.path.join(images_dir, filename))
+                for candidate in candidates:
+                    if os.path.exists(candidate):
+                        with open(candidate, 'rb') as f:
+                            data = f.read()
+                        break
+        except (ValueError, OSError):
+            data = None
+        if not correct_class or not data:
+            skipped += 1
+            continue
+        records.append((filename, correct_class, data))
+    return records, skipped
+
+
+def _load_tables(path):
+    """Keyword matcher and colour tables for one rule table file."""
+    from keywordMatcher import KeywordTable
+
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    # Tables do not change during a replay, so never re-stat the file
+    keywords = KeywordTable(path, ['custom_food_types', 'dish_overrides'], check_interval=float('inf'))
+    return {
+        'filename_keywords': keywords,
+        'color_to_food': data.get('color_to_food', _recipe.color_to_food),
+        'food_categories': data.get('food_categories', _recipe.food_categories),
+    }
+
+
+def _init_worker(table_paths, options):
+    global _recipe, _tables, _options
+    import recipeImageClassification
+    _recipe = recipeImageClassification
+    # Loaded before any table is swapped in, so files without colour tables get the module defaults
+    _tables = [_load_tables(path) for path in table_paths]
+    _options = dict(options)
+    _options['feature_store'] = _recipe.open_feature_store(options.get('feature_store'))
+
+
+def _replay_chunk(chunk):
+    """Predictions for each (index, filename, image bytes) under every table, in table order."""
+    results = []
+    for index, filename, data in chunk:
+        context = _recipe.ImageContext(data)
+        predictions = []
+        for tables in _tables:
+            for name, value in tables.items():
+                setattr(_recipe, name, value)
+            try:
+                prediction = _recipe.predict_class(context, filename, _options['confidence_threshold'],
+                                                   _options['feature_store'])
+            except (Exception, SystemExit):
+                # predict_class exits on unreadable images; count them as errors instead
+                prediction = None
+            predictions.append(prediction)
+        results.append((index, predictions))
+    return results
+
+
+def replay(records, table_paths, workers=None, confidence_threshold=None, feature_store=None, chunk_size=16):
+    """Predictions per table (lists aligned with records) and the wall time of the replay."""
+    options = {'confidence_threshold': confidence_threshold, 'feature_store': feature_store}
+    tasks = [(i, filename, data) for i, (filename, _, data) in enumerate(records)]
+    chunks = [tasks[start:start + chunk_size] for start in range(0, len(tasks), chunk_size)]
+    predictions = [[None] * len(records) for _ in table_paths]
+
+    def collect(results):
+        for chunk_results in results:
+            for index, row in chunk_results:
+                for table, prediction in enumerate(row):
+                    predictions[table][index] = prediction
+
+    start = time.perf_counter()
+    if workers == 1:
+        _init_worker(table_paths, options)
+        collect(map(_replay_chunk, chunks))
+    else:
+        with Pool(workers, initializer=_init_worker, initargs=(table_paths, options)) as pool:
+            collect(pool.imap_unordered(_replay_chunk, chunks))
+    return predictions, time.perf_counter() - start
+
+
+def score(truth, predictions):
+    """Accuracy, per-class recall and confusion counts for one table's predictions."""
+    confusion = defaultdict(Counter)
+    for correct_class, prediction in zip(truth, predictions):
+        confusion[correct_class][prediction or 'error'] += 1
+    correct = sum(counts[label] for label, counts in confusion.items())
+    per_class = {label: {'support': sum(counts.values()), 'correct': counts[label]}
+                 for label, counts in confusion.items()}
+    return {
+        'accuracy': correct / len(truth) if truth else 0.0,
+        'correct': correct,
+        'total': len(truth),
+        'per_class': per_class,
+        'confusion': {label: dict(counts) for label, counts in confusion.items()},
+    }
+
+
+def print_report(current, candidate, wall_time, records, top):
+    print(f"\nReplayed {len(records)} feedback images in {wall_time:.2f}s "
+          f"({len(records) / wall_time if wall_time else 0:.0f} images/s per table pair)")
+    print(f"  current:   {current['accuracy']:.2%} ({current['correct']}/{current['total']})")
+    print(f"  candidate: {candidate['accuracy']:.2%} ({candidate['correct']}/{candidate['total']})")
+    print(f"  change:    {candidate['accuracy'] - current['accuracy']:+.2%}")
+
+    print(f"\n{'class':<26}{'support':>8}{'current':>10}{'candidate':>11}")
+    for label in sorted(current['per_class'], key=lambda l: -current['per_class'][l]['support']):
+        before = current['per_class'][label]
+        after = candidate['per_class'][label]
+        print(f"{label:<26}{before['support']:>8}{before['correct'] / before['support']:>10.0%}"
+              f"{after['correct'] / after['support']:>11.0%}")
+
+    confusions = Counter({(label, predicted): count
+                          for label, counts in candidate['confusion'].items()
+                          for predicted, count in counts.items() if predicted != label})
+    if confusions:
+        print("\nMost common candidate confusions:")
+        for (label, predicted), count in confusions.most_common(top):
+            print(f"  {label} -> {predicted}: {count}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a candidate rule table against collected feedback")
+    parser.add_argument('feedback', help="JSON or CSV export of the image_classification_feedback table")
+    parser.add_argument('--candidate', required=True, help="Candidate rule table (recipeKeywords.json layout)")
+    parser.add_argument('--current', default=DEFAULT_TABLES, help="Current rule table (default: model/recipeKeywords.json)")
+    parser.add_argument('--images-dir', help="Directory to find images for records that only have a filename")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Replay processes")
+    parser.add_argument('--cascade', action='store_true', help="Replay with the model cascade enabled")
+    parser.add_argument('--confidence-threshold', type=float, default=float(os.environ.get('NUTRIHELP_RECIPE_CONFIDENCE', 0.2)),
+                        help="Cascade threshold (with --cascade; default: NUTRIHELP_RECIPE_CONFIDENCE or 0.2)")
+    parser.add_argument('--feature-store', help="Feature store to reuse, so images are only decoded once across runs")
+    parser.add_argument('--top', type=int, default=10, help="Confusions to list")
+    parser.add_argument('--output', help="Write the full report as JSON to this file")
+    parser.add_argument('--require-improvement', action='store_true',
+                        help="Exit with status 1 unless the candidate is more accurate than the current tables")
+    args = parser.parse_args(argv)
+
+    for path in (args.feedback, args.candidate, args.current):
+        if not os.path.exists(path):
+            print(f"File not found: {path}")
+            sys.exit(2)
+
+    records, skipped = load_feedback(args.feedback, args.images_dir)
+    print(f"Loaded {len(records)} feedback images from {args.feedback}"
+          + (f" ({skipped} skipped without an image or correct class)" if skipped else ""))
+    if not records:
+        sys.exit(2)
+
+    predictions, wall_time = replay(records, [args.current, args.candidate], args.workers,
+                                    args.confidence_threshold if args.cascade else None, args.feature_store)
+    truth = [correct_class for _, correct_class, _ in records]
+    current = score(truth, predictions[0])
+    candidate = score(truth, predictions[1])
+    print_report(current, candidate, wall_time, records, args.top)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'records': len(records), 'skipped': skipped, 'wall_time_s': wall_time,
+                       'current': current, 'candidate': candidate}, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+    if args.require_improvement and candidate['accuracy'] <= current['accuracy']:
+        print("\nCandidate does not improve accuracy; rejecting it")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
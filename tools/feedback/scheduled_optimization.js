@@ -15,7 +15,7 @@ const path = require('path');
 // Configuration
 const LOG_FILE = path.join(__dirname, '../../logs/optimization_history.log');
 const MIN_FEEDBACK_THRESHOLD = 3; // Minimum feedback count to trigger optimizations
-const BACKUP_BEFORE_UPDATES = true; // Whether to backup Python file before updates
+const BACKUP_BEFORE_UPDATES = true; // Whether to backup the keyword tables before updates
 
 // Ensure log directory exists
 const logDir = path.dirname(LOG_FILE);
@@ -38,12 +38,12 @@ function logMessage(message) {
 }
 
 /**
- * Create backup of Python classification file
+ * Create backup of the classifier's keyword tables
  */
 function backupClassificationFile() {
   if (!BACKUP_BEFORE_UPDATES) return;
   
-  const pythonFile = path.join(__dirname, '../../model/recipeImageClassification.py');
+  const keywordsFile = path.join(__dirname, '../../model/recipeKeywords.json');
   const backupDir = path.join(__dirname, '../../backups');
   
   // Ensure backup directory exists
@@ -53,10 +53,10 @@ function backupClassificationFile() {
   
   // Create backup with timestamp
   const timestamp = new Date().toISOString().replace(/[:.]/g, '-');
-  const backupFile = path.join(backupDir, `recipeImageClassification_${timestamp}.py`);
+  const backupFile = path.join(backupDir, `recipeKeywords_${timestamp}.json`);
   
   try {
-    fs.copyFileSync(pythonFile, backupFile);
+    fs.copyFileSync(keywordsFile, backupFile);
     logMessage(`Created backup: ${backupFile}`);
     return true;
   } catch (error) {
@@ -72,7 +72,7 @@ function runOptimization() {
   try {
     logMessage('Starting scheduled optimization...');
     
-    // Backup classification file
+    // Backup keyword tables
     backupClassificationFile();
     
     // Run feedback analysis first to see if optimization is needed
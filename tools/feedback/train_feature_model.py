@@ -0,0 +1,132 @@
+"""
+Feature Model Training
+
+Fits the recipe classifier's feature model (model/recipeFeatureModel.py) from
+collected classification feedback: each labelled image is reduced to its
+colour shares, mean colour and gradient statistics, and a multinomial logistic
+regression or nearest-centroid classifier is fitted to the corrected classes.
+
+A held-out share of the feedback is scored with the new model, the
+colour/texture rules it replaces and a uniform random pick before the model is
+refitted on all of it and saved as a small .npz. recipeImageClassification.py
+picks it up from prediction_models/recipe_feature_model.npz (or
+NUTRIHELP_FEATURE_MODEL) in place of the rules.
+
+Feedback is a JSON or CSV export of the image_classification_feedback table,
+as for replay_feedback.py.
+
+Usage: python tools/feedback/train_feature_model.py <feedback.json|csv> [--kind logistic|centroid] [--output model.npz] [--require-improvement]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'model')
+sys.path.insert(0, MODEL_DIR)
+
+from replay_feedback import load_feedback
+
+FEATURE_CHUNK_SIZE = 256
+
+
+def feedback_features(records, feature_store=None):
+    """Feature rows, labels and filenames of the records whose image could be decoded."""
+    import recipeImageClassification as recipe
+    from imagePreprocessing import ImageContext
+
+    matrices, records_kept = [], []
+    for start in range(0, len(records), FEATURE_CHUNK_SIZE):
+        chunk = records[start:start + FEATURE_CHUNK_SIZE]
+        features, valid = recipe.image_features([ImageContext(data) for _, _, data in chunk], feature_store)
+        matrices.append(recipe.feature_matrix(features[valid]))
+        records_kept.extend((filename, label, record) for (filename, label, _), record, decoded
+                            in zip(chunk, features, valid) if decoded)
+    matrix = np.concatenate(matrices) if matrices else np.zeros((0, len(recipe.FEATURE_MODEL_INPUTS)), np.float32)
+    return matrix, records_kept
+
+
+def rule_accuracy(records):
+    """Accuracy of the colour/texture rules on (filename, label, feature record) triples."""
+    import recipeImageClassification as recipe
+
+    correct = 0
+    for _, label, record in records:
+        shares = record['color_shares'].astype(np.float64)
+        dominant = int(shares.argmax())
+        texture = str(recipe.texture_names(np.array([record['gradient_mean']], dtype=np.float64))[0])
+        prediction, _ = recipe.rule_prediction(recipe.COLOR_ORDER[dominant], texture, '', float(shares[dominant]),
+                                               seed=int(record['dhash']))
+        correct += prediction == label
+    return correct / len(records) if records else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the recipe feature model from collected feedback")
+    parser.add_argument('feedback', help="JSON or CSV export of the image_classification_feedback table")
+    parser.add_argument('--images-dir', help="Directory to find images for records that only have a filename")
+    parser.add_argument('--kind', choices=['logistic', 'centroid'], default='logistic', help="Model to fit")
+    parser.add_argument('--holdout', type=float, default=0.2, help="Share of the feedback held out for scoring")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the holdout split")
+    parser.add_argument('--l2', type=float, default=1e-3, help="L2 penalty (logistic)")
+    parser.add_argument('--iterations', type=int, default=500, help="Gradient descent steps (logistic)")
+    parser.add_argument('--feature-store', help="Feature store to reuse, so images are only decoded once across runs")
+    parser.add_argument('--output', help="Model file to write (default: the classifier's feature model path)")
+    parser.add_argument('--require-improvement', action='store_true',
+                        help="Exit with status 1, without saving, unless the model beats the rules on the holdout")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.feedback):
+        print(f"File not found: {args.feedback}")
+        sys.exit(2)
+
+    # Score and save against the rules, never against a feature model that is already installed
+    os.environ['NUTRIHELP_FEATURE_MODEL'] = ''
+    import recipeImageClassification as recipe
+    from recipeFeatureModel import fit
+
+    records, skipped = load_feedback(args.feedback, args.images_dir)
+    start = time.perf_counter()
+    features, examples = feedback_features(records, recipe.open_feature_store(args.feature_store))
+    print(f"Extracted features of {len(examples)} feedback images in {time.perf_counter() - start:.2f}s"
+          + (f" ({skipped + len(records) - len(examples)} skipped)" if skipped or len(examples) < len(records) else ""))
+    if len(examples) < 2:
+        print("Not enough labelled images to train on")
+        sys.exit(2)
+
+    labels = np.array([label for _, label, _ in examples])
+    options = {'l2': args.l2, 'iterations': args.iterations} if args.kind == 'logistic' else {}
+    order = np.random.default_rng(args.seed).permutation(len(examples))
+    held_out = order[:int(len(examples) * args.holdout)]
+    training = order[len(held_out):]
+
+    if len(held_out):
+        model = fit(features[training], labels[training], recipe.FEATURE_MODEL_INPUTS, recipe.FEATURE_VERSION,
+                    args.kind, **options)
+        start = time.perf_counter()
+        predicted, _ = model.predict(features[held_out])
+        per_image = (time.perf_counter() - start) / len(held_out)
+        model_accuracy = float(np.mean(predicted == labels[held_out]))
+        rules = rule_accuracy([examples[i] for i in held_out])
+        print(f"\nHoldout of {len(held_out)} images ({len(model.classes)} classes):")
+        print(f"  {args.kind} model:        {model_accuracy:.2%} ({per_image * 1e6:.2f} µs per image)")
+        print(f"  colour/texture rules:  {rules:.2%}")
+        print(f"  uniform random pick:   {1 / len(model.classes):.2%}")
+        if args.require_improvement and model_accuracy <= rules:
+            print("\nFeature model does not beat the rules; not saving it")
+            sys.exit(1)
+
+    model = fit(features, labels, recipe.FEATURE_MODEL_INPUTS, recipe.FEATURE_VERSION, args.kind, **options)
+    output = args.output or os.path.join(recipe.PREDICTION_MODELS_DIR, 'recipe_feature_model.npz')
+    # Written beside the target and renamed, so a classifier starting up never loads half a file
+    tmp_path = f"{output}.{os.getpid()}.tmp"
+    model.save(tmp_path)
+    os.replace(tmp_path, output)
+    print(f"\nSaved {args.kind} model over {len(examples)} images to {output} ({os.path.getsize(output)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -178,6 +178,8 @@ try {
   console.log(`   node tools/test/test_image_classification.js ./uploads/${CLASS_NAME}.jpg`);
   console.log('2. Update keyword mappings:');
   console.log(`   node tools/image_classification/update_food_mapping.js ${CLASS_NAME} ${CLASS_NAME}`);
+  console.log('3. Add a few example photos so the model recognises the new class without retraining:');
+  console.log(`   python tools/image_classification/add_examples.py ${CLASS_NAME} <image> [<image> ...]`);
   
 } catch (err) {
   console.error('Error adding class:', err);
@@ -0,0 +1,113 @@
+"""
+Add Example Images to the Recipe Embedding Index
+
+Embeds a few example photos of a dish with the recipe cascade model's
+penultimate layer and appends them to the embedding index
+(prediction_models/recipe_embeddings.npz), so the classifier's k-NN vote
+recognises the dish from then on without retraining the model. The dish does
+not need to be one of the model's output classes.
+
+With --ivfpq the index is switched to (or retrained in) inverted-file,
+product-quantized search, for galleries too large to scan in full.
+
+Usage:
+  python tools/image_classification/add_examples.py <class_name> <image> [<image> ...] [--index FILE] [--model FILE]
+  python tools/image_classification/add_examples.py --ivfpq LISTS [--subvectors M] [--index FILE]
+  python tools/image_classification/add_examples.py --remove <class_name> [--index FILE]
+"""
+
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'model'))
+import recipeImageClassification as recipe
+from embeddingIndex import EmbeddingIndex, model_digest
+
+
+def load_index(path, digest, dimension=None):
+    """The index at path, or a new empty one for the model with this digest."""
+    if not os.path.exists(path):
+        return EmbeddingIndex(dimension, digest) if dimension else None
+    index = EmbeddingIndex.load(path)
+    if index.model != digest:
+        print(f"{path} was built with a different model; move it aside to start a new index")
+        sys.exit(1)
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Add example images of a dish to the recipe embedding index")
+    parser.add_argument('class_name', nargs='?', help="Dish the examples show, e.g. pad_thai")
+    parser.add_argument('images', nargs='*', help="Example images of the dish")
+    parser.add_argument('--index', default=recipe.EMBEDDING_INDEX_PATH, help="Embedding index file")
+    parser.add_argument('--model', default=recipe.CASCADE_MODEL_PATH, help="Keras cascade model (.hdf5)")
+    parser.add_argument('--remove', metavar='CLASS', help="Remove every example of a dish instead of adding")
+    parser.add_argument('--ivfpq', type=int, metavar='LISTS',
+                        help="Retrain the index for inverted-file, product-quantized search with this many lists")
+    parser.add_argument('--subvectors', type=int, default=8, help="Product quantizer subvectors (with --ivfpq)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.model):
+        print(f"Model not found: {args.model}")
+        sys.exit(1)
+    digest = model_digest(args.model)
+
+    if args.remove:
+        index = load_index(args.index, digest)
+        if index is None or args.remove not in index.classes:
+            print(f"No examples of '{args.remove}' in {args.index}")
+            sys.exit(1)
+        keep = index.labels != args.remove
+        rebuilt = EmbeddingIndex(index.dimension, digest)
+        rebuilt.add(index.vectors[keep], index.labels[keep])
+        if index.mode == 'ivfpq' and len(rebuilt):
+            rebuilt.train_ivfpq(len(index.list_centroids), len(index.codebooks))
+        rebuilt.save(args.index)
+        print(f"Removed {int((~keep).sum())} examples of '{args.remove}'; {len(rebuilt)} remain")
+        return
+
+    if args.class_name:
+        if not args.images:
+            print("Give at least one example image of the dish")
+            sys.exit(1)
+        from modelRuntime import load_runtime
+
+        runtime = load_runtime(args.model, 'keras')
+        batch, valid = recipe.model_input_batch(args.images)
+        for path, decoded in zip(args.images, valid):
+            if not decoded:
+                print(f"Skipping unreadable image: {path}")
+        if not valid.any():
+            sys.exit(1)
+        _, embeddings = runtime.predict_with_embeddings(batch[valid])
+
+        index = load_index(args.index, digest, embeddings.shape[1])
+        start = time.perf_counter()
+        index.add(embeddings, [args.class_name.lower()] * len(embeddings))
+        index.save(args.index)
+        print(f"Added {len(embeddings)} examples of '{args.class_name.lower()}' in "
+              f"{(time.perf_counter() - start) * 1000:.1f} ms; {args.index} now has {len(index)} examples "
+              f"of {len(index.classes)} dishes")
+
+    if args.ivfpq:
+        index = load_index(args.index, digest)
+        if index is None:
+            print(f"No index at {args.index}; add examples first")
+            sys.exit(1)
+        start = time.perf_counter()
+        index.train_ivfpq(args.ivfpq, args.subvectors)
+        index.save(args.index)
+        print(f"Trained {len(index.list_centroids)} lists x {args.subvectors} subvectors over {len(index)} examples "
+              f"in {time.perf_counter() - start:.2f}s")
+
+    if not args.class_name and not args.ivfpq:
+        parser.print_usage()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
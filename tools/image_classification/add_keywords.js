@@ -1,12 +1,11 @@
 /**
  * Add Keywords Matching Tool
  * 
- * Adds new keyword mappings to recipeImageClassification.py file
+ * Adds new keyword mappings to model/recipeKeywords.json (the dish_overrides table)
  * Usage: node tools/image_classification/add_keywords.js
  */
 
-const fs = require('fs');
-const path = require('path');
+const { KEYWORDS_FILE, readKeywords, writeKeywords } = require('./keywordStore');
 
 // Keywords to add, format: "keyword": "match_result"
 // Adding more keyword mappings for sushi and other common Asian foods
@@ -64,57 +63,33 @@ const newKeywords = {
   "ice_cream_jp": "ice_cream"             // Ice cream (Japanese placeholder)
 };
 
-// Read Python file
-const pythonFile = '../../model/recipeImageClassification.py';
-
 try {
-  console.log('Reading Python file...');
-  const content = fs.readFileSync(pythonFile, 'utf8');
+  console.log(`Reading keyword tables from ${KEYWORDS_FILE}...`);
+  const keywords = readKeywords();
+  const dishOverrides = keywords.dish_overrides;
   
-  // Find DISH_OVERRIDES dictionary
-  const dictRegex = /DISH_OVERRIDES = \{[^}]*\}/s;
-  const dictMatch = content.match(dictRegex);
+  // Check if keywords already exist
+  let addedCount = 0;
+  let skippedCount = 0;
   
-  if (dictMatch) {
-    // Extract current dictionary content
-    let dictContent = dictMatch[0];
-    
-    console.log('Found DISH_OVERRIDES dictionary, preparing to add new keywords...');
-    
-    // Add new keywords at the end of the dictionary (after the last item)
-    const insertPoint = dictContent.lastIndexOf('}');
-    let newDictContent = dictContent.substring(0, insertPoint);
-    
-    // Check if keywords already exist
-    let addedCount = 0;
-    let skippedCount = 0;
-    
-    for (const [keyword, result] of Object.entries(newKeywords)) {
-      if (!content.includes(`"${keyword}": `)) {
-        newDictContent += `    "${keyword}": "${result}",\n`;
-        addedCount++;
-      } else {
-        console.log(`Skipping existing keyword: "${keyword}"`);
-        skippedCount++;
-      }
-    }
-    
-    // Close dictionary
-    newDictContent += '}';
-    
-    // Replace original dictionary in file
-    const newContent = content.replace(dictRegex, newDictContent);
-    
-    // Write back to file
-    fs.writeFileSync(pythonFile, newContent);
-    console.log(`Successfully added ${addedCount} new keyword mappings!`);
-    
-    if (skippedCount > 0) {
-      console.log(`Skipped ${skippedCount} existing keywords.`);
+  for (const [keyword, result] of Object.entries(newKeywords)) {
+    if (keyword in dishOverrides || keyword in keywords.custom_food_types) {
+      console.log(`Skipping existing keyword: "${keyword}"`);
+      skippedCount++;
+    } else {
+      dishOverrides[keyword] = result;
+      addedCount++;
     }
-  } else {
-    console.error('Could not find DISH_OVERRIDES dictionary in Python file');
+  }
+  
+  if (addedCount > 0) {
+    writeKeywords(keywords);
+  }
+  console.log(`Successfully added ${addedCount} new keyword mappings!`);
+  
+  if (skippedCount > 0) {
+    console.log(`Skipped ${skippedCount} existing keywords.`);
   }
 } catch (err) {
   console.error('Error occurred:', err);
-} 
\ No newline at end of file
+}
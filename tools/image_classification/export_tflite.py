@@ -0,0 +1,117 @@
+"""
+TFLite Export for the Classification Models
+
+Converts the Keras HDF5 classifiers to .tflite flatbuffers next to the original
+files, then runs a parity check: the Keras and TFLite outputs must agree on the
+argmax for every sample. Samples are seeded random noise and solid colours,
+plus any JPG/PNG files found in --images.
+
+Usage: python tools/image_classification/export_tflite.py [model ...] [--images DIR] [--samples N]
+"""
+
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+
+import sys
+import glob
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'model'))
+from modelRuntime import KerasRuntime, TFLiteRuntime, export_tflite
+
+DEFAULT_MODELS = [
+    os.path.join('model', 'modeltt.h5'),
+    os.path.join('prediction_models', 'best_model_class.hdf5'),
+]
+
+
+def image_samples(image_dir):
+    """Return the JPG/PNG files in image_dir as a float32 (N, 224, 224, 3) batch."""
+    paths = sorted(glob.glob(os.path.join(image_dir, '*.jpg'))
+                   + glob.glob(os.path.join(image_dir, '*.jpeg'))
+                   + glob.glob(os.path.join(image_dir, '*.png')))
+    samples = []
+    for path in paths:
+        try:
+            with Image.open(path) as img:
+                img = img.convert('RGB').resize((224, 224))
+                samples.append(np.asarray(img, dtype=np.float32) / 255.0)
+        except Exception as e:
+            print(f"  Skipping {path}: {e}")
+    return np.stack(samples) if samples else np.zeros((0, 224, 224, 3), dtype=np.float32)
+
+
+def parity_samples(count, image_dir=None, seed=42):
+    """Return a float32 (N, 224, 224, 3) batch of deterministic test inputs."""
+    rng = np.random.default_rng(seed)
+    samples = list(rng.random((count, 224, 224, 3), dtype=np.float32))
+    for color in ([0.8, 0.2, 0.2], [0.2, 0.8, 0.2], [0.9, 0.8, 0.2], [0.6, 0.4, 0.2], [0.9, 0.9, 0.9]):
+        samples.append(np.ones((224, 224, 3), dtype=np.float32) * np.array(color, dtype=np.float32))
+
+    if image_dir:
+        samples.extend(image_samples(image_dir))
+
+    return np.stack(samples)
+
+
+def convert(model_path):
+    return export_tflite(model_path, force=True)
+
+
+def check_parity(model_path, tflite_path, samples):
+    start = time.perf_counter()
+    keras_runtime = KerasRuntime(model_path)
+    keras_load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tflite_runtime = TFLiteRuntime(tflite_path)
+    tflite_load = time.perf_counter() - start
+
+    keras_out = keras_runtime.predict(samples)
+    tflite_out = tflite_runtime.predict(samples)
+    agreement = float(np.mean(keras_out.argmax(axis=1) == tflite_out.argmax(axis=1)))
+
+    print(f"  Size:       {os.path.getsize(model_path) / 1e6:.2f} MB -> {os.path.getsize(tflite_path) / 1e6:.2f} MB")
+    print(f"  Load time:  keras {keras_load * 1000:.1f} ms, tflite {tflite_load * 1000:.1f} ms")
+    print(f"  Max |diff|: {np.abs(keras_out - tflite_out).max():.2e}")
+    print(f"  Argmax agreement: {agreement * 100:.2f}% over {len(samples)} samples")
+    return agreement
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the Keras classifiers to TFLite")
+    parser.add_argument('models', nargs='*', default=DEFAULT_MODELS, help="Keras model files to convert")
+    parser.add_argument('--images', help="Directory of JPG/PNG files to include in the parity check")
+    parser.add_argument('--samples', type=int, default=32, help="Number of random parity samples")
+    args = parser.parse_args(argv)
+
+    samples = parity_samples(args.samples, args.images)
+    failed = False
+
+    for model_path in args.models:
+        if not os.path.exists(model_path):
+            print(f"Skipping {model_path}: file not found")
+            continue
+
+        print(f"Converting {model_path}...")
+        try:
+            tflite_path = convert(model_path)
+        except Exception as e:
+            print(f"  Conversion failed: {e}")
+            failed = True
+            continue
+        print(f"  Saved to {tflite_path}")
+
+        if check_parity(model_path, tflite_path, samples) < 1.0:
+            print("  Parity check FAILED: Keras and TFLite disagree on some predictions")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
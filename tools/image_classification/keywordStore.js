@@ -0,0 +1,28 @@
+/**
+ * Keyword Store
+ *
+ * Reads and writes model/recipeKeywords.json, the filename keyword tables used by
+ * recipeImageClassification.py. The classifier reloads the file when it changes,
+ * so no code edit or restart is needed after an update.
+ */
+
+const fs = require('fs');
+const path = require('path');
+
+const KEYWORDS_FILE = path.join(__dirname, '../../model/recipeKeywords.json');
+
+function readKeywords() {
+  const data = JSON.parse(fs.readFileSync(KEYWORDS_FILE, 'utf8'));
+  data.custom_food_types = data.custom_food_types || {};
+  data.dish_overrides = data.dish_overrides || {};
+  return data;
+}
+
+// Write to a temporary file and rename, so a running classifier never reads a half-written file
+function writeKeywords(data) {
+  const tmpFile = `${KEYWORDS_FILE}.tmp`;
+  fs.writeFileSync(tmpFile, JSON.stringify(data, null, 2) + '\n');
+  fs.renameSync(tmpFile, KEYWORDS_FILE);
+}
+
+module.exports = { KEYWORDS_FILE, readKeywords, writeKeywords };
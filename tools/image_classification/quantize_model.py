@@ -0,0 +1,144 @@
+"""
+Post-training Quantization for the Classification Models
+
+Writes float16 and full-integer int8 TFLite variants of each Keras classifier
+(<model>_float16.tflite, <model>_int8.tflite). The int8 variant is calibrated
+on a directory of local sample images, or on synthetic data when no directory
+is given; variants are compared on --eval-dir the same way. For every variant the tool reports file size, top-1 agreement with
+the fp32 model (the accuracy delta) and single-image latency relative to fp32.
+
+Select a variant at startup with:
+  python model/imageClassification.py --variant int8
+
+Usage: python tools/image_classification/quantize_model.py [model ...] [--calibration-dir DIR] [--variants float16 int8]
+"""
+
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'model'))
+from modelRuntime import KerasRuntime, TFLiteRuntime, tflite_path_for
+
+from export_tflite import DEFAULT_MODELS, convert, image_samples
+
+
+def synthetic_calibration(count, seed=7):
+    """Smooth colour fields with noise; closer to photos than uniform noise."""
+    rng = np.random.default_rng(seed)
+    ramp = np.linspace(0.0, 1.0, 224, dtype=np.float32)
+    samples = []
+    for _ in range(count):
+        base = rng.random(3, dtype=np.float32)
+        tilt = rng.random(3, dtype=np.float32) - 0.5
+        image = base + tilt * ramp[:, None, None]
+        image = image + rng.normal(0.0, 0.05, (224, 224, 3)).astype(np.float32)
+        samples.append(np.clip(image, 0.0, 1.0))
+    return np.stack(samples)
+
+
+def quantize(model_path, variant, calibration):
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(model_path, compile=False)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if variant == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    else:
+        def representative_dataset():
+            for sample in calibration:
+                yield [sample[np.newaxis]]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+
+    output_path = tflite_path_for(model_path, variant)
+    # Written beside the target and renamed, so a runtime starting now never maps half a flatbuffer
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(converter.convert())
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def load_samples(image_dir, count, seed):
+    """The images in image_dir, or count synthetic samples without one; exits if the directory has none."""
+    if not image_dir:
+        return synthetic_calibration(count, seed=seed)
+    samples = image_samples(image_dir)
+    if not len(samples):
+        print(f"No JPG/PNG images found in {image_dir}")
+        sys.exit(1)
+    return samples
+
+
+def single_image_latency(runtime, samples, repeats=20):
+    """Median seconds per single-image call."""
+    runtime.predict(samples[:1])
+    timings = []
+    for i in range(repeats):
+        sample = samples[i % len(samples)][np.newaxis]
+        start = time.perf_counter()
+        runtime.predict(sample)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quantize the Keras classifiers to TFLite variants")
+    parser.add_argument('models', nargs='*', default=DEFAULT_MODELS, help="Keras model files to quantize")
+    parser.add_argument('--variants', nargs='+', choices=['float16', 'int8'], default=['float16', 'int8'])
+    parser.add_argument('--calibration-dir', help="Directory of JPG/PNG files used to calibrate int8")
+    parser.add_argument('--calibration-samples', type=int, default=100,
+                        help="Synthetic calibration samples when no directory is given")
+    parser.add_argument('--eval-dir', help="Directory of JPG/PNG files used to compare variants")
+    parser.add_argument('--eval-samples', type=int, default=64, help="Synthetic evaluation samples when no directory is given")
+    args = parser.parse_args(argv)
+
+    # A given directory is used alone: synthetic frames would skew int8 ranges and agreement
+    calibration = load_samples(args.calibration_dir, args.calibration_samples, seed=7)
+    evaluation = load_samples(args.eval_dir, args.eval_samples, seed=1234)
+    print(f"Calibration samples: {len(calibration)}, evaluation samples: {len(evaluation)}")
+
+    for model_path in args.models:
+        if not os.path.exists(model_path):
+            print(f"Skipping {model_path}: file not found")
+            continue
+
+        print(f"\n{model_path}")
+        reference = KerasRuntime(model_path).predict(evaluation).argmax(axis=1)
+
+        fp32_path = tflite_path_for(model_path)
+        if not os.path.exists(fp32_path):
+            convert(model_path)
+        fp32_latency = single_image_latency(TFLiteRuntime(fp32_path), evaluation)
+        fp32_size = os.path.getsize(fp32_path)
+        print(f"  {'fp32':8s} {fp32_size / 1e6:7.2f} MB  {fp32_latency * 1000:7.2f} ms/image")
+
+        for variant in args.variants:
+            try:
+                variant_path = quantize(model_path, variant, calibration)
+            except Exception as e:
+                print(f"  {variant:8s} conversion failed: {e}")
+                continue
+
+            runtime = TFLiteRuntime(variant_path)
+            agreement = float(np.mean(runtime.predict(evaluation).argmax(axis=1) == reference))
+            latency = single_image_latency(runtime, evaluation)
+            size = os.path.getsize(variant_path)
+            print(f"  {variant:8s} {size / 1e6:7.2f} MB  {latency * 1000:7.2f} ms/image  "
+                  f"size x{fp32_size / size:.1f}  speedup x{fp32_latency / latency:.2f}  "
+                  f"top-1 agreement {agreement * 100:.1f}% (delta {(agreement - 1) * 100:+.1f} pts)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+TensorFlow Threading Tuner
+
+Sweeps intra-op threads, inter-op threads and oneDNN on/off for each expected
+(workers, batch size) load. Every candidate runs as that many concurrent probe
+processes, each with its own model copy, so the measurement includes the
+contention between workers that the Node server causes. The configuration
+with the highest combined throughput is written to model/threading_profile.json
+under this host's key, and model/imageClassification.py applies it at startup.
+
+Usage: python tools/image_classification/tune_threading.py [--workers 1,2] [--batch-sizes 1,8] [--runtime keras]
+"""
+
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+
+import sys
+import json
+import time
+import argparse
+import itertools
+import subprocess
+
+import numpy as np
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'model')
+sys.path.insert(0, MODEL_DIR)
+import threadingProfile
+from modelRuntime import RUNTIMES
+
+DEFAULT_MODEL = os.path.join('model', 'modeltt.h5')
+
+
+def parse_list(value, cast=int):
+    return [cast(item) for item in value.split(',') if item]
+
+
+def parse_switch(value):
+    return {'on': True, 'off': False}[value]
+
+
+def candidates(workers, intra_options=None, inter_options=(1, 2), onednn_options=(True, False)):
+    """Thread pool configurations worth trying for this many concurrent workers."""
+    if not intra_options:
+        cores = max(1, (os.cpu_count() or 1) // workers)
+        intra_options = sorted({1, cores} | {2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores})
+    for intra_op, inter_op, onednn in itertools.product(intra_options, inter_options, onednn_options):
+        yield {'intra_op': intra_op, 'inter_op': inter_op, 'onednn': onednn}
+
+
+def probe(args):
+    """Child process: load the model with one config, wait for the go signal, report images/s."""
+    config = json.loads(args.probe)
+    threadingProfile.apply_env(config)
+
+    from modelRuntime import load_runtime
+
+    runtime = load_runtime(args.model, args.runtime, threading_config=config)
+    batch = np.random.default_rng(0).random((args.batch_size, 224, 224, 3), dtype=np.float32)
+    for _ in range(args.warmup):
+        runtime.predict(batch)
+
+    # Every worker starts timing together so they actually compete for the cores
+    print('READY', flush=True)
+    sys.stdin.readline()
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        call_start = time.perf_counter()
+        runtime.predict(batch)
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        'images_per_second': args.iterations * args.batch_size / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50) * 1000.0),
+    }), flush=True)
+
+
+def measure(args, config, workers, batch_size):
+    command = [sys.executable, os.path.abspath(__file__), '--probe', json.dumps(config),
+               '--model', args.model, '--runtime', args.runtime, '--batch-sizes', str(batch_size),
+               '--iterations', str(args.iterations), '--warmup', str(args.warmup)]
+    processes = [subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                 for _ in range(workers)]
+    try:
+        for process in processes:
+            if process.stdout.readline().strip() != 'READY':
+                raise RuntimeError(f"Probe failed to start (exit code {process.wait()})")
+        for process in processes:
+            process.stdin.write('go\n')
+            process.stdin.flush()
+        reports = [json.loads(process.stdout.readline()) for process in processes]
+    finally:
+        for process in processes:
+            process.stdin.close()
+            process.wait()
+
+    return {
+        'images_per_second': sum(report['images_per_second'] for report in reports),
+        'p50_ms': max(report['p50_ms'] for report in reports),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find the fastest TensorFlow thread settings for this host")
+    parser.add_argument('--model', default=DEFAULT_MODEL, help="Model to benchmark")
+    parser.add_argument('--runtime', choices=RUNTIMES, default='keras')
+    parser.add_argument('--workers', default='1', help="Comma-separated expected numbers of concurrent workers")
+    parser.add_argument('--batch-sizes', default='1,8', help="Comma-separated expected batch sizes")
+    parser.add_argument('--intra', default='', help="Comma-separated intra-op thread counts (default: powers of two up to cores/workers)")
+    parser.add_argument('--inter', default='1,2', help="Comma-separated inter-op thread counts")
+    parser.add_argument('--onednn', default='on,off', help="oneDNN settings to try: on, off or both")
+    parser.add_argument('--iterations', type=int, default=20, help="Timed predictions per probe")
+    parser.add_argument('--warmup', type=int, default=3, help="Untimed predictions per probe")
+    parser.add_argument('--profile', default=threadingProfile.DEFAULT_PROFILE_PATH, help="Profile file to update")
+    parser.add_argument('--dry-run', action='store_true', help="Print the results without writing the profile")
+    parser.add_argument('--probe', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.probe:
+        args.batch_size = parse_list(args.batch_sizes)[0]
+        probe(args)
+        return
+
+    if not os.path.exists(args.model):
+        print(f"Model not found: {args.model}")
+        sys.exit(1)
+
+    profile = threadingProfile.load_profile(args.profile)
+    host = threadingProfile.host_key()
+    print(f"Tuning {args.model} ({args.runtime}) on {host}")
+
+    for workers in parse_list(args.workers):
+        for batch_size in parse_list(args.batch_sizes):
+            print(f"\nWorkers: {workers}, batch size: {batch_size}")
+            best = None
+            for config in candidates(workers, parse_list(args.intra), parse_list(args.inter),
+                                     parse_list(args.onednn, parse_switch)):
+                try:
+                    result = measure(args, config, workers, batch_size)
+                except Exception as e:
+                    print(f"  {config}: failed ({e})")
+                    continue
+                print(f"  intra={config['intra_op']:<3} inter={config['inter_op']:<3} "
+                      f"onednn={'on ' if config['onednn'] else 'off'} "
+                      f"{result['images_per_second']:8.1f} images/s  p50 {result['p50_ms']:.1f} ms")
+                if best is None or result['images_per_second'] > best[1]['images_per_second']:
+                    best = (config, result)
+
+            if best is None:
+                print("  No configuration completed")
+                continue
+            config, result = best
+            print(f"  Best: {config} at {result['images_per_second']:.1f} images/s")
+            threadingProfile.record_config(profile, workers, batch_size,
+                                           dict(config, images_per_second=round(result['images_per_second'], 2)),
+                                           host)
+
+    if args.dry_run:
+        return
+    threadingProfile.save_profile(profile, args.profile)
+    print(f"\nProfile written to {args.profile}")
+
+
+if __name__ == "__main__":
+    main()